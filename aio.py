@@ -0,0 +1,97 @@
+# aio.py — асинхронный ввод-вывод для prod.py и parser.py
+"""
+На сетевых дисках запись result.txt/result.docx/page_N.png и чтение
+результатов OCR надолго блокируют поток, который мог бы считать следующую
+страницу. AsyncIO выносит такие операции в отдельный цикл asyncio (свой
+поток) с пулом потоков для блокирующих вызовов:
+
+  * submit(key, fn, *args) — поставить операцию; вызовы с одним key
+    (обычно путь файла) выполняются строго по порядку, разные key —
+    параллельно, не больше `concurrency` одновременно;
+  * если в полёте уже `max_pending` операций, submit() ждёт — память под
+    неснятые буферы ограничена;
+  * drain() — дождаться всего поставленного; возвращает ошибки [(key, exc)].
+
+Раскладка файлов в data/output/<имя>/ не меняется — меняется только то,
+в каком потоке идёт запись.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncIO:
+    def __init__(self, concurrency=4, max_pending=256):
+        self.concurrency = max(1, int(concurrency))
+        self._loop = asyncio.new_event_loop()
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="io")
+        self._loop.set_default_executor(self._pool)
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-io", daemon=True)
+        self._thread.start()
+        self._sem = asyncio.run_coroutine_threadsafe(self._make_semaphore(), self._loop).result()
+        self._pending = threading.BoundedSemaphore(max(1, int(max_pending)))
+        self._tails = {}          # key -> future последней операции с этим key (внутри цикла)
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self.errors = []
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.concurrency)
+
+    def submit(self, key, fn, *args):
+        """Ставит fn(*args) в очередь key; возвращает concurrent.futures.Future."""
+        self._pending.acquire()
+        fut = asyncio.run_coroutine_threadsafe(self._run(key, fn, args), self._loop)
+        with self._lock:
+            self._inflight.add(fut)
+        fut.add_done_callback(self._done)
+        return fut
+
+    async def _run(self, key, fn, args):
+        # до первого await: корутины стартуют в порядке submit(), поэтому
+        # цепочка по key выстраивается в том же порядке
+        prev = self._tails.get(key)
+        mine = self._loop.create_future()
+        self._tails[key] = mine
+        try:
+            if prev is not None:
+                await prev
+            async with self._sem:
+                return await self._loop.run_in_executor(None, fn, *args)
+        except Exception as e:
+            with self._lock:
+                self.errors.append((key, e))
+            print(f"[IO ERROR] {key}: {e}")
+            raise
+        finally:
+            mine.set_result(None)
+            if self._tails.get(key) is mine:
+                del self._tails[key]
+
+    def _done(self, fut):
+        with self._lock:
+            self._inflight.discard(fut)
+        self._pending.release()
+
+    def drain(self):
+        """Ждёт все поставленные операции; возвращает и очищает список ошибок."""
+        while True:
+            with self._lock:
+                pending = list(self._inflight)
+            if not pending:
+                break
+            for fut in pending:
+                try:
+                    fut.result()
+                except Exception:
+                    pass  # уже в self.errors
+        with self._lock:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def close(self):
+        errors = self.drain()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._pool.shutdown(wait=True)
+        self._loop.close()
+        return errors
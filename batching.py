@@ -0,0 +1,159 @@
+# batching.py — пакетное распознавание строк с нескольких страниц и документов
+"""
+PaddleOCR.predict/ocr обрабатывает страницу целиком: детекция, затем
+распознавание только её строк. На CPU распознавание заметно быстрее большими
+пакетами, поэтому RecBatcher разделяет стадии:
+
+  * add_page(key, image) — сразу делает детекцию и кладёт вырезанные строки
+    в общую очередь;
+  * пакет уходит в распознавание, когда набралось batch_size строк или самая
+    старая строка ждёт дольше max_wait секунд;
+  * результаты раскладываются обратно по страницам в том же порядке строк
+    (sorted_boxes + drop_score), что и у полного вызова, и сразу собираются
+    в ocr_result.PageResult — без промежуточного ответа в формате 2.x.
+
+Работает с движками PaddleOCR 2.x (у которых есть text_detector и
+text_recognizer); для остальных supports_batching() возвращает False.
+"""
+import copy
+import time
+
+import numpy as np
+
+import prod
+import metrics
+from ocr_result import PageResult
+
+def supports_batching(ocr):
+    return all(hasattr(ocr, attr) for attr in ("text_detector", "text_recognizer"))
+
+class _Page:
+    __slots__ = ("key", "boxes", "results", "remaining", "error")
+
+    def __init__(self, key, boxes):
+        self.key = key
+        self.boxes = boxes
+        self.results = [None] * len(boxes)
+        self.remaining = len(boxes)
+        self.error = None
+
+class RecBatcher:
+    """
+    Планировщик пакетного распознавания.
+    Все методы возвращают список готовых страниц (key, pairs, error)
+    в порядке их подачи.
+    """
+    def __init__(self, ocr, batch_size=32, max_wait=None, cls=True):
+        # утилиты из пакета paddleocr: тот же порядок строк и та же вырезка
+        from tools.infer.predict_system import sorted_boxes
+        from tools.infer.utility import get_rotate_crop_image
+        self._sorted_boxes = sorted_boxes
+        self._crop = get_rotate_crop_image
+
+        self.ocr = ocr
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = prod.REC_MAX_WAIT if max_wait is None else max_wait
+        self.use_cls = bool(cls and getattr(ocr, "use_angle_cls", False))
+        # внутренний размер батча распознавателя = размер нашего пакета
+        ocr.text_recognizer.rec_batch_num = self.batch_size
+
+        self._queue = []       # (page, line_idx, crop)
+        self._oldest = None    # время постановки самой старой строки
+        self._pages = []       # страницы в порядке подачи
+        self.stats = {}        # фактический размер пакета -> [пакетов, строк, секунд]
+
+    def add_page(self, key, image):
+        t0 = time.perf_counter()
+        dt_boxes, _ = self.ocr.text_detector(image)
+        boxes = self._sorted_boxes(dt_boxes) if dt_boxes is not None and len(dt_boxes) else []
+        page = _Page(key, boxes)
+        crops = [self._crop(image, copy.deepcopy(box)) for box in boxes]
+        metrics.observe("detect", time.perf_counter() - t0)
+        self._pages.append(page)
+        self._queue.extend((page, i, crop) for i, crop in enumerate(crops))
+        if boxes and self._oldest is None:
+            self._oldest = time.perf_counter()
+        prod._add_stat("calls", 1)
+        prod._add_stat("infer_sec", time.perf_counter() - t0)
+        return self.poll()
+
+    def time_left(self):
+        """Сколько секунд осталось до принудительной отправки неполного пакета."""
+        if self._oldest is None:
+            return None
+        return max(0.0, self._oldest + self.max_wait - time.perf_counter())
+
+    def poll(self):
+        while len(self._queue) >= self.batch_size:
+            self._run(self.batch_size)
+        if self._queue and self.time_left() == 0.0:
+            self._run(len(self._queue))
+        return self._collect()
+
+    def flush(self):
+        while self._queue:
+            self._run(min(self.batch_size, len(self._queue)))
+        return self._collect()
+
+    def _run(self, n):
+        items, self._queue = self._queue[:n], self._queue[n:]
+        self._oldest = time.perf_counter() if self._queue else None
+        crops = [crop for _, _, crop in items]
+        t0 = time.perf_counter()
+        try:
+            if self.use_cls:
+                crops, _, _ = self.ocr.text_classifier(crops)
+            rec_res, _ = self.ocr.text_recognizer(crops)
+        except Exception as e:
+            for page, _, _ in items:
+                page.error = f"OCR упал: {e}"
+                page.remaining -= 1
+            return
+        elapsed = time.perf_counter() - t0
+        prod._add_stat("infer_sec", elapsed)
+        metrics.observe("recognize", elapsed)
+        st = self.stats.setdefault(len(items), [0, 0, 0.0])
+        st[0] += 1
+        st[1] += len(items)
+        st[2] += elapsed
+        for (page, i, _), res in zip(items, rec_res):
+            page.results[i] = res
+            page.remaining -= 1
+
+    def _collect(self):
+        ready = []
+        while self._pages and self._pages[0].remaining == 0:
+            page = self._pages.pop(0)
+            if page.error is not None:
+                ready.append((page.key, None, page.error))
+                continue
+            # тот же отбор строк, что у полного вызова PaddleOCR 2.x
+            drop_score = getattr(self.ocr, "drop_score", 0.0)
+            with metrics.timed("extract_lines"):
+                if page.results:
+                    texts, scores = zip(*page.results)
+                    scores = np.asarray(scores, dtype=np.float64)
+                    keep = np.flatnonzero(scores >= drop_score)
+                    lines = PageResult.from_columns([texts[i] for i in keep], scores[keep],
+                                                    np.asarray(page.boxes, dtype=np.float32)[keep])
+                else:
+                    lines = PageResult.empty()
+            ready.append((page.key, lines, None))
+        return ready
+
+def merge_stats(total, stats):
+    for size, (batches, lines, sec) in stats.items():
+        st = total.setdefault(size, [0, 0, 0.0])
+        st[0] += batches
+        st[1] += lines
+        st[2] += sec
+
+def print_rec_stats(stats):
+    """Пропускная способность распознавания (строк/с) по размерам пакетов."""
+    if not stats:
+        return
+    print("[REC] размер пакета | пакетов | строк | строк/с")
+    for size in sorted(stats):
+        batches, lines, sec = stats[size]
+        rate = lines / sec if sec > 0 else 0.0
+        print(f"[REC] {size:>13} | {batches:>7} | {lines:>5} | {rate:.1f}")
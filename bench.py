@@ -0,0 +1,505 @@
+# bench.py — микробенчмарки разбора и конвейера
+"""
+Запуск:
+    python bench.py parse [--repeat N]   — время разбора одного документа по корпусу data/output:
+                                           пять отдельных extract_* против extract_fields
+    python bench.py scaling              — время extract_fields на синтетических документах
+                                           от 100 до 100k строк (должно расти линейно)
+    python bench.py pipeline [--ocr cached|engine] [--compare old.json]
+                                         — растеризация, OCR и разбор data/scans; время стадий,
+                                           стр/с, пиковый RSS и точность полей против data/exel;
+                                           отчёт в data/bench/*.json
+    python bench.py startup [--repeat N] [--compare old.json]
+                                         — холодный старт: время импорта parser/prod/service
+                                           в новом процессе и какие тяжёлые зависимости он тянет
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import subprocess
+
+# ---------- Корпус ----------
+def load_corpus(base_dir):
+    """(имя папки, текст) для каждой подпапки data/output, где есть результат OCR."""
+    import parser as p
+    corpus = []
+    for name in sorted(os.listdir(base_dir)):
+        folder = os.path.join(base_dir, name)
+        if not os.path.isdir(folder):
+            continue
+        text, _ = p.load_ocr_output(folder)
+        if text:
+            corpus.append((name, text))
+    return corpus
+
+def _time_per_call(fn, arg, repeat):
+    """Медиана времени одного вызова fn(arg) в миллисекундах."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return statistics.median(samples)
+
+# ---------- parse ----------
+def _separate_extract(text):
+    """
+    Пять отдельных extract_*: каждое поле — свой проход по строкам теми же
+    матчерами, что и в extract_fields. Это не старая реализация, а цена
+    отдельных вызовов против одного общего прохода.
+    """
+    import parser as p
+    return (p.extract_contract_number(text), p.extract_dates(text), p.extract_amount_and_currency(text),
+            p.extract_counterparty(text), p.extract_payment_currency(text))
+
+def bench_parse(args):
+    import parser as p
+    corpus = load_corpus(args.output_dir)
+    if not corpus:
+        print(f"[FATAL] В {args.output_dir} нет результатов OCR")
+        return 1
+    print(f"[BENCH] документов: {len(corpus)}, повторов: {args.repeat}")
+    print(f"[BENCH] {'документ':<20} | {'строк':>6} | {'5 x extract_*, мс':>17} | {'extract_fields, мс':>18} | ускорение")
+    total_old = total_new = 0.0
+    for name, text in corpus:
+        old = _time_per_call(_separate_extract, text, args.repeat)
+        new = _time_per_call(p.extract_fields, text, args.repeat)
+        total_old += old
+        total_new += new
+        n_lines = len(text.splitlines())
+        print(f"[BENCH] {name:<20} | {n_lines:>6} | {old:>17.3f} | {new:>18.3f} | x{old / new if new else 0:.1f}")
+    print(f"[BENCH] {'итого':<20} | {'':>6} | {total_old:>17.3f} | {total_new:>18.3f} | "
+          f"x{total_old / total_new if total_new else 0:.1f}")
+    return 0
+
+# ---------- scaling ----------
+# строки-шаблоны из типичных договоров; повторы строк и маркеры без значения
+# (дата/валюта на соседней строке) — как в склеенных приложениях к договору
+_SYNTH_LINES = (
+    "Договор поставки № {n}-{m}/22",
+    "г. Алматы {d}.{mo}.20{y}",
+    "ТОО «Компания {n}», именуемое в дальнейшем «Поставщик», в лице директора",
+    "ООО",
+    "Покупатель, в лице генерального директора, действующего на основании Устава",
+    "Срок действия договора до {d}.{mo}.20{y} года",
+    "Настоящий договор действует по {d} декабря 20{y} г.",
+    "Валюта платежа",
+    "KZT",
+    "Позиция {n}: {a} {b},{c}",
+    "Количество {n} шт., цена за единицу {a} {b}",
+    "Приложение № {m} к договору",
+    "Подпись ___________",
+    "Стороны договорились о нижеследующем:",
+)
+
+def synth_document(n_lines, seed=0):
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(n_lines):
+        tpl = rnd.choice(_SYNTH_LINES)
+        lines.append(tpl.format(n=rnd.randint(1, 9999), m=rnd.randint(1, 99),
+                                d=rnd.randint(1, 28), mo=f"{rnd.randint(1, 12):02d}", y=rnd.randint(10, 29),
+                                a=rnd.randint(1, 999), b=f"{rnd.randint(0, 999):03d}", c=rnd.randint(0, 99)))
+    return "\n".join(lines)
+
+def _extract_cold(text):
+    """extract_fields без кэша дат от предыдущих повторов."""
+    import parser as p
+    p._parse_date_cached.cache_clear()
+    return p.extract_fields(text)
+
+def bench_scaling(args):
+    import parser as p
+    sizes = [int(x) for x in args.sizes.split(",")]
+    # при линейном разборе время растёт во столько же раз, во сколько строк
+    print(f"[BENCH] {'строк':>8} | {'extract_fields, мс':>18} | {'мкс/строку':>10} | рост времени / рост строк")
+    prev = None
+    for n in sizes:
+        text = synth_document(n, seed=n)
+        repeat = max(3, args.repeat * sizes[0] // n)
+        ms = _time_per_call(_extract_cold, text, repeat)
+        per_line = ms * 1000.0 / n
+        growth = f"x{ms / prev[1]:.1f} / x{n / prev[0]:.0f}" if prev else "-"
+        prev = (n, ms)
+        print(f"[BENCH] {n:>8} | {ms:>18.2f} | {per_line:>10.2f} | {growth}")
+    return 0
+
+# ---------- pipeline: скорость и точность против data/exel ----------
+TRUTH_DIR = os.path.join("data", "exel")
+BENCH_RESULTS_DIR = os.path.join("data", "bench")  # не в data/output: там каждая папка — документ для parser.py
+FIELDS = ("contract_number", "date_start", "date_end", "counterparty", "amount", "currency", "payment_currency")
+
+# подписи строк в эталонных книгах -> поле parser.extract_fields
+_TRUTH_LABELS = (
+    ("- № контракта", "contract_number"),
+    ("- дата заключения", "date_start"),
+    ("- дата окончания", "date_end"),
+    ("- контрагент", "counterparty"),
+    ("- сумма контракта", "amount"),
+    ("- валюта контракта", "currency"),
+    ("- валюта платежа", "payment_currency"),
+)
+_TRUTH_VALUE_COL = 4  # колонка "Данные" (переносимые в Colvir)
+
+# кириллица, похожая на латиницу: в именах файлов и номерах встречаются обе
+_HOMOGLYPHS = str.maketrans("АВЕКМНОРСТХУаеорсху", "ABEKMHOPCTXYaeopcxy")
+
+_CURRENCY_CODES = (
+    ("RUB", ("RUB", "РУБ")),
+    ("KZT", ("KZT", "ТЕНГЕ")),
+    ("USD", ("USD", "ДОЛЛАР")),
+    ("EUR", ("EUR", "ЕВРО")),
+)
+
+def doc_key(name):
+    """Имя документа без расширения, с латиницей вместо похожей кириллицы (355С.xlsx ~ 355C.pdf)."""
+    return os.path.splitext(os.path.basename(name))[0].translate(_HOMOGLYPHS).upper()
+
+def currency_codes(value):
+    """Множество ISO-кодов валют, упомянутых в строке ("EUR, USD", "руб." и т.п.)."""
+    if value is None:
+        return set()
+    up = str(value).upper()
+    return {code for code, words in _CURRENCY_CODES if any(w in up for w in words)}
+
+def _truth_value(field, value):
+    """Значение из эталона в том же виде, что у extract_fields."""
+    import parser as p
+    if value is None or str(value).strip().lower() in ("", "пусто"):
+        return None
+    if field in ("date_start", "date_end"):
+        if hasattr(value, "date"):
+            return value.date().isoformat()
+        return p.try_parse_date(str(value))
+    if field == "amount":
+        if isinstance(value, (int, float)):
+            return float(value)
+        return p.normalize_amount_str(str(value).splitlines()[0])
+    return str(value).strip()
+
+def load_ground_truth(truth_dir=TRUTH_DIR):
+    """{doc_key: {поле: значение}} из эталонных книг data/exel/*.xlsx."""
+    from openpyxl import load_workbook
+    truth = {}
+    for name in sorted(os.listdir(truth_dir)):
+        if not name.lower().endswith(".xlsx"):
+            continue
+        wb = load_workbook(os.path.join(truth_dir, name), read_only=True, data_only=True)
+        fields = {}
+        for row in wb.active.iter_rows(values_only=True):
+            label = next((str(c).strip() for c in row[:2] if isinstance(c, str) and c.strip().startswith("-")), None)
+            if label is None:
+                continue
+            field = next((f for prefix, f in _TRUTH_LABELS if label.startswith(prefix)), None)
+            if field is not None and len(row) > _TRUTH_VALUE_COL:
+                fields[field] = _truth_value(field, row[_TRUTH_VALUE_COL])
+        wb.close()
+        truth[doc_key(name)] = fields
+    return truth
+
+def _norm_id(value):
+    return "".join(ch for ch in str(value).translate(_HOMOGLYPHS).upper() if ch.isalnum())
+
+_ORG_WORDS = {"ООО", "ОАО", "ЗАО", "ПАО", "ТОО", "АО", "ИП", "LLP", "LLC", "LTD", "CO"}
+
+def _name_tokens(value):
+    words = re.findall(r"[\w\-]+", str(value).translate(_HOMOGLYPHS).upper())
+    return [w for w in words if len(w) > 1 and w not in _ORG_WORDS]
+
+def field_matches(field, expected, got):
+    """Совпадает ли найденное значение с эталоном (с допусками под каждое поле)."""
+    if field in ("currency", "payment_currency"):
+        # в эталоне может быть несколько валют платежа ("EUR, USD")
+        exp, found = currency_codes(expected), currency_codes(got)
+        return exp == found if not exp or not found else bool(found & exp)
+    if expected is None or got is None:
+        return expected is None and got is None
+    if field == "amount":
+        return abs(float(expected) - float(got)) < 0.005
+    if field == "contract_number":
+        return _norm_id(expected) == _norm_id(got)
+    if field == "counterparty":
+        # все значимые слова эталона должны встретиться в найденном названии
+        found = " ".join(_name_tokens(got))
+        tokens = _name_tokens(expected)
+        return bool(tokens) and all(t in found for t in tokens)
+    return expected == got
+
+def peak_rss_mb():
+    """Пиковый RSS процесса в МБ (None, если платформа не даёт его узнать)."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / (1 << 20)
+        except Exception:
+            return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024.0
+
+class _Stages:
+    """Суммарное время по стадиям конвейера."""
+    def __init__(self):
+        self.sec = {"raster": 0.0, "ocr": 0.0, "parse": 0.0}
+
+    def timed(self, stage, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.sec[stage] += time.perf_counter() - t0
+
+def _ocr_pages_engine(pdf_path, stages, poppler_path):
+    """Растеризация + OCR движком (страницы с текстовым слоем — без OCR); формат result.jsonl."""
+    import prod
+    ocr = prod.get_ocr_engine()
+    page_count = prod.count_pdf_pages(pdf_path, poppler_path)
+    known = stages.timed("ocr", prod.lookup_text_layer, pdf_path, page_count)
+    todo = [i for i in range(1, page_count + 1) if i not in known]
+    pages = prod.iter_pdf_pages(pdf_path, dpi=prod.DPI, poppler_path=poppler_path, page_numbers=todo)
+    records = [prod.jsonl_page_record(i, lines) for i, lines in known.items()]
+    while True:
+        try:
+            page_idx, page = stages.timed("raster", next, pages)
+        except StopIteration:
+            break
+        image = stages.timed("raster", prod.page_to_array, page)
+        del page
+        lines = stages.timed("ocr", lambda: prod.page_lines(prod.run_ocr(ocr, image), ocr))
+        records.append(prod.jsonl_page_record(page_idx, lines))
+    records.sort(key=lambda r: r["page"])
+    return records, "engine"
+
+def _ocr_pages_cached(pdf_path, stages, poppler_path):
+    """
+    OCR без моделей: сначала кэш страниц (нужен poppler, чтобы узнать число
+    страниц), иначе готовый результат в data/output/<имя>/.
+    """
+    import prod
+    import parser as p
+    try:
+        page_count = prod.count_pdf_pages(pdf_path, poppler_path)
+        cache = prod.get_ocr_cache()
+        if cache is not None:
+            _, cached = stages.timed("ocr", prod.lookup_cached_pages, cache, pdf_path, page_count)
+            if page_count and len(cached) == page_count:
+                return [prod.jsonl_page_record(i, cached[i]) for i in range(1, page_count + 1)], "ocr_cache"
+    except Exception as e:
+        # нет poppler, кэш не открылся и т.п. — замер идёт по готовому результату
+        print(f"  [WARN] {os.path.basename(pdf_path)}: кэш OCR недоступен ({e}), беру data/output")
+    folder = os.path.join(prod.BASE_OUTPUT_DIR, os.path.splitext(os.path.basename(pdf_path))[0])
+    jsonl_path = os.path.join(folder, "result.jsonl")
+    if os.path.exists(jsonl_path):
+        return stages.timed("ocr", lambda: list(p.iter_jsonl_pages(jsonl_path))), "result.jsonl"
+    text, _ = stages.timed("ocr", p.load_ocr_output, folder)
+    return (text or None), "result.txt"
+
+def bench_pipeline(args):
+    import parser as p
+    import prod  # импорт движка не входит в замер стадий
+    truth = load_ground_truth(args.truth_dir)
+    pdfs = sorted(f for f in os.listdir(args.scans_dir) if f.lower().endswith(".pdf"))
+    if args.limit:
+        pdfs = pdfs[:args.limit]
+    print(f"[BENCH] документов: {len(pdfs)}, эталонов: {len(truth)}, OCR: {args.ocr}")
+
+    stages = _Stages()
+    run_ocr_pages = _ocr_pages_engine if args.ocr == "engine" else _ocr_pages_cached
+    docs = []
+    total_pages = 0
+    hits = {f: 0 for f in FIELDS}
+    checked = 0
+    t0 = time.perf_counter()
+    for pdf in pdfs:
+        pdf_path = os.path.join(args.scans_dir, pdf)
+        try:
+            pages, source = run_ocr_pages(pdf_path, stages, args.poppler_path)
+        except Exception as e:
+            print(f"[ERROR] {pdf}: {e}")
+            continue
+        if not pages:
+            print(f"[WARN] {pdf}: нет результата OCR ({source}) — пропускаем")
+            continue
+        if isinstance(pages, str):
+            text, n_pages = pages, pages.count("--- Страница ")
+        else:
+            text, n_pages = p.pages_to_text(pages)[0], len(pages)
+        total_pages += n_pages
+        fields = stages.timed("parse", p.extract_fields, text)
+
+        doc = {"name": pdf, "pages": n_pages, "source": source, "fields": {}}
+        expected = truth.get(doc_key(pdf))
+        if expected is not None:
+            checked += 1
+            for f in FIELDS:
+                ok = field_matches(f, expected.get(f), fields[f])
+                hits[f] += ok
+                doc["fields"][f] = {"expected": expected.get(f), "got": fields[f], "ok": ok}
+        docs.append(doc)
+        marks = " ".join(f"{f}={'+' if v['ok'] else '-'}" for f, v in doc["fields"].items()) or "нет эталона"
+        print(f"[BENCH] {pdf:<12} стр: {n_pages:>3} ({source}) {marks}")
+
+    wall = time.perf_counter() - t0
+    accuracy = {f: (hits[f] / checked if checked else None) for f in FIELDS}
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "ocr": args.ocr,
+        "documents": len(docs),
+        "pages": total_pages,
+        "wall_sec": round(wall, 4),
+        "stage_sec": {k: round(v, 4) for k, v in stages.sec.items()},
+        "pages_per_sec": round(total_pages / wall, 3) if wall > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "accuracy": accuracy,
+        "accuracy_mean": (sum(hits.values()) / (checked * len(FIELDS))) if checked else None,
+        "docs": docs,
+    }
+
+    print(f"\n[BENCH] стадии, с: " + ", ".join(f"{k} {v:.3f}" for k, v in stages.sec.items())
+          + f"; всего {wall:.3f} с, {report['pages_per_sec'] or 0:.2f} стр/с, "
+          f"пик RSS {report['peak_rss_mb'] or 0:.0f} МБ")
+    print(f"[BENCH] точность по полям ({checked} док.):")
+    for f in FIELDS:
+        if accuracy[f] is not None:
+            print(f"[BENCH]   {f:<17} {accuracy[f] * 100:5.1f}% ({hits[f]}/{checked})")
+
+    out_path = args.json or os.path.join(BENCH_RESULTS_DIR, f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"[BENCH] результат: {out_path}")
+
+    if args.compare:
+        return compare_reports(args.compare, report, args.max_slowdown)
+    return 0
+
+def compare_reports(old_path, new, max_slowdown=0.10):
+    """Сравнение с прошлым прогоном: 1, если упала точность или скорость хуже допуска."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    regressions = []
+    for f_name in FIELDS:
+        a, b = old.get("accuracy", {}).get(f_name), new["accuracy"].get(f_name)
+        if a is not None and b is not None and b < a:
+            regressions.append(f"точность {f_name}: {a * 100:.1f}% -> {b * 100:.1f}%")
+    for stage, b in new["stage_sec"].items():
+        a = old.get("stage_sec", {}).get(stage)
+        if a and b > a * (1 + max_slowdown) and b - a > 0.01:
+            regressions.append(f"стадия {stage}: {a:.3f} с -> {b:.3f} с")
+    a, b = old.get("pages_per_sec"), new.get("pages_per_sec")
+    print(f"[BENCH] сравнение с {old_path}: стр/с {a} -> {b}")
+    for r in regressions:
+        print(f"[REGRESSION] {r}")
+    if not regressions:
+        print("[BENCH] регрессий нет")
+    return 1 if regressions else 0
+
+# ---------- startup: холодный старт ----------
+STARTUP_TARGETS = ("parser", "prod", "service")
+# тяжёлые зависимости: parser не должен тянуть ни одну, prod/service — только numpy
+HEAVY_MODULES = ("paddle", "paddleocr", "pdf2image", "docx", "openpyxl", "pandas", "numpy")
+_STARTUP_PROBE = (
+    "import sys, time, json\n"
+    "t0 = time.perf_counter()\n"
+    "import {target}\n"
+    "sec = time.perf_counter() - t0\n"
+    "print(json.dumps({{'import_sec': sec, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))\n"
+)
+
+def _startup_once(target):
+    """Один новый интерпретатор: (время импорта target, время процесса целиком, тяжёлые модули)."""
+    code = _STARTUP_PROBE.format(target=target, heavy=HEAVY_MODULES)
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - t0
+    res = json.loads(out.stdout.strip().splitlines()[-1])
+    return res["import_sec"], wall, res["heavy"]
+
+def bench_startup(args):
+    targets = [t for t in args.targets.split(",") if t]
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0], "targets": {}}
+    for target in targets:
+        imports, walls, heavy = [], [], []
+        for _ in range(args.repeat):
+            import_sec, wall, heavy = _startup_once(target)
+            imports.append(import_sec)
+            walls.append(wall)
+        report["targets"][target] = {
+            "import_sec": round(statistics.median(imports), 4),
+            "first_import_sec": round(imports[0], 4),  # первый запуск — самый холодный
+            "process_sec": round(statistics.median(walls), 4),
+            "heavy": heavy,
+        }
+        print(f"[BENCH] import {target:<8} {statistics.median(imports) * 1000:7.1f} мс "
+              f"(первый {imports[0] * 1000:.1f} мс, процесс {statistics.median(walls) * 1000:.1f} мс); "
+              f"тяжёлые: {', '.join(heavy) or 'нет'}")
+
+    out_path = args.json or os.path.join(BENCH_RESULTS_DIR, f"startup-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[BENCH] результат: {out_path}")
+
+    regressions = []
+    if "parser" in report["targets"] and report["targets"]["parser"]["heavy"]:
+        regressions.append("parser тянет при импорте: " + ", ".join(report["targets"]["parser"]["heavy"]))
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f).get("targets", {})
+        for target, new in report["targets"].items():
+            a, b = old.get(target, {}).get("import_sec"), new["import_sec"]
+            if a and b > a * (1 + args.max_slowdown) and b - a > 0.01:
+                regressions.append(f"import {target}: {a * 1000:.1f} мс -> {b * 1000:.1f} мс")
+        print(f"[BENCH] сравнение с {args.compare}")
+    for r in regressions:
+        print(f"[REGRESSION] {r}")
+    return 1 if regressions else 0
+
+# ---------- Запуск ----------
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Бенчмарки bcc-ocr")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    sp = sub.add_parser("parse", help="время разбора документа по корпусу data/output")
+    sp.add_argument("--output-dir", default=os.path.join("data", "output"))
+    sp.add_argument("--repeat", type=int, default=50)
+    sp.set_defaults(func=bench_parse)
+
+    sp = sub.add_parser("scaling", help="рост времени разбора с длиной документа")
+    sp.add_argument("--sizes", default="100,1000,10000,100000")
+    sp.add_argument("--repeat", type=int, default=20)
+    sp.set_defaults(func=bench_scaling)
+
+    sp = sub.add_parser("pipeline", help="скорость и точность всего конвейера против data/exel")
+    sp.add_argument("--ocr", choices=("cached", "engine"), default="cached",
+                    help="cached — без моделей: кэш OCR или готовые результаты data/output; engine — PaddleOCR")
+    sp.add_argument("--scans-dir", default=os.path.join("data", "scans"))
+    sp.add_argument("--truth-dir", default=TRUTH_DIR)
+    sp.add_argument("--poppler-path", default=None)
+    sp.add_argument("--limit", type=int, default=0, help="только первые N документов")
+    sp.add_argument("--json", default=None, help="куда сохранить отчёт (по умолчанию data/bench/)")
+    sp.add_argument("--compare", default=None, help="прошлый отчёт: код возврата 1 при регрессии")
+    sp.add_argument("--max-slowdown", type=float, default=0.10, help="допустимое замедление стадии (доля)")
+    sp.set_defaults(func=bench_pipeline)
+
+    sp = sub.add_parser("startup", help="холодный старт: время импорта модулей в новом процессе")
+    sp.add_argument("--targets", default=",".join(STARTUP_TARGETS))
+    sp.add_argument("--repeat", type=int, default=5)
+    sp.add_argument("--json", default=None, help="куда сохранить отчёт (по умолчанию data/bench/)")
+    sp.add_argument("--compare", default=None, help="прошлый отчёт: код возврата 1 при регрессии")
+    sp.add_argument("--max-slowdown", type=float, default=0.20, help="допустимое замедление импорта (доля)")
+    sp.set_defaults(func=bench_startup)
+
+    args = ap.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+# conftest.py — настройки pytest
+# test_ocr.py — ручной скрипт проверки PaddleOCR: грузит модели из сети при
+# импорте, поэтому pytest его не собирает (запускать: python test_ocr.py)
+collect_ignore = ["test_ocr.py"]
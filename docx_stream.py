@@ -0,0 +1,94 @@
+# docx_stream.py — потоковая запись result.docx без python-docx в памяти
+"""
+python-docx держит весь документ деревом lxml (объект на каждый абзац) и
+сериализует его только в save(); для скана на сотни страниц это десятки
+тысяч абзацев и долгое сохранение в конце. DocxStream пишет docx как есть —
+zip-архив WordprocessingML — по мере поступления страниц:
+
+  * все части, кроме word/document.xml (стили, тема, настройки, свойства),
+    копируются из шаблона python-docx (docx/templates/default.docx), поэтому
+    документ открывается в Word так же, как сохранённый через Document();
+  * word/document.xml пишется сжатым потоком: заголовок, абзацы страниц по
+    одной порции на страницу, в конце — sectPr шаблона.
+
+Абзацы такие же, как у python-docx: заголовок — стиль HeadingN, строка —
+абзац с одним run; табуляция и перевод строки — <w:tab/> и <w:br/>.
+Символы, недопустимые в XML, выбрасываются (python-docx на них падал).
+"""
+import os
+import re
+import zipfile
+import importlib.util
+from xml.sax.saxutils import escape
+
+COMPRESSLEVEL = 1  # deflate: уровень 1 заметно быстрее, файл чуть больше
+DOCUMENT_PART = "word/document.xml"
+
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+_TEMPLATE = None
+
+def _template():
+    """(части шаблона кроме document.xml, начало document.xml до тела, sectPr и конец)."""
+    global _TEMPLATE
+    if _TEMPLATE is None:
+        # путь к пакету без импорта python-docx (lxml) — см. bench.py startup
+        spec = importlib.util.find_spec("docx")
+        if spec is None or not spec.submodule_search_locations:
+            raise ImportError("нужен python-docx: из него берётся шаблон result.docx")
+        path = os.path.join(spec.submodule_search_locations[0], "templates", "default.docx")
+        with zipfile.ZipFile(path) as z:
+            parts = [(info.filename, z.read(info)) for info in z.infolist() if info.filename != DOCUMENT_PART]
+            xml = z.read(DOCUMENT_PART).decode("utf-8")
+        body = xml.index("<w:body>") + len("<w:body>")
+        sect = xml.index("<w:sectPr", body)
+        _TEMPLATE = (parts, xml[:body], xml[sect:])
+    return _TEMPLATE
+
+def _text_xml(text):
+    text = escape(_INVALID_XML.sub("", text))
+    text = text.replace("\r", "").replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">')
+    text = text.replace("\n", '</w:t><w:br/><w:t xml:space="preserve">')
+    return f'<w:r><w:t xml:space="preserve">{text}</w:t></w:r>'
+
+def heading_xml(text, level=1):
+    return f'<w:p><w:pPr><w:pStyle w:val="Heading{level}"/></w:pPr>{_text_xml(text)}</w:p>'
+
+def paragraph_xml(text):
+    return f"<w:p>{_text_xml(text)}</w:p>"
+
+class DocxStream:
+    """
+    docx, который пишется в открытый двоичный файл f по мере поступления
+    абзацев: write(xml) — порция абзацев (heading_xml/paragraph_xml),
+    close() — дописывает конец документа и оглавление zip. Сам f не
+    закрывается: сброс на диск и переименование — у вызывающего.
+    """
+    def __init__(self, f, compresslevel=COMPRESSLEVEL):
+        parts, head, self._tail = _template()
+        self._zip = zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+        for name, data in parts:
+            self._zip.writestr(name, data)
+        self._doc = self._zip.open(DOCUMENT_PART, "w")
+        self._doc.write(head.encode("utf-8"))
+
+    def write(self, xml):
+        self._doc.write(xml.encode("utf-8"))
+
+    def close(self):
+        if self._doc is None:
+            return
+        self._doc.write(self._tail.encode("utf-8"))
+        self._doc.close()
+        self._doc = None
+        self._zip.close()
+
+    def abort(self):
+        """Бросить недописанный документ (файл удаляет вызывающий)."""
+        if self._doc is None:
+            return
+        try:
+            self._doc.close()
+            self._zip.close()
+        except Exception:
+            pass
+        self._doc = None
@@ -0,0 +1,124 @@
+# journal.py — журнал заданий prod.py для продолжения после падения
+"""
+Журнал упреждающей записи (write-ahead): JSON-строки, дописываемые в
+data/output/ocr_journal.jsonl до того, как результат страницы попадёт в
+result.*:
+
+    {"ev": "start", "doc": имя, "hash": sha256 PDF, "pages": N}
+    {"ev": "page",  "doc": имя, "page": i, "lines": {"texts", "scores", "bboxes"}}
+    {"ev": "done",  "doc": имя}
+
+Каждая строка сбрасывается на диск (flush + fsync при FSYNC), поэтому после
+падения или вытеснения машины повторный запуск берёт уже распознанные
+страницы незавершённого документа из журнала (resume) и продолжает со
+следующей. Недописанная последняя строка при чтении пропускается.
+Если PDF изменился (другой hash), его старые страницы не используются.
+
+Документы, отмеченные done, из журнала выбрасываются при compact() —
+в конце прогона и при открытии, так что файл не растёт бесконечно.
+"""
+import os
+import json
+import threading
+
+from ocr_result import as_page
+
+FSYNC = True  # fsync после каждой записи: медленнее, но страница не теряется при отключении питания
+
+class Journal:
+    def __init__(self, path, fsync=FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+        self.docs = {}  # имя -> {"hash", "pages": {номер: lines}, "done"}
+        self._replay()
+        self.compact()
+
+    # ---- чтение ----
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        bad = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    bad += 1  # строка, оборванная падением
+                    continue
+                self._apply(rec)
+        if bad:
+            print(f"[JOURNAL] пропущено повреждённых строк: {bad}")
+
+    def _apply(self, rec):
+        ev, name = rec.get("ev"), rec.get("doc")
+        if ev == "start":
+            st = self.docs.get(name)
+            if st is None or st["hash"] != rec.get("hash"):
+                self.docs[name] = {"hash": rec.get("hash"), "pages": {}, "done": False}
+            else:
+                st["done"] = False
+        elif ev == "page" and name in self.docs:
+            self.docs[name]["pages"][int(rec["page"])] = rec["lines"]
+        elif ev == "done" and name in self.docs:
+            self.docs[name]["done"] = True
+            self.docs[name]["pages"] = {}
+
+    # ---- запись ----
+    def _append(self, rec):
+        line = json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._apply(rec)
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def resume(self, name, pdf_hash):
+        """Страницы незавершённого документа с тем же hash: {номер: PageResult}."""
+        with self._lock:
+            st = self.docs.get(name)
+            if st is None or st["done"] or st["hash"] != pdf_hash:
+                return {}
+            return {i: as_page(lines) for i, lines in st["pages"].items()}
+
+    def start(self, name, pdf_hash, page_count):
+        self._append({"ev": "start", "doc": name, "hash": pdf_hash, "pages": page_count})
+
+    def page(self, name, page_idx, lines):
+        self._append({"ev": "page", "doc": name, "page": page_idx, "lines": as_page(lines).to_json()})
+
+    def done(self, name):
+        self._append({"ev": "done", "doc": name})
+
+    def unfinished(self):
+        """(документов, страниц) в незавершённых документах."""
+        with self._lock:
+            docs = [st for st in self.docs.values() if not st["done"]]
+            return len(docs), sum(len(st["pages"]) for st in docs)
+
+    def compact(self):
+        """Переписывает журнал атомарно, оставляя только незавершённые документы."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self.docs = {n: st for n, st in self.docs.items() if not st["done"]}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for name, st in self.docs.items():
+                    f.write(json.dumps({"ev": "start", "doc": name, "hash": st["hash"]},
+                                       ensure_ascii=False) + "\n")
+                    for page_idx, lines in sorted(st["pages"].items()):
+                        f.write(json.dumps({"ev": "page", "doc": name, "page": page_idx, "lines": lines},
+                                           ensure_ascii=False, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None and not self._file.closed:
+                self._file.close()
@@ -0,0 +1,140 @@
+# layout.py — строки страницы в порядке чтения по рамкам детекции
+"""
+Детектор PaddleOCR режет строку договора на куски ("именуемые", "B", "0",
+"нижеследующем:") и иногда находит один и тот же текст дважды
+("повреждений." внутри "повреждений во время транспортировки."). Из-за
+этого в result.txt строки рваные, а экстракторы parser.py вынуждены
+смотреть окна соседних строк.
+
+reading_order(page) строит по рамкам индекс строк страницы — корзины
+строк, отсортированные по вертикали, — и по нему:
+
+  * собирает фрагменты в строки: фрагмент попадает в корзину, с которой
+    перекрывается по вертикали не меньше ROW_OVERLAP своей высоты;
+  * внутри строки идёт слева направо и склеивает соседние фрагменты через
+    пробел, если промежуток не больше MERGE_GAP высот строки (дальше —
+    другая колонка, она остаётся отдельной строкой);
+  * выбрасывает дубликаты: фрагмент, рамка которого не меньше чем на
+    DEDUP_OVERLAP лежит внутри соседней, а текст содержится в её тексте.
+
+Confidence склеенной строки — среднее по фрагментам, взвешенное длиной
+текста; рамка — объединение рамок. Страницы без рамок (старые результаты,
+txt/docx) возвращаются как есть. Исходные строки детекции остаются в
+result.jsonl; порядок чтения применяется к result.txt/docx (prod.py) и к
+тексту для экстракторов (parser.pages_to_text).
+"""
+import numpy as np
+
+from ocr_result import PageResult
+
+ENABLED = True
+ROW_OVERLAP = 0.5     # доля высоты фрагмента, на которую он должен перекрываться со строкой
+MERGE_GAP = 2.0       # максимальный промежуток между фрагментами строки, в высотах строки
+DEDUP_OVERLAP = 0.7   # доля площади меньшей рамки внутри большей, чтобы считать её дубликатом
+
+def configure(enabled=True):
+    global ENABLED
+    ENABLED = bool(enabled)
+
+def settings():
+    """Аргументы для configure() в дочернем процессе."""
+    return (ENABLED,)
+
+def signature():
+    """Что влияет на склейку строк — для манифестов prod.py/parser.py: смена настроек требует пересчёта."""
+    if not ENABLED:
+        return "raw"
+    return f"rows:{ROW_OVERLAP}:{MERGE_GAP}:{DEDUP_OVERLAP}"
+
+def _rows(yc, h):
+    """Корзины строк: списки индексов фрагментов, корзины — сверху вниз."""
+    rows = []  # [центр, высота, индексы]
+    for i in np.argsort(yc, kind="stable").tolist():
+        best, best_overlap = None, 0.0
+        # по центру отсортировано: подходить могут только последние корзины
+        for row in reversed(rows[-3:]):
+            top = max(yc[i] - h[i] / 2, row[0] - row[1] / 2)
+            bottom = min(yc[i] + h[i] / 2, row[0] + row[1] / 2)
+            overlap = (bottom - top) / min(h[i], row[1])
+            if overlap > best_overlap:
+                best, best_overlap = row, overlap
+        if best is not None and best_overlap >= ROW_OVERLAP:
+            k = len(best[2])
+            best[0] = (best[0] * k + yc[i]) / (k + 1)
+            best[1] = (best[1] * k + h[i]) / (k + 1)
+            best[2].append(i)
+        else:
+            rows.append([yc[i], h[i], [i]])
+    rows.sort(key=lambda row: row[0])
+    return rows
+
+def _is_duplicate(a, b, texts, x0, x1, y0, y1):
+    """Фрагмент a — повтор соседнего b: рамка почти внутри b, текст — часть текста b."""
+    ix = min(x1[a], x1[b]) - max(x0[a], x0[b])
+    iy = min(y1[a], y1[b]) - max(y0[a], y0[b])
+    if ix <= 0 or iy <= 0:
+        return False
+    area = max((x1[a] - x0[a]) * (y1[a] - y0[a]), 1e-6)
+    if ix * iy / area < DEDUP_OVERLAP:
+        return False
+    return _norm(texts[a]) in _norm(texts[b])
+
+def _norm(text):
+    return text.casefold().strip(" .,;:")
+
+def reading_order(page):
+    """PageResult -> PageResult со склеенными строками в порядке чтения и без дубликатов."""
+    n = len(page)
+    if n < 2 or np.isnan(page.boxes).any():
+        return page
+    lo, hi = page.boxes.min(axis=1), page.boxes.max(axis=1)
+    x0, y0 = lo[:, 0].tolist(), lo[:, 1].tolist()
+    x1, y1 = hi[:, 0].tolist(), hi[:, 1].tolist()
+    h = np.maximum(hi[:, 1] - lo[:, 1], 1.0)
+    yc = (lo[:, 1] + hi[:, 1]) / 2
+    texts = page.texts
+    scores = page.scores.tolist()
+
+    out_texts, out_scores, out_boxes = [], [], []
+    for _, row_h, members in _rows(yc.tolist(), h.tolist()):
+        members.sort(key=lambda i: x0[i])
+        # дубликаты: меньший фрагмент внутри соседнего по строке
+        kept = []
+        for i in members:
+            if kept and _is_duplicate(i, kept[-1], texts, x0, x1, y0, y1):
+                continue
+            if kept and _is_duplicate(kept[-1], i, texts, x0, x1, y0, y1):
+                kept[-1] = i
+                continue
+            kept.append(i)
+        # склейка соседних фрагментов
+        group, right = [kept[0]], x1[kept[0]]
+        for i in kept[1:] + [None]:
+            if i is not None and x0[i] - right <= MERGE_GAP * row_h:
+                group.append(i)
+                right = max(right, x1[i])
+                continue
+            out_texts.append(" ".join(texts[g] for g in group))
+            out_scores.append(_weighted_score(group, texts, scores))
+            gx0, gy0 = min(x0[g] for g in group), min(y0[g] for g in group)
+            gx1, gy1 = right, max(y1[g] for g in group)
+            out_boxes.append([[gx0, gy0], [gx1, gy0], [gx1, gy1], [gx0, gy1]])
+            if i is not None:
+                group, right = [i], x1[i]
+    return PageResult(out_texts, np.asarray(out_scores, dtype=np.float64),
+                      np.asarray(out_boxes, dtype=np.float32).reshape(-1, 4, 2))
+
+def _weighted_score(group, texts, scores):
+    """Confidence склеенной строки: среднее по фрагментам с оценкой, веса — длина текста."""
+    if len(group) == 1:
+        return scores[group[0]]
+    total = weight = 0.0
+    for g in group:
+        if scores[g] == scores[g]:  # не NaN
+            total += scores[g] * len(texts[g])
+            weight += len(texts[g])
+    return total / weight if weight else float("nan")
+
+def display_page(page):
+    """Страница для result.txt/docx и экстракторов: в порядке чтения, если ENABLED."""
+    return reading_order(page) if ENABLED else page
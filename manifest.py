@@ -0,0 +1,118 @@
+# manifest.py — манифест обработанных документов для инкрементальных прогонов
+"""
+Манифест — JSON-файл вида {имя_документа: запись}. prod.py хранит в записи
+отпечаток входного PDF и выходных result.txt/result.docx, parser.py —
+отпечаток result.txt (или result.docx) и извлечённую строку таблицы.
+При следующем запуске обрабатываются только новые и изменившиеся документы.
+
+Отпечаток файла — (mtime_ns, size, sha256). Сначала сравниваются mtime и
+размер; хэш считается только если они разошлись, чтобы простой touch или
+копирование без изменений не запускали повторную обработку.
+"""
+import os
+import json
+
+from ocr_cache import file_sha256
+
+def file_fingerprint(path, with_hash=True):
+    st = os.stat(path)
+    fp = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+    if with_hash:
+        fp["sha256"] = file_sha256(path)
+    return fp
+
+def file_unchanged(path, fp):
+    """True, если файл существует и совпадает с отпечатком fp."""
+    if not fp:
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_mtime_ns == fp.get("mtime_ns") and st.st_size == fp.get("size"):
+        return True
+    if st.st_size != fp.get("size") or "sha256" not in fp:
+        return False
+    if file_sha256(path) != fp["sha256"]:
+        return False
+    # содержимое то же — запоминаем новый mtime, чтобы не хэшировать снова
+    fp["mtime_ns"] = st.st_mtime_ns
+    return True
+
+class Manifest:
+    """
+    Словарь записей на диске: снимок path (JSON) и журнал изменений
+    path + ".log" (JSON-строка на set/remove). Изменения дописываются в журнал
+    порциями по autosave_every штук, так что падение длинного прогона теряет
+    не больше порции, а стоимость записи не растёт с размером манифеста.
+    save() — уплотнение: снимок переписывается целиком (tmp-файл + os.replace),
+    журнал обнуляется; его зовут в конце прогона. При чтении журнал
+    проигрывается поверх снимка, оборванная последняя строка пропускается.
+    """
+    def __init__(self, path, autosave_every=50):
+        self.path = path
+        self.log_path = path + ".log"
+        self.autosave_every = autosave_every
+        self._pending = []
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Манифест {path} не прочитан ({e}) — начинаем с пустого")
+        self._replay()
+
+    def _replay(self):
+        if not os.path.exists(self.log_path):
+            return
+        bad = 0
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    bad += 1  # строка, оборванная падением
+                    continue
+                if "entry" in rec:
+                    self.entries[rec["name"]] = rec["entry"]
+                else:
+                    self.entries.pop(rec["name"], None)
+        if bad:
+            print(f"[WARN] Журнал манифеста {self.log_path}: пропущено повреждённых строк: {bad}")
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def set(self, name, entry):
+        self.entries[name] = entry
+        self._touch({"name": name, "entry": entry})
+
+    def remove(self, name):
+        if self.entries.pop(name, None) is not None:
+            self._touch({"name": name})
+
+    def _touch(self, rec):
+        self._pending.append(json.dumps(rec, ensure_ascii=False))
+        if self.autosave_every and len(self._pending) >= self.autosave_every:
+            self.flush()
+
+    def flush(self):
+        """Дописывает накопленные изменения в журнал — O(изменений), а не O(манифеста)."""
+        if not self._pending:
+            return
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(self._pending) + "\n")
+        self._pending = []
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        # снимок уже содержит всё из журнала
+        self._pending = []
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
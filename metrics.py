@@ -0,0 +1,196 @@
+# metrics.py — замеры стадий и счётчики для prod.py и parser.py
+"""
+Лёгкий слой инструментации:
+
+  * timed("stage") — время стадии (растеризация, детекция, распознавание,
+    extract_lines, запись docx/txt, каждый экстрактор parser.py и т.д.);
+  * inc("counter") — счётчики: страницы, строки, строки с низким confidence,
+    попадания в кэш OCR и т.п.;
+  * dump(path) — выгрузка: *.prom — текстовый формат Prometheus (для
+    node_exporter textfile collector), иначе — одна JSON-строка на прогон;
+  * profile_document(name) — cProfile документа в PROFILE_DIR/<name>.prof;
+    поток на время документа называется "doc:<name>", так что в
+    `py-spy dump` видно, какой документ сейчас обрабатывается.
+
+По умолчанию выключено (ENABLED = False) и стоит один if на вызов;
+включается флагами --metrics / --profile. Процессы-воркеры получают
+настройки через configure(*settings()) и возвращают snapshot() главному
+процессу, который складывает их через merge().
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+ENABLED = False
+PROFILE_DIR = None
+LOW_CONF_THRESHOLD = 0.5  # строки с confidence ниже считаются "низкими"
+PREFIX = "bcc_ocr_"
+
+_NULL = nullcontext()
+
+class Metrics:
+    """Таймеры стадий (вызовов, секунд, максимум) и счётчики; потокобезопасно."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timers = {}    # стадия -> [вызовов, секунд, макс. секунд]
+        self.counters = {}  # имя -> число
+
+    def observe(self, stage, sec):
+        with self._lock:
+            t = self.timers.get(stage)
+            if t is None:
+                t = self.timers[stage] = [0, 0.0, 0.0]
+            t[0] += 1
+            t[1] += sec
+            if sec > t[2]:
+                t[2] = sec
+
+    def inc(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timed(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            snap = {"timers": {k: list(v) for k, v in self.timers.items()},
+                    "counters": dict(self.counters)}
+            if reset:
+                self.timers.clear()
+                self.counters.clear()
+        return snap
+
+    def merge(self, snap):
+        with self._lock:
+            for stage, (calls, sec, max_sec) in snap.get("timers", {}).items():
+                t = self.timers.setdefault(stage, [0, 0.0, 0.0])
+                t[0] += calls
+                t[1] += sec
+                t[2] = max(t[2], max_sec)
+            for name, n in snap.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_prometheus(self, **labels):
+        snap = self.snapshot()
+        base = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+
+        def lbl(extra=None):
+            parts = [p for p in (base, extra) if p]
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        # все строки одного семейства метрик идут подряд, как требует текстовый формат
+        out = []
+        for family, kind, col, fmt in (("stage_seconds_total", "counter", 1, "{:.6f}"),
+                                       ("stage_calls_total", "counter", 0, "{}"),
+                                       ("stage_seconds_max", "gauge", 2, "{:.6f}")):
+            out.append(f"# TYPE {PREFIX}{family} {kind}")
+            for stage in sorted(snap["timers"]):
+                stage_lbl = lbl('stage="%s"' % stage)
+                out.append(f"{PREFIX}{family}{stage_lbl} " + fmt.format(snap["timers"][stage][col]))
+        for name in sorted(snap["counters"]):
+            out.append(f"# TYPE {PREFIX}{name}_total counter")
+            out.append(f"{PREFIX}{name}_total{lbl()} {snap['counters'][name]}")
+        return "\n".join(out) + "\n"
+
+    def to_json(self, **labels):
+        snap = self.snapshot()
+        return {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **labels,
+            "stages": {k: {"calls": c, "sec": round(s, 6), "max_sec": round(m, 6)}
+                       for k, (c, s, m) in sorted(snap["timers"].items())},
+            "counters": snap["counters"],
+        }
+
+METRICS = Metrics()
+
+# ---------- Обёртки с проверкой ENABLED ----------
+def configure(enabled=True, profile_dir=None):
+    global ENABLED, PROFILE_DIR
+    ENABLED = bool(enabled or profile_dir)
+    PROFILE_DIR = profile_dir
+
+def settings():
+    """Аргументы для configure() в дочернем процессе."""
+    return ENABLED, PROFILE_DIR
+
+def timed(stage):
+    return METRICS.timed(stage) if ENABLED else _NULL
+
+def observe(stage, sec):
+    if ENABLED:
+        METRICS.observe(stage, sec)
+
+def inc(name, n=1):
+    if ENABLED:
+        METRICS.inc(name, n)
+
+def count_page(lines):
+    """Счётчики страницы: pages, lines, low_conf_lines (lines — PageResult или пары/тройки (text, score, ...))."""
+    if not ENABLED:
+        return
+    lines = lines or []
+    scores = getattr(lines, "scores", None)
+    if scores is not None:
+        low = int((scores < LOW_CONF_THRESHOLD).sum())  # NaN (нет оценки) в сравнении — False
+    else:
+        low = sum(1 for _, score, *_ in lines if score is not None and score < LOW_CONF_THRESHOLD)
+    METRICS.inc("pages")
+    METRICS.inc("lines", len(lines))
+    if low:
+        METRICS.inc("low_conf_lines", low)
+
+@contextmanager
+def profile_document(name):
+    """Профиль документа (если задан PROFILE_DIR) и имя потока для py-spy."""
+    thread = threading.current_thread()
+    old_name = thread.name
+    thread.name = f"doc:{name}"
+    profiler = None
+    if PROFILE_DIR:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        thread.name = old_name
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            safe = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in name)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{safe}.prof"))
+
+# ---------- Выгрузка ----------
+def dump(path, **labels):
+    """*.prom — перезаписать файл в формате Prometheus; иначе — дописать JSON-строку."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith(".prom"):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(METRICS.to_prometheus(**labels))
+        os.replace(tmp_path, path)
+    else:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(METRICS.to_json(**labels), ensure_ascii=False) + "\n")
+    print(f"[METRICS] сохранены в {path}")
+
+def print_summary():
+    """Короткая сводка: стадии по убыванию времени и счётчики."""
+    snap = METRICS.snapshot()
+    if not snap["timers"] and not snap["counters"]:
+        return
+    print(f"[METRICS] {'стадия':<26} | вызовов | всего, с | среднее, мс | макс, мс")
+    for stage, (calls, sec, max_sec) in sorted(snap["timers"].items(), key=lambda kv: -kv[1][1]):
+        avg = sec / calls * 1000.0 if calls else 0.0
+        print(f"[METRICS] {stage:<26} | {calls:>7} | {sec:>8.3f} | {avg:>11.2f} | {max_sec * 1000.0:>8.2f}")
+    if snap["counters"]:
+        print("[METRICS] " + ", ".join(f"{k}: {v}" for k, v in sorted(snap["counters"].items())))
@@ -0,0 +1,104 @@
+# ocr_cache.py — постоянный кэш результатов OCR по содержимому страниц
+"""
+Ключ страницы: sha256 байтов PDF + номер страницы + DPI + версия движка + язык.
+Значение: структурированный результат страницы — колонки ocr_result.PageResult
+{"texts", "scores", "bboxes"} (записи прежних версий — список (text, score, box)
+— читаются так же).
+Повторный прогон prod.py по data/scans распознаёт только новые или
+изменившиеся страницы; старые записи вытесняются по LRU при превышении
+размера кэша.
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def page_key(pdf_hash, page_idx, dpi, engine, lang):
+    raw = f"{pdf_hash}:{page_idx}:{dpi}:{engine}:{lang}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class OcrCache:
+    """
+    SQLite-кэш страниц с LRU-вытеснением по суммарному размеру.
+    Потокобезопасен: одно соединение под общей блокировкой.
+    """
+    def __init__(self, path, max_bytes=1 << 30):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_lru ON pages(last_access)")
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def get(self, key):
+        """Строки страницы (ocr_result.PageResult) или None при промахе."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM pages WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE pages SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        from ocr_result import as_page  # numpy — не при импорте: manifest (и parser.py) берёт отсюда file_sha256
+        return as_page(json.loads(zlib.decompress(row[0]).decode("utf-8")))
+
+    def put(self, key, lines):
+        """lines — PageResult или строки (text, score, box)."""
+        from ocr_result import as_page
+        value = zlib.compress(json.dumps(as_page(lines).to_json(), ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM pages WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._total -= old[0]
+            self._conn.execute("INSERT OR REPLACE INTO pages (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                               (key, value, len(value), time.time()))
+            self._total += len(value)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        while self._total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM pages ORDER BY last_access LIMIT 64").fetchall()
+            if not rows:
+                self._total = 0
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+                self._total -= size
+                self.evictions += 1
+                if self._total <= self.max_bytes:
+                    break
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def print_stats(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        print(f"[CACHE] попаданий: {self.hits}, промахов: {self.misses} ({rate:.0f}% hit), "
+              f"вытеснено: {self.evictions}, размер: {self._total / (1 << 20):.1f} МБ")
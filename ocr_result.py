@@ -0,0 +1,325 @@
+# ocr_result.py — компактный результат OCR страницы и разбор ответов PaddleOCR
+"""
+PageResult — строки страницы по колонкам:
+
+  * texts  — список строк (уже без пробелов по краям, пустые выброшены);
+  * scores — float64-массив (n,), NaN — у строки нет оценки;
+  * boxes  — float32-массив (n, 4, 2), NaN — у строки нет рамки.
+
+Из него напрямую строятся запись result.jsonl, строки result.txt/docx,
+значение кэша и журнала — без кортежа на строку. Сводки confidence
+(conf_stats, QualityStats) считаются по массиву scores целиком. Для старого кода
+PageResult по-прежнему итерируется как [(text, score, box), ...].
+
+ResultAdapter разбирает ответ движка: формат (PaddleX 3.x — словари с
+rec_texts/rec_scores/rec_polys, PaddleOCR 2.x — [[box, (text, score)], ...])
+определяется по первому непустому ответу и дальше разбирается без проверок
+на каждой строке. Если ответ не подошёл под запомненный формат, он
+разбирается медленным универсальным способом (fallback), а формат
+определяется заново.
+"""
+import math
+
+import numpy as np
+
+class PageResult:
+    __slots__ = ("texts", "scores", "boxes")
+
+    def __init__(self, texts, scores, boxes):
+        self.texts = texts
+        self.scores = scores
+        self.boxes = boxes
+
+    # ---- построение ----
+    @classmethod
+    def empty(cls):
+        return cls([], np.empty(0, dtype=np.float64), np.empty((0, 4, 2), dtype=np.float32))
+
+    @classmethod
+    def from_columns(cls, texts, scores=None, boxes=None):
+        """Сырые колонки движка -> страница; strip и отбор пустых строк — один проход."""
+        n = len(texts)
+        if not n:
+            return cls.empty()
+        stripped = [t.strip() if isinstance(t, str) else str(t).strip() for t in texts]
+        scores = score_array(scores, n)
+        boxes = _box_array(boxes, n)
+        keep = [i for i, t in enumerate(stripped) if t]
+        if len(keep) == n:
+            return cls(stripped, scores, boxes)
+        idx = np.asarray(keep, dtype=np.intp)
+        return cls([stripped[i] for i in keep], scores[idx], boxes[idx])
+
+    @classmethod
+    def from_lines(cls, lines):
+        """Старый формат [(text, score[, box]), ...]."""
+        if not lines:
+            return cls.empty()
+        texts, scores, boxes = [], [], []
+        for text, score, *rest in lines:
+            texts.append(text)
+            scores.append(score)
+            boxes.append(rest[0] if rest else None)
+        return cls.from_columns(texts, scores, boxes)
+
+    @classmethod
+    def from_json(cls, obj):
+        """Колонки из to_json() / записи result.jsonl ({"texts", "scores", "bboxes"})."""
+        return cls.from_columns(obj.get("texts") or [], obj.get("scores"), obj.get("bboxes"))
+
+    # ---- доступ ----
+    def __len__(self):
+        return len(self.texts)
+
+    def __bool__(self):
+        return bool(self.texts)
+
+    def __iter__(self):
+        """(text, score|None, box|None) — для кода, который ждёт строки кортежами."""
+        for text, score, box in zip(self.texts, self.score_list(), self.box_list()):
+            yield text, score, box
+
+    def score_list(self):
+        """Оценки списком, None вместо NaN."""
+        out = self.scores.tolist()
+        if np.isnan(self.scores).any():
+            out = [None if math.isnan(s) else s for s in out]
+        return out
+
+    def box_list(self, rounded=False):
+        """Рамки списком точек, None у строк без рамки; rounded — целые пиксели."""
+        missing = np.isnan(self.boxes).any(axis=(1, 2))
+        boxes = np.nan_to_num(self.boxes) if missing.any() else self.boxes
+        out = np.rint(boxes).astype(np.int64).tolist() if rounded else boxes.tolist()
+        if missing.any():
+            out = [None if m else b for b, m in zip(out, missing.tolist())]
+        return out
+
+    def mean_conf(self):
+        if not len(self.scores) or np.isnan(self.scores).all():
+            return None
+        return float(np.nanmean(self.scores))
+
+    def shifted(self, dx=0, dy=0):
+        """Рамки, сдвинутые на (dx, dy) — для результатов OCR вырезанной области."""
+        boxes = self.boxes + np.asarray([dx, dy], dtype=np.float32)
+        return PageResult(self.texts, self.scores, boxes)
+
+    # ---- сериализация ----
+    def record(self, page_idx, low_conf=None):
+        """Запись страницы result.jsonl; при low_conf — со сводкой confidence страницы ("conf")."""
+        scores = np.round(self.scores, 6)
+        out = scores.tolist()
+        if np.isnan(scores).any():
+            out = [None if math.isnan(s) else s for s in out]
+        rec = {"page": page_idx, "texts": self.texts, "scores": out, "bboxes": self.box_list(rounded=True)}
+        if low_conf is not None:
+            rec["conf"] = conf_stats(self.scores, low_conf)
+        return rec
+
+    def to_json(self):
+        """Колонки для кэша и журнала (JSON без потерь точности оценок)."""
+        return {"texts": self.texts, "scores": self.score_list(), "bboxes": self.box_list()}
+
+    def display_lines(self, conf_threshold=None):
+        # сравнение с порогом — одно на всю страницу, а не float() на строку
+        low = (self.scores < conf_threshold).tolist() if conf_threshold is not None else None
+        return display_lines(self.texts, self.score_list(), low)
+
+def score_array(scores, n):
+    if scores is None:
+        return np.full(n, np.nan)
+    try:
+        arr = np.asarray(scores, dtype=np.float64)
+    except (TypeError, ValueError):
+        arr = np.asarray([np.nan if s is None else float(s) for s in scores], dtype=np.float64)
+    if arr.shape != (n,):
+        arr = np.resize(arr, n) if arr.size else np.full(n, np.nan)
+    return arr
+
+def _box_array(boxes, n):
+    if boxes is None or not len(boxes):
+        return np.full((n, 4, 2), np.nan, dtype=np.float32)
+    try:
+        arr = np.asarray(boxes, dtype=np.float32)
+    except (TypeError, ValueError):
+        arr = None  # есть None или рамки разной формы
+    if arr is not None and arr.shape == (n, 4, 2):
+        return arr
+    if arr is not None and arr.shape == (n, 4):
+        # rec_boxes: [x0, y0, x1, y1] -> четыре угла
+        x0, y0, x1, y1 = arr.T
+        return np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1),
+                         np.stack([x1, y1], 1), np.stack([x0, y1], 1)], axis=1)
+    out = np.full((n, 4, 2), np.nan, dtype=np.float32)
+    for i, box in enumerate(list(boxes)[:n]):
+        if box is None:
+            continue
+        b = np.asarray(box, dtype=np.float32)
+        if b.shape == (4, 2):
+            out[i] = b
+        elif b.shape == (4,):
+            out[i] = [[b[0], b[1]], [b[2], b[1]], [b[2], b[3]], [b[0], b[3]]]
+    return out
+
+def as_page(lines):
+    """PageResult из чего угодно, что хранится в кэше/журнале/textlayer, или None."""
+    if lines is None or isinstance(lines, PageResult):
+        return lines
+    if isinstance(lines, dict):
+        return PageResult.from_json(lines)
+    return PageResult.from_lines(lines)
+
+def display_lines(texts, scores, low=None):
+    """
+    Строки страницы так, как они пишутся в result.txt/result.docx.
+    low — флаги "ниже порога" по строкам (PageResult.display_lines) или None.
+    """
+    if low is None:
+        return [text if score is None else f"{text}  (conf={score:.2f})"
+                for text, score in zip(texts, scores)]
+    out = []
+    for text, score, is_low in zip(texts, scores, low):
+        if score is None:
+            out.append(text)
+        elif is_low:
+            out.append(f"{text}  (low_conf={score:.2f})")
+        else:
+            out.append(f"{text}  (conf={score:.2f})")
+    return out
+
+# ---------- Статистика confidence ----------
+LOW_CONF = 0.8  # строки ниже — "низкие": result.quality.json (prod.py) и маршрутизация на проверку (parser.py)
+
+def conf_stats(scores, low_conf):
+    """
+    Сводка confidence страницы или документа за один проход по массиву:
+    lines, scored (строк с оценкой), mean, min, p10, p50, p90 и low_share —
+    доля строк с оценкой ниже low_conf. Без оценок — только lines и scored.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    valid = scores[~np.isnan(scores)]
+    out = {"lines": int(scores.size), "scored": int(valid.size)}
+    if not valid.size:
+        return out
+    p10, p50, p90 = np.percentile(valid, (10, 50, 90))
+    out.update(mean=round(float(valid.mean()), 4), min=round(float(valid.min()), 4),
+               p10=round(float(p10), 4), p50=round(float(p50), 4), p90=round(float(p90), 4),
+               low_share=round(np.count_nonzero(valid < low_conf) / valid.size, 4))
+    return out
+
+class QualityStats:
+    """Confidence документа по страницам: для result.quality.json и маршрутизации на проверку."""
+    WORST_PAGES = 5
+
+    def __init__(self, low_conf):
+        self.low_conf = low_conf
+        self.scores = []
+        self.page_means = []  # (средний confidence, страница)
+        self.pages = 0
+        self.empty_pages = 0
+
+    def add(self, page_idx, page):
+        self.add_scores(page_idx, page.scores)
+
+    def add_scores(self, page_idx, scores):
+        """scores — массив confidence строк страницы (score_array), NaN — без оценки."""
+        self.pages += 1
+        if not len(scores):
+            self.empty_pages += 1
+            return
+        self.scores.append(scores)
+        valid = scores[~np.isnan(scores)]
+        if valid.size:
+            self.page_means.append((float(valid.mean()), page_idx))
+
+    def summary(self):
+        scores = np.concatenate(self.scores) if self.scores else np.empty(0)
+        out = {"pages": self.pages, "empty_pages": self.empty_pages, "low_conf": self.low_conf}
+        out.update(conf_stats(scores, self.low_conf))
+        out["worst_pages"] = [{"page": i, "mean": round(m, 4)}
+                              for m, i in sorted(self.page_means)[:self.WORST_PAGES]]
+        return out
+
+# ---------- Разбор ответов движка ----------
+def _is_rec_dict(obj):
+    try:
+        return "rec_texts" in obj
+    except TypeError:
+        return False
+
+def detect_format(raw):
+    """"dict" / "dicts" (PaddleX 3.x), "lines" (PaddleOCR 2.x) или None — пусто/непонятно."""
+    if _is_rec_dict(raw):
+        return "dict"
+    if not isinstance(raw, (list, tuple)) or not raw:
+        return None
+    first = next((p for p in raw if p is not None), None)
+    if first is None:
+        return None
+    if _is_rec_dict(first):
+        return "dicts"
+    if isinstance(first, (list, tuple)) and first:
+        line = first[0]
+        if isinstance(line, (list, tuple)) and len(line) == 2 and isinstance(line[1], (list, tuple)):
+            return "lines"
+    return None
+
+def _from_rec_dicts(dicts):
+    texts, scores, boxes = [], [], []
+    for d in dicts:
+        t = list(d["rec_texts"])
+        if not t:
+            continue
+        polys = d.get("rec_polys")
+        if polys is None:
+            polys = d.get("rec_boxes")
+        texts.extend(t)
+        scores.append(score_array(d.get("rec_scores"), len(t)))
+        boxes.append(_box_array(polys, len(t)))
+    if not texts:
+        return PageResult.empty()
+    return PageResult.from_columns(texts, np.concatenate(scores), np.concatenate(boxes))
+
+def _from_line_pages(pages):
+    texts, scores, boxes = [], [], []
+    for page in pages:
+        if page is None:  # 2.x: пустая страница — [None]
+            continue
+        for box, (text, score) in page:
+            texts.append(text)
+            scores.append(score)
+            boxes.append(box)
+    if not texts:
+        return PageResult.empty()
+    return PageResult.from_columns(texts, scores, np.asarray(boxes, dtype=np.float32))
+
+_CONVERTERS = {
+    "dict": lambda raw: _from_rec_dicts([raw]),
+    "dicts": _from_rec_dicts,
+    "lines": _from_line_pages,
+}
+
+class ResultAdapter:
+    """
+    Разбор ответов одного движка. fallback(raw) -> [(text, score, box), ...]
+    вызывается для ответов, которые не подходят ни под один известный формат.
+    """
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+        self.fmt = None
+
+    def __call__(self, raw):
+        if not raw or (isinstance(raw, (list, tuple)) and all(p is None for p in raw)):
+            return PageResult.empty()
+        fmt = self.fmt or detect_format(raw)
+        if fmt is not None:
+            try:
+                page = _CONVERTERS[fmt](raw)
+                self.fmt = fmt
+                return page
+            except (KeyError, IndexError, TypeError, ValueError):
+                self.fmt = None
+        if self.fallback is None:
+            return PageResult.empty()
+        return PageResult.from_lines(self.fallback(raw))
@@ -2,16 +2,31 @@
 import os
 import re
 import json
+import mmap
+import time
 from datetime import datetime
+from functools import lru_cache
 from collections import OrderedDict
 
-import pandas as pd
-from docx import Document as DocxDocument  # для fallback чтения docx
+import metrics
+from manifest import Manifest, file_fingerprint, file_unchanged
+from sinks import SINKS, open_sink
 
 # ----------------- Настройки -----------------
 OUTPUT_BASE = os.path.join("data", "output")  # папка с результатами prod.py
 RESULT_XLSX = os.path.join(OUTPUT_BASE, "results.xlsx")
-CONF_THRESHOLD = None  # если хочешь фильтровать по confidence, ставь 0.5 и т.д.
+RESULT_FORMAT = "xlsx"  # xlsx / csv / parquet — расширение RESULT_XLSX меняется под формат
+CHECKPOINT_EVERY = 1000  # строк между фиксациями таблицы и манифеста
+RESULT_COLUMNS = ("file_folder", "contract_number", "date_start", "date_end", "counterparty",
+                  "amount", "currency", "payment_currency", "avg_confidence")
+PARSE_MANIFEST_PATH = os.path.join(OUTPUT_BASE, "parse_manifest.json")  # что уже распарсено
+PARSE_WORKERS = 1  # процессов для разбора папок (1 — последовательно)
+PARSE_IO_WORKERS = 4  # фоновых чтений/записей при последовательном разборе (aio.py); 0 — синхронно
+CONF_THRESHOLD = None  # как prod.CONF_THRESHOLD: строки ниже помечаются low_conf в тексте из result.jsonl
+# маршрутизация на ручную проверку (--review) по result.quality.json, без чтения текста
+REVIEW_PATH = os.path.join(OUTPUT_BASE, "review.csv")
+REVIEW_MIN_MEAN = 0.85       # средний confidence документа ниже — на проверку
+REVIEW_MAX_LOW_SHARE = 0.15  # доля низких строк выше — на проверку
 # ---------------------------------------------
 
 # ---- Полезные маппинги для русских месяцев ----
@@ -42,27 +57,161 @@ def read_txt_if_exists(folder):
 def read_docx_if_exists(folder):
     path = os.path.join(folder, "result.docx")
     if os.path.exists(path):
+        from docx import Document as DocxDocument  # python-docx нужен только этому запасному пути
         doc = DocxDocument(path)
         paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
         return "\n".join(paragraphs)
     return None
 
+def iter_jsonl_pages(path):
+    """
+    Потоково читает result.jsonl (по записи на страницу) через mmap:
+    файл не загружается в память целиком.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for raw in iter(mm.readline, b""):
+                raw = raw.strip()
+                if raw:
+                    yield json.loads(raw)
+
+def pages_to_text(pages, conf_threshold=None):
+    """
+    Из записей страниц формата result.jsonl ({"page", "texts", "scores", "bboxes"})
+    собирает тот же текст, что prod.py пишет в result.txt при том же пороге
+    (conf_threshold — как prod.CONF_THRESHOLD: строки ниже помечаются
+    low_conf), и список confidence строк. Фрагменты страниц с рамками
+    склеиваются в строки порядка чтения и очищаются от дубликатов
+    (layout.py), так что экстракторам достаются целые строки; scores же —
+    по исходным фрагментам детекции, как в result.quality.json и "conf"
+    страниц, чтобы avg_confidence и маршрутизация не расходились с ними.
+    Возвращает (text, scores).
+    """
+    import layout
+    from ocr_result import PageResult, display_lines
+    parts = []
+    scores = []
+    for rec in pages:
+        parts.append(f"--- Страница {rec['page']} ---\n")
+        texts = rec.get("texts") or []
+        if not texts:
+            parts.append("[Пусто или нераспознано]\n\n")
+            continue
+        rec_scores = rec.get("scores") or [None] * len(texts)
+        scores.extend(float(s) for s in rec_scores[:len(texts)] if s is not None)
+        if layout.ENABLED and any(box is not None for box in rec.get("bboxes") or ()):
+            page = layout.reading_order(PageResult.from_json(rec))
+            texts, rec_scores = page.texts, page.score_list()
+        low = None
+        if conf_threshold is not None:
+            low = [s is not None and s < conf_threshold for s in rec_scores]
+        for line in display_lines(texts, rec_scores, low):
+            parts.append(line + "\n")
+        parts.append("\n")
+    return "".join(parts), scores
+
+def read_jsonl_if_exists(folder):
+    """
+    Текст и confidence строк из result.jsonl (см. pages_to_text).
+    Возвращает (text, scores) или None.
+    """
+    path = os.path.join(folder, "result.jsonl")
+    if not os.path.exists(path):
+        return None
+    return pages_to_text(iter_jsonl_pages(path), CONF_THRESHOLD)
+
+def load_ocr_output(folder):
+    """
+    Результат OCR из папки: (text, scores). Порядок источников:
+    result.jsonl (структурированный, самый быстрый) -> result.txt -> result.docx.
+    scores — confidence строк; для txt/docx они достаются из "(conf=...)".
+    Возвращает ("", []) если ничего не найдено.
+    """
+    j = read_jsonl_if_exists(folder)
+    if j and j[0]:
+        return j
+    t = read_txt_if_exists(folder)
+    if not t:
+        t = read_docx_if_exists(folder)
+    if not t:
+        return "", []
+    return t, [float(m) for m in re.findall(r'\((?:low_)?conf=([0-9.]+)\)', t)]
+
 def load_text_from_output_folder(folder):
     """
-    Пытаемся получить текст результата OCR из папки (result.txt или result.docx).
+    Пытаемся получить текст результата OCR из папки (result.jsonl, result.txt или result.docx).
     Возвращает строку с текстом (или "" если ничего не найдено)
     """
-    t = read_txt_if_exists(folder)
-    if t:
-        return t
-    t2 = read_docx_if_exists(folder)
-    if t2:
-        return t2
-    return ""
+    return load_ocr_output(folder)[0]
+
+def load_quality(folder):
+    """
+    Сводка confidence документа: result.quality.json (пишет prod.py), а для
+    результатов без него — по столбцу scores из result.jsonl (без сборки
+    текста). None — нет ни того, ни другого.
+    """
+    path = os.path.join(folder, "result.quality.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    path = os.path.join(folder, "result.jsonl")
+    if not os.path.exists(path):
+        return None
+    from ocr_result import LOW_CONF, QualityStats, score_array
+    stats = QualityStats(LOW_CONF)
+    for rec in iter_jsonl_pages(path):
+        stats.add_scores(rec["page"], score_array(rec.get("scores"), len(rec.get("texts") or [])))
+    return stats.summary()
+
+def review_reasons(quality, min_mean=REVIEW_MIN_MEAN, max_low_share=REVIEW_MAX_LOW_SHARE):
+    """Почему документ нужно проверить вручную (пустой список — не нужно)."""
+    if quality is None:
+        return ["нет result.quality.json и result.jsonl"]
+    if not quality.get("scored"):
+        return ["нет распознанных строк"]
+    reasons = []
+    if quality["mean"] < min_mean:
+        reasons.append(f"средний confidence {quality['mean']:.2f} < {min_mean}")
+    if quality["low_share"] > max_low_share:
+        reasons.append(f"низких строк {quality['low_share']:.0%} > {max_low_share:.0%}")
+    return reasons
+
+SOURCE_FILES = ("result.jsonl", "result.txt", "result.docx")
+
+def source_fingerprints(folder):
+    """Отпечатки файлов результата OCR в папке (те, что существуют)."""
+    fps = {}
+    for name in SOURCE_FILES:
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            fps[name] = file_fingerprint(path)
+    return fps
+
+def sources_unchanged(folder, fps):
+    if not fps:
+        return False
+    present = {name for name in SOURCE_FILES if os.path.exists(os.path.join(folder, name))}
+    if present != set(fps):
+        return False
+    return all(file_unchanged(os.path.join(folder, name), fp) for name, fp in fps.items())
 
 # ---------- Нормализация и парсинг чисел/даты ----------
+# Все регулярные выражения компилируются один раз при импорте модуля.
+_RE_SPACES = re.compile(r'\s+')
+_RE_AMOUNT_KEEP = re.compile(r'[^\d\.,]')
+_RE_AMOUNT_DIGITS = re.compile(r'[^0-9\.]')
+_RE_DATE_NUM = re.compile(r'(\d{1,2}[.\-/]\d{1,2}[.\-/]\d{2,4})')
+_RE_DATE_RU = re.compile(r'(\d{1,2})\s+([А-Яа-яёЁ]+)\s+(\d{4})')
+_DATE_FORMATS = ("%d.%m.%Y", "%d.%m.%y", "%d-%m-%Y", "%d/%m/%Y", "%d/%m/%y", "%d-%m-%y")
+_RE_DATES_NUM = re.compile(r'\d{1,2}[.\-/]\d{1,2}[.\-/]\d{2,4}')
+_RE_DATES_RU = re.compile(r'\d{1,2}\s+[А-Яа-яёЁ]+\s+\d{4}')
+# number pattern with possible spaces and comma/dot decimals, e.g. 3 209 315,71 or 3209315.71
+_RE_NUMBER = re.compile(r'(\d{1,3}(?:[ \u00A0]\d{3})*(?:[.,]\d+)?|\d+(?:[.,]\d+)?)')
+
 def normalize_whitespace(s):
-    return re.sub(r'\s+', ' ', s).strip()
+    return _RE_SPACES.sub(' ', s).strip()
 
 def normalize_amount_str(s):
     """Пытаемся привести строку суммы к float-представлению (в строковом виде)."""
@@ -70,7 +219,7 @@ def normalize_amount_str(s):
         return None
     s = s.replace('\u00A0', '').replace('\u202F', '')  # NBSP
     # Оставим только цифры, пробелы, точку, запятую
-    s = re.sub(r'[^\d\.,]', '', s)
+    s = _RE_AMOUNT_KEEP.sub('', s)
     if not s:
         return None
     # Если есть и запятая и точка — считаем, что запятые это разделители тысяч
@@ -79,7 +228,7 @@ def normalize_amount_str(s):
     elif ',' in s and '.' not in s:
         s = s.replace(',', '.')
     # теперь удалим лишние символы кроме цифр и точки
-    s = re.sub(r'[^0-9\.]', '', s)
+    s = _RE_AMOUNT_DIGITS.sub('', s)
     if not s:
         return None
     try:
@@ -94,10 +243,10 @@ def try_parse_date(s):
         return None
     s = s.strip()
     # 1) ищем цифровые форматы dd.mm.yyyy / dd.mm.yy / dd/mm/yyyy etc
-    m = re.search(r'(\d{1,2}[.\-/]\d{1,2}[.\-/]\d{2,4})', s)
+    m = _RE_DATE_NUM.search(s)
     if m:
         ds = m.group(1)
-        for fmt in ("%d.%m.%Y", "%d.%m.%y", "%d-%m-%Y", "%d/%m/%Y", "%d/%m/%y", "%d-%m-%y"):
+        for fmt in _DATE_FORMATS:
             try:
                 dt = datetime.strptime(ds, fmt)
                 # нормализуем двухзначный год
@@ -107,7 +256,7 @@ def try_parse_date(s):
             except Exception:
                 pass
     # 2) ищем формат "12 декабря 2023" (русские месяцы)
-    m2 = re.search(r'(\d{1,2})\s+([А-Яа-яёЁ]+)\s+(\d{4})', s)
+    m2 = _RE_DATE_RU.search(s)
     if m2:
         d = m2.group(1)
         month_word = m2.group(2).lower()
@@ -121,36 +270,338 @@ def try_parse_date(s):
                 pass
     return None
 
-# ---------- Извлечение конкретных полей ----------
-def extract_contract_number(text):
+# одни и те же подстроки-даты встречаются во многих документах
+_parse_date_cached = lru_cache(maxsize=1 << 16)(try_parse_date)
+
+# ---------- Разобранный текст документа ----------
+class ParsedText:
     """
-    Ищем номер контракта:
-    - "№ SM-1712/22"
-    - "Договор № 24022311"
-    Возвращаем строку или None
+    Текст документа, разобранный один раз для всех экстракторов:
+    непустые строки, их lower-версии и кэш разобранных дат по номеру строки
+    (к ним возвращаются из окон соседних строк). Все обращения к соседним
+    строкам идут по индексу, поэтому разбор линеен по числу строк
+    (без lines.index и повторного парсинга).
     """
-    if not text:
+    __slots__ = ("text", "lines", "lows", "_first_index", "_line_dates", "_near_dates")
+
+    def __init__(self, text):
+        self.text = text or ""
+        self.lines = [l.strip() for l in self.text.splitlines() if l.strip()]
+        self.lows = [l.lower() for l in self.lines]
+        self._first_index = None
+        self._line_dates = {}
+        self._near_dates = {}
+
+    def first_index(self, i):
+        """То же, что lines.index(lines[i]): индекс первой строки с таким же текстом."""
+        if self._first_index is None:
+            first = {}
+            for j, ln in enumerate(self.lines):
+                first.setdefault(ln, j)
+            self._first_index = first
+        return self._first_index[self.lines[i]]
+
+    def line_date(self, i):
+        """try_parse_date(lines[i]) с кэшем по номеру строки."""
+        d = self._line_dates.get(i, False)
+        if d is False:
+            d = self._line_dates[i] = _parse_date_cached(self.lines[i])
+        return d
+
+    def date_near(self, idx, window=2):
+        """Дата в строке idx или в `window` строках после неё, иначе — в `window` строках перед ней."""
+        key = (idx, window)
+        if key in self._near_dates:
+            return self._near_dates[key]
+        found = None
+        for j in range(idx, min(len(self.lines), idx + window + 1)):
+            found = self.line_date(j)
+            if found:
+                break
+        if not found:
+            for j in range(max(0, idx - window), idx + 1):
+                found = self.line_date(j)
+                if found:
+                    break
+        self._near_dates[key] = found or None
+        return self._near_dates[key]
+
+def _as_parsed(text):
+    return text if isinstance(text, ParsedText) else ParsedText(text)
+
+# ---------- Извлечение конкретных полей ----------
+# Паттерны "Договор № X" / "ДОГОВОР № X" не нужны отдельно: любое их совпадение
+# совпадает и с более общим "№ X", который проверяется первым.
+_RE_CONTRACT_NO = re.compile(r'№\s*([A-ZА-ЯЁ0-9\-\._\/]{3,})', re.I)
+_RE_CONTRACT_NO_EN = re.compile(r'Contract\s*No\.?\s*([A-Z0-9\-\._\/]{3,})', re.I)
+_RE_CONTRACT_NO_SHORT = re.compile(r'\b([A-ZА-ЯЁ]{1,3}[-/]\d{2,6}[/]?\d{0,4})\b')
+
+DATE_START_MARKERS = ('дата заключения', 'дата подписания', 'дата договора', 'дата составления', 'подписан')
+DATE_END_MARKERS = ('дата окончания', 'срок действия', 'действует до', 'по ', 'до ')
+
+CURRENCY_WORDS = ('KZT', 'тенге', 'RUB', 'руб', 'руб.', 'рублей', 'USD', 'доллар', 'EUR', 'евро')
+_CURRENCY_WORDS_LOW = tuple((cw, cw.lower()) for cw in CURRENCY_WORDS)
+AMOUNT_KEYWORDS = ('сумма', 'стоимость', 'итого', 'цена', 'amount', 'total')
+
+ORG_FORMS = ('ООО', 'ОАО', 'ТОО', 'ПАО', 'ЗАО', 'ИП', 'LLP', 'LLC', 'TOO')
+COUNTERPARTY_MARKERS = ('покупатель', 'продавец', 'контрагент', 'поставщик', 'заказчик', 'исполнитель')
+_REPRESENTATIVE_TOKENS = ('в лице', 'действующ', 'директор')
+_RE_NAMED_AS = re.compile(r'(.{3,200}?)\s*,?\s*именуем', re.I)
+_RE_ORG_NAME = re.compile(r'((?:ООО|ТОО|ОАО|ЗАО|ПАО|LLP|LLC)[\s\S]{0,80})', re.I)
+
+_RE_CURRENCY_CODE = re.compile(r'\b(KZT|USD|EUR|RUB|руб|тенге|доллар|евро)\b', re.I)
+
+def _currency_in(low):
+    for cw, cw_low in _CURRENCY_WORDS_LOW:
+        if cw_low in low:
+            return cw
+    return None
+
+def _contract_number(doc):
+    if not doc.text:
         return None
     # маленькая пред-очистка
-    txt = text.replace('\n', ' ')
-    # паттерны с символом №
-    patterns = [
-        r'№\s*([A-ZА-ЯЁ0-9\-\._\/]{3,})',
-        r'Договор\s*№\s*([A-ZА-ЯЁ0-9\-\._\/]{3,})',
-        r'ДОГОВОР\s*№\s*([A-ZА-ЯЁ0-9\-\._\/]{3,})',
-        r'Contract\s*No\.?\s*([A-Z0-9\-\._\/]{3,})'
-    ]
-    for p in patterns:
-        m = re.search(p, txt, flags=re.I)
+    txt = doc.text.replace('\n', ' ')
+    for pattern in (_RE_CONTRACT_NO, _RE_CONTRACT_NO_EN):
+        m = pattern.search(txt)
         if m:
-            val = m.group(1).strip().strip('.,;:')
-            return val
+            return m.group(1).strip().strip('.,;:')
     # fallback: искать короткие токены, похожие на номер (буквы-цифры с дефисом)
-    m2 = re.search(r'\b([A-ZА-ЯЁ]{1,3}[-/]\d{2,6}[/]?\d{0,4})\b', txt)
+    m2 = _RE_CONTRACT_NO_SHORT.search(txt)
     if m2:
         return m2.group(1)
     return None
 
+# Построчные матчеры: feed(doc, i) смотрит строку i и выставляет done, когда
+# ответ окончателен; finish(doc) возвращает результат поля. Так все поля
+# извлекаются за один проход по строкам (см. extract_fields).
+class _DatesMatcher:
+    name = "dates"
+    __slots__ = ("done", "start", "end", "all_dates")
+
+    def __init__(self):
+        self.done = False
+        self.start = None
+        self.end = None
+        self.all_dates = []
+
+    def feed(self, doc, i):
+        low = doc.lows[i]
+        if not self.start and any(p in low for p in DATE_START_MARKERS):
+            self.start = doc.date_near(i, window=2)
+        if not self.end and any(p in low for p in DATE_END_MARKERS):
+            self.end = doc.date_near(i, window=2)
+        if self.start and self.end:
+            # обе даты найдены по контексту — общий список дат больше не нужен
+            self.done = True
+            return
+        # найти все подходящие числовые даты и русские
+        ln = doc.lines[i]
+        for m in _RE_DATES_NUM.findall(ln):
+            parsed = _parse_date_cached(m)
+            if parsed:
+                self.all_dates.append(parsed)
+        for m in _RE_DATES_RU.findall(ln):
+            parsed = _parse_date_cached(m)
+            if parsed:
+                self.all_dates.append(parsed)
+
+    def finish(self, doc):
+        date_start, date_end, all_dates = self.start, self.end, self.all_dates
+        # если не нашли контекстно — берём первую/последнюю дату документа
+        if not date_start and all_dates:
+            date_start = all_dates[0]
+        if not date_end and all_dates:
+            # if only one date -> date_end = None, else last
+            date_end = all_dates[-1] if len(all_dates) > 1 else None
+        return (date_start, date_end)
+
+class _AmountMatcher:
+    name = "amount"
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = False
+        self.result = None
+
+    def feed(self, doc, i):
+        low = doc.lows[i]
+        if any(k in low for k in AMOUNT_KEYWORDS):
+            m = _RE_NUMBER.search(doc.lines[i])
+            if m:
+                self.result = (normalize_amount_str(m.group(1)), _currency_in(low))
+                self.done = True
+
+    def finish(self, doc):
+        if self.result is not None:
+            return self.result
+        # строк с ключевыми словами нет — возможно, самая большая сумма и есть сумма контракта
+        best_val, best_i = None, None
+        for i in range(len(doc.lines)):
+            for m in _RE_NUMBER.findall(doc.lines[i]):
+                val = normalize_amount_str(m)
+                if val and (best_val is None or val > best_val):
+                    best_val, best_i = val, i
+        if best_val is not None:
+            return (best_val, _currency_in(doc.lows[best_i]))
+        return (None, None)
+
+class _CounterpartyMatcher:
+    name = "counterparty"
+    __slots__ = ("done", "named", "org", "marker")
+
+    def __init__(self):
+        self.done = False
+        self.named = None   # "<Название>, именуемое в дальнейшем ..."
+        self.org = None     # первая строка с формой организации
+        self.marker = None  # контекст первой строки с "Покупатель"/"Продавец"/...
+
+    def feed(self, doc, i):
+        ln, low = doc.lines[i], doc.lows[i]
+        if 'именуем' in low:
+            m = _RE_NAMED_AS.search(ln)
+            if m:
+                cand = m.group(1).strip().strip(',:;')
+                if len(cand) > 3:
+                    self.named = normalize_whitespace(cand)
+                    self.done = True
+                    return
+        if self.org is None and any(f in ln for f in ORG_FORMS):
+            cand = ln
+            # возможно название разнесено на несколько строк — соберём следующий кусок, если коротко
+            if len(cand) < 6:
+                idx = doc.first_index(i)
+                if idx + 1 < len(doc.lines):
+                    cand = (ln + " " + doc.lines[idx + 1]).strip()
+            self.org = normalize_whitespace(cand.strip(',:;'))
+        if self.marker is None and any(mk in low for mk in COUNTERPARTY_MARKERS):
+            self.marker = self._near_marker(doc, i)
+
+    @staticmethod
+    def _near_marker(doc, i):
+        lines, ln = doc.lines, doc.lines[i]
+        # e.g. "Покупатель, в лице директора ...: ООО X" — имя компании обычно после запятой
+        if ',' in ln:
+            after = ln.split(',', 1)[1].strip()
+            if after:
+                # если дальше "в лице"/"директор" — имя, скорее всего, на следующей строке
+                if any(tok in after.lower() for tok in _REPRESENTATIVE_TOKENS):
+                    if i + 1 < len(lines):
+                        return normalize_whitespace(lines[i + 1])
+                else:
+                    return normalize_whitespace(after)
+        # иначе — попробуем взять соседние строки (i-1..i+2)
+        combined = " ".join(lines[max(0, i - 1):min(len(lines), i + 3)])
+        m = _RE_ORG_NAME.search(combined)
+        if m:
+            return normalize_whitespace(m.group(1))
+        return normalize_whitespace(combined)
+
+    def finish(self, doc):
+        for cand in (self.named, self.org, self.marker):
+            if cand is not None:
+                return cand
+        return None
+
+class _PaymentCurrencyMatcher:
+    name = "payment_currency"
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = False
+        self.result = None
+
+    def feed(self, doc, i):
+        low = doc.lows[i]
+        if 'валюта платежа' in low or 'валюта договора' in low or low == 'валюта':
+            # ищем код валюты
+            m = _RE_CURRENCY_CODE.search(doc.lines[i])
+            if not m:
+                # возможно валюта в следующей строке (после первого вхождения такой же строки)
+                idx = doc.first_index(i)
+                if idx + 1 < len(doc.lines):
+                    m = _RE_CURRENCY_CODE.search(doc.lines[idx + 1])
+            if m:
+                self.result = m.group(1)
+                self.done = True
+
+    def finish(self, doc):
+        if self.result is not None:
+            return self.result
+        # fallback: первая валюта в документе
+        m = _RE_CURRENCY_CODE.search(doc.text)
+        return m.group(1) if m else None
+
+def _run_matchers(doc, matchers):
+    """Один проход по строкам; матчер, получивший окончательный ответ, выбывает."""
+    if metrics.ENABLED:
+        return _run_matchers_timed(doc, matchers)
+    active = [m for m in matchers if not m.done]
+    for i in range(len(doc.lines)):
+        if not active:
+            break
+        finished = False
+        for m in active:
+            m.feed(doc, i)
+            finished = finished or m.done
+        if finished:
+            active = [m for m in active if not m.done]
+    return [m.finish(doc) for m in matchers]
+
+def _run_matchers_timed(doc, matchers):
+    """То же, что _run_matchers, но с временем каждого экстрактора (extract.<поле>) в metrics."""
+    perf = time.perf_counter
+    spent = [0.0] * len(matchers)
+    active = [(k, m) for k, m in enumerate(matchers) if not m.done]
+    for i in range(len(doc.lines)):
+        if not active:
+            break
+        finished = False
+        for k, m in active:
+            t0 = perf()
+            m.feed(doc, i)
+            spent[k] += perf() - t0
+            finished = finished or m.done
+        if finished:
+            active = [(k, m) for k, m in active if not m.done]
+    results = []
+    for k, m in enumerate(matchers):
+        t0 = perf()
+        results.append(m.finish(doc))
+        metrics.observe(f"extract.{m.name}", spent[k] + perf() - t0)
+    return results
+
+def extract_fields(text):
+    """
+    Все поля документа за один проход по строкам (тот же результат, что и у
+    отдельных extract_* ниже). Возвращает OrderedDict:
+    contract_number, date_start, date_end, counterparty, amount, currency, payment_currency.
+    """
+    with metrics.timed("split_lines"):
+        doc = _as_parsed(text)
+    (date_start, date_end), (amount, currency), counterparty, payment_currency = _run_matchers(
+        doc, [_DatesMatcher(), _AmountMatcher(), _CounterpartyMatcher(), _PaymentCurrencyMatcher()])
+    with metrics.timed("extract.contract_number"):
+        contract_number = _contract_number(doc)
+    return OrderedDict([
+        ("contract_number", contract_number),
+        ("date_start", date_start),
+        ("date_end", date_end),
+        ("counterparty", counterparty),
+        ("amount", amount),
+        ("currency", currency),
+        ("payment_currency", payment_currency),
+    ])
+
+def extract_contract_number(text):
+    """
+    Ищем номер контракта:
+    - "№ SM-1712/22"
+    - "Договор № 24022311"
+    Возвращаем строку или None
+    """
+    return _contract_number(_as_parsed(text))
+
 def extract_dates(text):
     """
     Возвращает (date_start_iso, date_end_iso) или (None, None).
@@ -158,71 +609,7 @@ def extract_dates(text):
       - ищем контекстные маркеры "дата заключения", "срок действия" и т.д.
       - если маркеров нет — собираем все найденные даты и возвращаем первый/последний как догадку.
     """
-    if not text:
-        return (None, None)
-
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
-    joined = "\n".join(lines)
-
-    start_patterns = ['дата заключения', 'дата подписания', 'дата договора', 'дата составления', 'подписан']
-    end_patterns = ['дата окончания', 'срок действия', 'действует до', 'по ', 'до ']
-
-    # helper: find date in string or nearby lines
-    def find_date_near(idx, window=1):
-        # check this line and next `window` lines
-        for j in range(idx, min(len(lines), idx + window + 1)):
-            d = try_parse_date(lines[j])
-            if d:
-                return d
-        # also check previous line
-        for j in range(max(0, idx - window), idx + 1):
-            d = try_parse_date(lines[j])
-            if d:
-                return d
-        return None
-
-    # scan lines for start / end patterns
-    date_start = None
-    date_end = None
-    for i, ln in enumerate(lines):
-        low = ln.lower()
-        for pat in start_patterns:
-            if pat in low and not date_start:
-                d = find_date_near(i, window=2)
-                if d:
-                    date_start = d
-        for pat in end_patterns:
-            if pat in low and not date_end:
-                d = find_date_near(i, window=2)
-                if d:
-                    date_end = d
-
-    # если не нашли контекстно — просто найдём все даты в документе
-    all_dates = []
-    for ln in lines:
-        # найти все подходящие числовые даты и русские
-        for m in re.findall(r'\d{1,2}[.\-/]\d{1,2}[.\-/]\d{2,4}', ln):
-            parsed = try_parse_date(m)
-            if parsed:
-                all_dates.append(parsed)
-        # Russian month style
-        m2 = re.findall(r'\d{1,2}\s+[А-Яа-яёЁ]+\s+\d{4}', ln)
-        for mm in m2:
-            parsed = try_parse_date(mm)
-            if parsed:
-                all_dates.append(parsed)
-
-    # fallback assignment
-    if not date_start and all_dates:
-        date_start = all_dates[0]
-    if not date_end and all_dates:
-        # if only one date -> date_end = None, else last
-        if len(all_dates) > 1:
-            date_end = all_dates[-1]
-        else:
-            date_end = None
-
-    return (date_start, date_end)
+    return _run_matchers(_as_parsed(text), [_DatesMatcher()])[0]
 
 def extract_amount_and_currency(text):
     """
@@ -230,221 +617,325 @@ def extract_amount_and_currency(text):
     Ищем строки с ключевыми словами 'сумма', 'стоимость', 'цена', 'итого'.
     Возвращаем (amount_float, currency_str) или (None, None)
     """
-    if not text:
-        return (None, None)
-
-    text_lines = [l.strip() for l in text.splitlines() if l.strip()]
-
-    # currency keywords
-    currency_words = ['KZT', 'тенге', 'RUB', 'руб', 'руб.', 'рублей', 'USD', 'доллар', 'EUR', 'евро']
-    # number pattern with possible spaces and comma/dot decimals, e.g. 3 209 315,71 or 3209315.71
-    num_pat = re.compile(r'(\d{1,3}(?:[ \u00A0]\d{3})*(?:[.,]\d+)?|\d+(?:[.,]\d+)?)')
-
-    # 1) Поиск по строкам с ключевыми словами
-    for ln in text_lines:
-        low = ln.lower()
-        if any(k in low for k in ['сумма', 'стоимость', 'итого', 'цена', 'amount', 'total']):
-            # попробуем найти число в этой строк
-            m = num_pat.search(ln)
-            if m:
-                raw_num = m.group(1)
-                amount = normalize_amount_str(raw_num)
-                # найти валюту в той же строке
-                cur = None
-                for cw in currency_words:
-                    if cw.lower() in ln.lower():
-                        cur = cw
-                        break
-                return (amount, cur)
-
-    # 2) Если не нашли — искать явные большие числа в документе (возможно общая сумма)
-    all_nums = []
-    for ln in text_lines:
-        for m in num_pat.findall(ln):
-            val = normalize_amount_str(m)
-            if val:
-                all_nums.append((val, ln))
-    if all_nums:
-        # возможно самая большая сумма — это сумма контракта
-        all_nums_sorted = sorted(all_nums, key=lambda x: x[0], reverse=True)
-        val, src_ln = all_nums_sorted[0]
-        cur = None
-        for cw in currency_words:
-            if cw.lower() in src_ln.lower():
-                cur = cw
-                break
-        return (val, cur)
-
-    return (None, None)
+    return _run_matchers(_as_parsed(text), [_AmountMatcher()])[0]
 
 def extract_counterparty(text):
     """
     Пытаемся извлечь название контрагента (Продавец/Покупатель/Контрагент/Поставщик)
-    Используем несколько эвристик:
+    Используем несколько эвристик (в порядке приоритета):
       - ищем 'именуемое в дальнейшем' и берём часть, предшествующую этой фразе
       - ищем строки с формой организации (ООО, ТОО, ОАО и т.п.)
       - ищем строки с ключевыми маркерами 'Покупатель', 'Продавец', 'Контрагент'
     """
-    if not text:
-        return None
-
-    txt = text.replace('\r', '\n')
-    lines = [l.strip() for l in txt.splitlines() if l.strip()]
-
-    # 1) Ищем "именуемое в дальнейшем" (часто формат: "<Название>, именуемое в дальнейшем Продавец")
-    for ln in lines:
-        if 'именуем' in ln.lower():
-            # возьмём часть до "именуем"
-            m = re.search(r'(.{3,200}?)\s*,?\s*именуем', ln, flags=re.I)
-            if m:
-                cand = m.group(1).strip().strip(',:;')
-                if len(cand) > 3:
-                    return normalize_whitespace(cand)
-
-    # 2) Ищем строки с формами организации
-    forms = ['ООО', 'ОАО', 'ТОО', 'ПАО', 'ЗАО', 'ИП', 'LLP', 'LLC', 'TOO']
-    for ln in lines:
-        for f in forms:
-            if f in ln:
-                # берем всю строку или часть до запятой
-                cand = ln
-                # возможно название разнесено на несколько строк — соберём следующий кусок, если коротко
-                if len(cand) < 6:
-                    # попробуем собрать текущую и следующую
-                    idx = lines.index(ln)
-                    if idx + 1 < len(lines):
-                        cand = (ln + " " + lines[idx + 1]).strip()
-                return normalize_whitespace(cand.strip(',:;'))
-
-    # 3) Ищем контекстные ключи "Покупатель", "Продавец", "Контрагент", "Поставщик"
-    markers = ['покупатель', 'продавец', 'контрагент', 'поставщик', 'заказчик', 'исполнитель']
-    for i, ln in enumerate(lines):
-        low = ln.lower()
-        for mk in markers:
-            if mk in low:
-                # попробуем взять часть строки после маркера
-                # e.g. "Покупатель, в лице директора ...: ООО X"
-                # если в строке есть запятая — берем остаток
-                if ',' in ln:
-                    # обычно имя компании позже, возьмём часть после запятой
-                    after = ln.split(',', 1)[1].strip()
-                    if after:
-                        # возможно следующий токен — имя компании или "в лице" — тогда берем следующую строку
-                        if any(tok in after.lower() for tok in ['в лице', 'действующ', 'директор']):
-                            # берем следующую строку, если есть
-                            if i + 1 < len(lines):
-                                cand = lines[i + 1]
-                                return normalize_whitespace(cand)
-                        else:
-                            return normalize_whitespace(after)
-                # иначе — попробуем взять соседние строки (i-1..i+1)
-                combined = " ".join(lines[max(0, i-1):min(len(lines), i+3)])
-                # try to pull name-like substring from combined
-                m = re.search(r'((?:ООО|ТОО|ОАО|ЗАО|ПАО|LLP|LLC)[\s\S]{0,80})', combined, flags=re.I)
-                if m:
-                    return normalize_whitespace(m.group(1))
-                # fallback: return the whole combined context
-                return normalize_whitespace(combined)
-
-    return None
+    return _run_matchers(_as_parsed(text), [_CounterpartyMatcher()])[0]
 
 def extract_payment_currency(text):
     """
     Пытаемся найти валюта платежа по ключевой фразе 'валюта платежа' или 'валюта договора'
     """
-    if not text:
-        return None
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
-    for ln in lines:
-        low = ln.lower()
-        if 'валюта платежа' in low or 'валюта договора' in low or 'валюта' == low.strip():
-            # ищем код валюты
-            m = re.search(r'\b(KZT|USD|EUR|RUB|руб|тенге|доллар|евро)\b', ln, flags=re.I)
-            if m:
-                return m.group(1)
-            # возможно валюта в следующей строке
-            idx = lines.index(ln)
-            if idx + 1 < len(lines):
-                m2 = re.search(r'\b(KZT|USD|EUR|RUB|руб|тенге|доллар|евро)\b', lines[idx+1], flags=re.I)
-                if m2:
-                    return m2.group(1)
-    # fallback: искать частую валюту в документе
-    m = re.search(r'\b(KZT|USD|EUR|RUB|руб|тенге|доллар|евро)\b', text, flags=re.I)
-    if m:
-        return m.group(1)
-    return None
+    return _run_matchers(_as_parsed(text), [_PaymentCurrencyMatcher()])[0]
 
 # ---------- Основной обработчик папок ----------
-def process_all_outputs():
+def _read_sources(folder):
+    """Отпечатки источников и результат OCR папки: (fps, text, confs)."""
+    fps = source_fingerprints(folder)
+    with metrics.timed("load_ocr_output"):
+        text, confs = load_ocr_output(folder)
+    return fps, text, confs
+
+def _read_ahead(folder):
+    """_read_sources для упреждающего чтения: при ошибке None, папку перечитает синхронный разбор."""
+    try:
+        return _read_sources(folder)
+    except Exception:
+        return None
+
+def _write_parsed_json(path, obj):
+    with metrics.timed("write_parsed_json"), open(path, "w", encoding="utf-8") as jf:
+        json.dump(obj, jf, ensure_ascii=False, indent=2)
+
+def parse_folder(folder, sources=None, io=None):
+    """
+    Разбор одной папки data/output: читает результат OCR, извлекает поля,
+    пишет parsed.json рядом. Ничего не печатает — сообщения возвращаются
+    списком, чтобы при параллельном разборе вывод папок не перемешивался.
+    sources — уже прочитанный _read_sources(folder) (упреждающее чтение),
+    io — aio.AsyncIO: parsed.json пишется в фоне.
+    Возвращает (rec или None, отпечатки источников, сообщения, секунды).
     """
-    Проходим по всем подпапкам в data/output, в каждой ищем result.txt/result.docx,
+    t0 = time.perf_counter()
+    name = os.path.basename(folder)
+    log = []
+    fps, text, confs = sources if sources is not None else _read_sources(folder)
+    if not text:
+        log.append("  [WARN] Текст не найден в папке (result.jsonl/result.txt/result.docx). Пропускаем.")
+        return None, fps, log, time.perf_counter() - t0
+
+    # извлечём основные поля (один проход по строкам)
+    fields = extract_fields(text)
+
+    # средний confidence: из result.jsonl напрямую, иначе из скобок "(conf=0.97)"
+    import numpy as np
+    from ocr_result import LOW_CONF, conf_stats
+    confs = np.asarray(confs, dtype=np.float64)
+    avg_conf = float(confs.mean()) if confs.size else None
+    quality = conf_stats(confs, LOW_CONF)
+
+    rec = OrderedDict([("file_folder", name)])
+    rec.update(fields)
+    rec["avg_confidence"] = avg_conf
+
+    # Сохраняем подробный JSON с raw_text и найденными полями рядом в папке
+    parsed_json_path = os.path.join(folder, "parsed.json")
+    save_obj = {
+        "file_folder": name,
+        "fields": rec,
+        "confidence": quality,
+        "needs_review": review_reasons(quality),
+        "raw_text_preview": "\n".join(text.splitlines()[:40])
+    }
+    if io is not None:
+        io.submit(parsed_json_path, _write_parsed_json, parsed_json_path, save_obj)
+    else:
+        _write_parsed_json(parsed_json_path, save_obj)
+    metrics.inc("documents")
+    if confs.size:
+        metrics.inc("lines", int(confs.size))
+        metrics.inc("low_conf_lines", int(np.count_nonzero(confs < metrics.LOW_CONF_THRESHOLD)))
+
+    log.append("  Найдено:")
+    log.append(f"    contract_number: {rec['contract_number']}")
+    log.append(f"    date_start: {rec['date_start']}, date_end: {rec['date_end']}")
+    log.append(f"    counterparty: {rec['counterparty']}")
+    log.append(f"    amount: {rec['amount']}  currency: {rec['currency']}")
+    log.append(f"    payment_currency: {rec['payment_currency']}  avg_conf: {avg_conf}")
+    return rec, fps, log, time.perf_counter() - t0
+
+def _init_worker(metrics_settings, layout_settings):
+    import layout
+    metrics.configure(*metrics_settings)
+    layout.configure(*layout_settings)
+
+def _parse_task(folder):
+    """parse_folder под профилировщиком документа; замеры процесса уходят вместе с результатом."""
+    with metrics.profile_document(os.path.basename(folder)):
+        result = parse_folder(folder)
+    return result, (metrics.METRICS.snapshot(reset=True) if metrics.ENABLED else None)
+
+def _iter_parsed(folders, workers, io=None):
+    """
+    parse_folder по списку папок в исходном порядке.
+    workers > 1 — пул процессов (imap сохраняет порядок, результаты идут по мере готовности).
+    Последовательно с io (aio.AsyncIO) источники следующих папок читаются
+    заранее, пока разбирается текущая, а parsed.json пишется в фоне.
+    """
+    if workers <= 1 or len(folders) <= 1:
+        ahead = {}
+        window = 2 * io.concurrency if io is not None else 0
+        for i, folder in enumerate(folders):
+            for nxt in folders[i:i + 1 + window] if window else ():
+                if nxt not in ahead:
+                    # ключ чтения — не путь parsed.json: ошибки чтения не попадают в flush_io
+                    ahead[nxt] = io.submit(("read", nxt), _read_ahead, nxt)
+            sources = None
+            if folder in ahead:
+                # None — чтение не удалось; читаем синхронно — упадёт как раньше
+                sources = ahead.pop(folder).result()
+            with metrics.profile_document(os.path.basename(folder)):
+                result = parse_folder(folder, sources=sources, io=io)
+            yield result
+        return
+    import multiprocessing as mp
+    import layout
+    ctx = mp.get_context("spawn")
+    chunksize = max(1, min(16, len(folders) // (4 * workers)))
+    with ctx.Pool(processes=min(workers, len(folders)), initializer=_init_worker,
+                  initargs=(metrics.settings(), layout.settings())) as pool:
+        for result, snap in pool.imap(_parse_task, folders, chunksize=chunksize):
+            if snap:
+                metrics.METRICS.merge(snap)
+            yield result
+
+def process_all_outputs(force=False, workers=PARSE_WORKERS, result_format=RESULT_FORMAT,
+                        checkpoint_every=CHECKPOINT_EVERY, io_workers=PARSE_IO_WORKERS):
+    """
+    Проходим по всем подпапкам в data/output, в каждой ищем result.jsonl/result.txt/result.docx,
     парсим и собираем итоговую таблицу.
+    Папки, у которых результат OCR не менялся с прошлого запуска (см. манифест),
+    не парсятся заново: их строки берутся из манифеста.
+    force=True — распарсить всё заново.
+    workers > 1 — разбирать папки параллельно; таблица и манифест пишутся только здесь.
+    Таблица пишется потоково (см. sinks.py) в формате result_format
+    (xlsx/csv/parquet); каждые checkpoint_every строк записанное фиксируется
+    вместе с манифестом.
+    io_workers > 0 — при последовательном разборе читать источники заранее
+    и писать parsed.json в фоне (см. aio.py); перед сохранением манифеста
+    фоновые записи дожидаются. Разбор при других настройках склейки строк
+    (layout.signature(), --raw-lines) устарел и повторяется.
     """
+    import layout
     if not os.path.exists(OUTPUT_BASE):
         print(f"[FATAL] Папка с результатами OCR не найдена: {OUTPUT_BASE}")
         return
 
-    folders = [os.path.join(OUTPUT_BASE, d) for d in os.listdir(OUTPUT_BASE)
-               if os.path.isdir(os.path.join(OUTPUT_BASE, d))]
+    folders = sorted(os.path.join(OUTPUT_BASE, d) for d in os.listdir(OUTPUT_BASE)
+                     if os.path.isdir(os.path.join(OUTPUT_BASE, d)))
 
-    records = []
-    for folder in sorted(folders):
+    manifest = Manifest(PARSE_MANIFEST_PATH)
+    # текст для экстракторов собирается склейкой строк: при других её настройках разбор устарел
+    layout_sig = layout.signature()
+    todo = []
+    cached = {}
+    for folder in folders:
         name = os.path.basename(folder)
-        print(f"\n[PARSE] {name}")
-        text = load_text_from_output_folder(folder)
-        if not text:
-            print("  [WARN] Текст не найден в папке (result.txt/result.docx). Пропускаем.")
-            continue
-
-        # извлечём основные поля
-        contract_no = extract_contract_number(text)
-        date_start, date_end = extract_dates(text)
-        amount, currency = extract_amount_and_currency(text)
-        counterparty = extract_counterparty(text)
-        payment_currency = extract_payment_currency(text)
-
-        # также соберём средний confidence если есть (парсим скобки "(conf=0.97)")
-        confs = [float(m) for m in re.findall(r'\(conf=([0-9.]+)\)', text)]
-        avg_conf = (sum(confs) / len(confs)) if confs else None
-
-        rec = OrderedDict([
-            ("file_folder", name),
-            ("contract_number", contract_no),
-            ("date_start", date_start),
-            ("date_end", date_end),
-            ("counterparty", counterparty),
-            ("amount", amount),
-            ("currency", currency),
-            ("payment_currency", payment_currency),
-            ("avg_confidence", avg_conf)
-        ])
-        records.append(rec)
-
-        # Сохраняем подробный JSON с raw_text и найденными полями рядом в папке
-        parsed_json_path = os.path.join(folder, "parsed.json")
-        save_obj = {
-            "file_folder": name,
-            "fields": rec,
-            "raw_text_preview": "\n".join(text.splitlines()[:40])
-        }
-        with open(parsed_json_path, "w", encoding="utf-8") as jf:
-            json.dump(save_obj, jf, ensure_ascii=False, indent=2)
-
-        print("  Найдено:")
-        print(f"    contract_number: {contract_no}")
-        print(f"    date_start: {date_start}, date_end: {date_end}")
-        print(f"    counterparty: {counterparty}")
-        print(f"    amount: {amount}  currency: {currency}")
-        print(f"    payment_currency: {payment_currency}  avg_conf: {avg_conf}")
+        entry = manifest.get(name)
+        if (not force and entry and os.path.exists(os.path.join(folder, "parsed.json"))
+                and entry.get("layout") == layout_sig
+                and sources_unchanged(folder, entry.get("sources"))):
+            cached[folder] = OrderedDict(entry["record"])
+        else:
+            todo.append(folder)
+
+    # приёмник открываем до разбора, чтобы ошибка формата (нет pyarrow и т.п.) была сразу
+    sink = open_sink(result_format, RESULT_XLSX, RESULT_COLUMNS)
+    io = None
+    if io_workers > 0 and workers <= 1 and len(todo) > 1:
+        from aio import AsyncIO
+        io = AsyncIO(concurrency=io_workers)
+
+    def flush_io():
+        # parsed.json должен быть на диске раньше, чем манифест сошлётся на него
+        if io is None:
+            return
+        for key, _ in io.drain():
+            # в фоне пишется только parsed.json: ключ — его путь внутри папки документа
+            if isinstance(key, str):
+                manifest.remove(os.path.basename(os.path.dirname(key)))
+
+    t0 = time.perf_counter()
+    seen = set()
+    changed = 0
+    parsed = _iter_parsed(todo, workers, io=io)
+    done = 0
+    try:
+        for folder in folders:
+            name = os.path.basename(folder)
+            rec = cached.get(folder)
+            if rec is None:
+                rec, fps, log, elapsed = next(parsed)
+                done += 1
+                print(f"\n[PARSE] {done}/{len(todo)} {name} ({elapsed:.2f} с)")
+                print("\n".join(log))
+                if rec is None:
+                    manifest.remove(name)
+                    continue
+                changed += 1
+                manifest.set(name, {"sources": fps, "record": rec, "layout": layout_sig})
+
+            # строка сразу уходит в таблицу, в памяти записи не копятся
+            sink.write(rec)
+            seen.add(name)
+            if checkpoint_every and sink.rows % checkpoint_every == 0:
+                sink.checkpoint()
+                flush_io()
+                manifest.flush()
+    except BaseException:
+        sink.abort()
+        if io is not None:
+            flush_io()
+            io.close()
+        manifest.save()
+        raise
+    if io is not None:
+        flush_io()
+        io.close()
+    if todo:
+        elapsed = time.perf_counter() - t0
+        print(f"\n[PARSE] разобрано папок: {len(todo)} за {elapsed:.2f} с "
+              f"({len(todo) / elapsed if elapsed > 0 else 0.0:.1f} папок/с, процессов: {max(1, workers)})")
+
+    # папки, которых больше нет, убираем из манифеста
+    for n in [n for n in manifest.entries if n not in seen]:
+        manifest.remove(n)
+    manifest.save()
+    if cached:
+        print(f"\n[SKIP] Без изменений: {len(cached)} папок")
 
     # Сохраняем итоговую таблицу
-    if records:
-        df = pd.DataFrame(records)
-        # записываем в Excel
-        df.to_excel(RESULT_XLSX, index=False)
-        print(f"\n[OK] Итог сохранён в {RESULT_XLSX} (строк: {len(records)})")
+    if sink.rows:
+        sink.close()
+        print(f"\n[OK] Итог сохранён в {sink.path} (строк: {sink.rows}, изменено: {changed})")
     else:
+        sink.abort()
         print("\n[WARN] Нет данных для сохранения.")
 
+def route_for_review(path=REVIEW_PATH, min_mean=REVIEW_MIN_MEAN, max_low_share=REVIEW_MAX_LOW_SHARE):
+    """
+    Быстрый режим: отбирает документы на ручную проверку только по сводкам
+    confidence (load_quality), не читая и не разбирая их текст. Пишет в path
+    CSV с отобранными папками и причинами; возвращает их список.
+    """
+    if not os.path.exists(OUTPUT_BASE):
+        print(f"[FATAL] Папка с результатами OCR не найдена: {OUTPUT_BASE}")
+        return []
+    t0 = time.perf_counter()
+    folders = sorted(os.path.join(OUTPUT_BASE, d) for d in os.listdir(OUTPUT_BASE)
+                     if os.path.isdir(os.path.join(OUTPUT_BASE, d)))
+    flagged = []
+    for folder in folders:
+        quality = load_quality(folder)
+        reasons = review_reasons(quality, min_mean, max_low_share)
+        if reasons:
+            flagged.append((os.path.basename(folder), reasons, quality or {}))
+
+    import csv
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(("file_folder", "reasons", "mean", "p10", "low_share", "lines", "worst_pages"))
+        for name, reasons, q in flagged:
+            worst = " ".join(str(p["page"]) for p in q.get("worst_pages", []))
+            w.writerow((name, "; ".join(reasons), q.get("mean"), q.get("p10"), q.get("low_share"),
+                        q.get("lines"), worst))
+    os.replace(tmp_path, path)
+    print(f"[REVIEW] на проверку: {len(flagged)} из {len(folders)} папок за "
+          f"{time.perf_counter() - t0:.2f} с → {path}")
+    return flagged
+
 if __name__ == "__main__":
-    process_all_outputs()
+    import argparse
+    ap = argparse.ArgumentParser(description="Извлечение полей из результатов OCR в results.xlsx")
+    ap.add_argument("--force", action="store_true",
+                    help="распарсить все папки заново, не глядя в манифест")
+    ap.add_argument("--workers", type=int, default=PARSE_WORKERS,
+                    help="число процессов для разбора папок (по умолчанию 1)")
+    ap.add_argument("--format", choices=sorted(SINKS), default=RESULT_FORMAT,
+                    help="формат итоговой таблицы (по умолчанию xlsx)")
+    ap.add_argument("--io-workers", type=int, default=PARSE_IO_WORKERS,
+                    help="фоновых операций чтения/записи при --workers 1 (0 — синхронно)")
+    ap.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY,
+                    help="фиксировать таблицу и манифест каждые N строк (0 — только в конце); "
+                         "xlsx собирается целиком только в конце, для него фиксируется лишь манифест")
+    ap.add_argument("--raw-lines", action="store_true",
+                    help="разбирать фрагменты детекции как есть, без склейки строк по рамкам (layout.py)")
+    ap.add_argument("--review", action="store_true",
+                    help="только отобрать документы на ручную проверку по confidence (review.csv), без разбора")
+    ap.add_argument("--metrics", default=None,
+                    help="выгрузить замеры экстракторов и счётчики: *.prom — Prometheus, иначе JSON lines")
+    ap.add_argument("--profile", default=None,
+                    help="каталог для cProfile-профилей по папкам")
+    args = ap.parse_args()
+    if args.metrics or args.profile:
+        metrics.configure(enabled=True, profile_dir=args.profile)
+    if args.raw_lines:
+        import layout
+        layout.configure(enabled=False)
+    if args.review:
+        route_for_review()
+        raise SystemExit(0)
+    process_all_outputs(force=args.force, workers=args.workers, result_format=args.format,
+                        checkpoint_every=args.checkpoint_every, io_workers=args.io_workers)
+    if metrics.ENABLED:
+        metrics.print_summary()
+        if args.metrics:
+            metrics.dump(args.metrics, script="parser")
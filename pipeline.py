@@ -0,0 +1,408 @@
+# pipeline.py — параллельный пакетный режим для prod.py
+"""
+Многопроцессный конвейер обработки папки scans:
+
+    растеризация (пул процессов) -> OCR (M процессов, у каждого тёплый движок)
+        -> запись docx/txt (поток в главном процессе)
+
+Стадии связаны ограниченными очередями: если OCR не успевает, растеризаторы
+блокируются на put() и не накапливают страницы в памяти. Поток записи
+восстанавливает порядок страниц, поэтому result.txt / result.docx получаются
+такими же, как при последовательном запуске. Если OCR-процессы умирают
+(OOM, падение движка), конвейер не зависает: растеризаторы останавливаются,
+а документы с недошедшими страницами считаются необработанными.
+"""
+import os
+import time
+import queue
+import threading
+import multiprocessing as mp
+
+import prod
+import metrics
+import triage
+from batching import merge_stats, print_rec_stats
+
+WORKER_POLL = 1.0  # сек между проверками, живы ли процессы конвейера
+
+# ---------- Воркеры ----------
+def _raster_worker(task_q, page_q, result_q, dpi, poppler_path, metrics_settings, triage_settings):
+    """
+    Берёт задания (basename, pdf_path, out_dir, page_idx) и отдаёт страницы массивами.
+    С triage пустые страницы сразу уходят в запись, минуя OCR, а страница
+    растеризуется в DPI, выбранном triage.assess; для страниц ниже dpi
+    в OCR передаётся (pdf_path, DPI) — для повтора при низком confidence.
+    """
+    metrics.configure(*metrics_settings)
+    triage.configure(*triage_settings)
+    tstats = triage.TriageStats(dpi)
+    raster_dpi = triage.dpi_ladder(dpi)[0] if triage.ENABLED else dpi
+    while True:
+        task = task_q.get()
+        if task is None:
+            break
+        basename, pdf_path, out_dir, page_idx = task
+        try:
+            t0 = time.perf_counter()
+            page = prod.rasterize_page(pdf_path, page_idx, dpi=raster_dpi, poppler_path=poppler_path)
+            raster_sec = time.perf_counter() - t0
+            metrics.observe("raster", raster_sec)
+            retry = None
+            if triage.ENABLED:
+                decision, page = prod.triage_page(pdf_path, page_idx, page, raster_dpi, poppler_path,
+                                                  tstats, raster_sec, basename)
+                if decision.blank:
+                    result_q.put(("page", basename, page_idx, [], None, False))
+                    continue
+                if decision.dpi < dpi:
+                    retry = (pdf_path, decision.dpi)
+            if prod.SAVE_PAGE_IMAGES:
+                with metrics.timed("save_image"):
+                    prod.save_page_image(page, out_dir, page_idx)
+            with metrics.timed("to_array"):
+                image = prod.page_to_array(page)
+            del page
+            page_q.put((basename, page_idx, image, None, retry))
+        except Exception as e:
+            page_q.put((basename, page_idx, None, f"не удалось конвертировать: {e}", None))
+    if triage.ENABLED:
+        result_q.put(("triage", tstats.snapshot()))
+    if metrics.ENABLED:
+        result_q.put(("metrics", metrics.METRICS.snapshot()))
+
+def _ocr_worker(page_q, result_q, rec_batch_size, rec_max_wait, metrics_settings, triage_settings,
+                poppler_path=None):
+    """
+    Держит свой движок и распознаёт страницы, пока не получит None.
+    При rec_batch_size > 0 строки страниц разных документов собираются
+    в общие пакеты распознавания (batching.RecBatcher).
+    Страницы, распознанные triage ниже полного DPI, при низком confidence
+    распознаются ещё раз в полном DPI (prod.retry_full_dpi).
+    """
+    metrics.configure(*metrics_settings)
+    triage.configure(*triage_settings)
+    tstats = triage.TriageStats(prod.DPI)
+    retries = {}  # (basename, page_idx) -> (pdf_path, dpi)
+    ocr = prod.get_ocr_engine()
+    batcher = prod.make_rec_batcher(ocr, rec_batch_size, rec_max_wait)
+
+    def send(ready):
+        for (basename, page_idx), pairs, error in ready:
+            retry = retries.pop((basename, page_idx), None)
+            if retry is not None and error is None:
+                pdf_path, dpi = retry
+                pairs = prod.retry_full_dpi(ocr, pdf_path, page_idx, pairs, dpi, poppler_path,
+                                            tstats, basename)
+            result_q.put(("page", basename, page_idx, pairs, error, False))
+
+    while True:
+        try:
+            # пока копится неполный пакет, ждём новые страницы не дольше его дедлайна
+            item = page_q.get(timeout=batcher.time_left() if batcher is not None else None)
+        except queue.Empty:
+            send(batcher.poll())
+            continue
+        if item is None:
+            break
+        basename, page_idx, image, error, retry = item
+        key = (basename, page_idx)
+        if image is None:
+            send([(key, None, error)])
+            continue
+        if retry is not None:
+            retries[key] = retry
+        tstats.add("ocr_pages")
+        t0 = time.perf_counter()
+        try:
+            if batcher is not None:
+                send(batcher.add_page(key, image))
+            else:
+                send([(key, prod.page_lines(prod.run_ocr(ocr, image), ocr), None)])
+        except Exception as e:
+            send([(key, None, f"OCR упал: {e}")])
+        tstats.add("ocr_sec", time.perf_counter() - t0)
+        del image
+
+    if batcher is not None:
+        t0 = time.perf_counter()
+        send(batcher.flush())
+        tstats.add("ocr_sec", time.perf_counter() - t0)
+        result_q.put(("rec_stats", batcher.stats))
+    if triage.ENABLED:
+        result_q.put(("triage", tstats.snapshot()))
+    result_q.put(("stats", dict(prod.ENGINE_STATS)))
+    if metrics.ENABLED:
+        result_q.put(("metrics", metrics.METRICS.snapshot()))
+
+# ---------- Запись ----------
+class _DocState:
+    def __init__(self, basename, pdf_path, out_dir, page_count, pdf_hash=None):
+        self.basename = basename
+        self.pdf_path = pdf_path
+        self.pdf_hash = pdf_hash
+        self.out_dir = out_dir
+        self.page_count = page_count
+        self.next_page = 1
+        self.pending = {}
+        self.writer = None
+        self.complete = False
+        self.failed = False
+        self.done = False       # result.* подменены или запись брошена
+
+def _writer_thread(result_q, docs, stats, rec_stats, cache, io=None, triage_stats=None, journal=None,
+                   stop=None):
+    """
+    Собирает результаты OCR, упорядочивает страницы каждого документа
+    и пишет их через prod.ReportWriter; новые результаты кладёт в кэш.
+    result.* документа подменяются, только если пришли все его страницы и
+    без ошибок; иначе запись бросается (ReportWriter.abort) и прежние
+    результаты остаются. Завершается по сообщению ("eof",) или по stop
+    (threading.Event, прерывание прогона) — тогда бросаются все незакрытые.
+    """
+    while True:
+        if stop is not None and stop.is_set():
+            for st in docs.values():
+                _abort_doc(st, "прогон прерван")
+            return
+        try:
+            msg = result_q.get(timeout=WORKER_POLL)
+        except queue.Empty:
+            continue
+        kind = msg[0]
+        if kind == "eof":
+            break
+        if kind == "stats":
+            for key, value in msg[1].items():
+                stats[key] += value
+            continue
+        if kind == "rec_stats":
+            merge_stats(rec_stats, msg[1])
+            continue
+        if kind == "metrics":
+            metrics.METRICS.merge(msg[1])
+            continue
+        if kind == "triage":
+            if triage_stats is not None:
+                triage_stats.merge(msg[1])
+            continue
+
+        _, basename, page_idx, lines, error, from_cache = msg
+        st = docs[basename]
+        if error is None and not from_cache:
+            if cache is not None:
+                cache.put(prod.cache_key(st.pdf_hash, page_idx), lines)
+            if journal is not None:
+                journal.page(basename, page_idx, lines)
+        st.pending[page_idx] = (lines, error)
+        while st.next_page in st.pending:
+            idx = st.next_page
+            lines, error = st.pending.pop(idx)
+            st.next_page += 1
+            if error is not None:
+                print(f"[ERROR] {basename}, страница {idx}: {error}")
+                st.failed = True
+                _abort_doc(st, "есть страницы с ошибками")
+                continue
+            if st.failed:
+                continue  # документ уже брошен; страницы остаются в кэше и журнале
+            if not lines:
+                print(f"  [WARN] Нет строк для {basename}, страница {idx}")
+            if st.writer is None:
+                st.writer = prod.ReportWriter(st.out_dir, basename, io=io)
+            st.writer.write_page(idx, lines)
+        if st.next_page > st.page_count:
+            st.complete = True
+            _finish_doc(st, io)
+
+    # документы, по которым пришли не все страницы (например, упал воркер)
+    for st in docs.values():
+        if st.next_page <= st.page_count:
+            _abort_doc(st, f"обработано страниц {st.next_page - 1} из {st.page_count}")
+
+def _finish_doc(st, io=None):
+    if st.done:
+        return
+    st.done = True
+    if st.writer is None:
+        st.writer = prod.ReportWriter(st.out_dir, st.basename, io=io)
+    st.writer.close()
+    print(f"[DONE] Сохранены: {' и '.join(st.writer.paths)}")
+
+def _abort_doc(st, reason):
+    """Бросает недописанные result.* документа: прежние результаты остаются как были."""
+    st.failed = True
+    if st.done:
+        return
+    st.done = True
+    if st.writer is not None:
+        st.writer.abort()
+    print(f"[ERROR] {st.basename}: {reason} — прежние результаты не тронуты")
+
+# ---------- Запуск ----------
+def run_batch(pdf_paths, workers=2, raster_workers=None, queue_size=None, poppler_path=None,
+              rec_batch_size=None, rec_max_wait=None, io=None, journal=None):
+    """
+    Обрабатывает список PDF параллельно.
+    workers — число OCR-процессов, raster_workers — процессов растеризации,
+    queue_size — ёмкость очередей страниц и результатов (backpressure),
+    rec_batch_size / rec_max_wait — пакетное распознавание (см. batching.py),
+    io — aio.AsyncIO для фоновой записи (поток записи не ждёт диска;
+    вызывающий делает io.drain() перед тем, как читать результаты),
+    journal — journal.Journal: страницы пишутся в журнал, а после прерванного
+    прогона берутся из него (см. prod.process_pdf).
+    Возвращает пути PDF, все страницы которых дошли до записи.
+    """
+    rec_batch_size = prod.REC_BATCH_SIZE if rec_batch_size is None else rec_batch_size
+    rec_max_wait = prod.REC_MAX_WAIT if rec_max_wait is None else rec_max_wait
+    workers = max(1, int(workers))
+    raster_workers = max(1, int(raster_workers or workers))
+    queue_size = max(1, int(queue_size or 2 * workers))
+
+    t0 = time.perf_counter()
+    cache = prod.get_ocr_cache()
+    docs = {}
+    tasks = []
+    cached_pages = []
+    for pdf_path in pdf_paths:
+        basename = os.path.splitext(os.path.basename(pdf_path))[0]
+        out_dir = os.path.join(prod.BASE_OUTPUT_DIR, basename)
+        try:
+            page_count = prod.count_pdf_pages(pdf_path, poppler_path)
+        except Exception as e:
+            print(f"[ERROR] Не удалось конвертировать {pdf_path}: {e}")
+            continue
+        os.makedirs(out_dir, exist_ok=True)
+        pdf_hash, cached = prod.lookup_known_pages(cache, pdf_path, page_count, basename)
+        if journal is not None:
+            pdf_hash = prod.resume_from_journal(journal, pdf_path, pdf_hash, page_count, cached, basename)
+        metrics.inc("documents")
+        docs[basename] = _DocState(basename, pdf_path, out_dir, page_count, pdf_hash)
+        cached_pages.extend(("page", basename, i, lines, None, True) for i, lines in cached.items())
+        tasks.extend((basename, pdf_path, out_dir, i) for i in range(1, page_count + 1) if i not in cached)
+        print(f"[QUEUE] {pdf_path}: {page_count} страниц, без OCR (текст/кэш) {len(cached)}")
+
+    # пустые документы сразу получают пустой отчёт, как в последовательном режиме
+    for st in docs.values():
+        if st.page_count == 0:
+            st.complete = True
+            _finish_doc(st, io)
+
+    print(f"[PIPELINE] документов: {len(docs)}, страниц к OCR: {len(tasks)}, "
+          f"растеризация: {raster_workers}, OCR: {workers}, очередь: {queue_size}")
+
+    # spawn: одинаково на Linux и Windows и не наследует потоки paddle от родителя
+    ctx = mp.get_context("spawn")
+    task_q = ctx.Queue()
+    page_q = ctx.Queue(maxsize=queue_size)
+    result_q = ctx.Queue(maxsize=queue_size)
+
+    stats = {key: 0 for key in prod.ENGINE_STATS}
+    rec_stats = {}
+    tstats = triage.TriageStats(prod.DPI)
+    stop = threading.Event()
+    writer = threading.Thread(target=_writer_thread,
+                              args=(result_q, docs, stats, rec_stats, cache, io, tstats, journal, stop),
+                              name="report-writer", daemon=True)
+    writer.start()
+    procs = []
+    try:
+        for msg in cached_pages:
+            result_q.put(msg)
+        if not tasks:
+            # всё взято из кэша — движки не нужны
+            result_q.put(("eof",))
+            writer.join()
+            print(f"\n[PIPELINE] готово за {time.perf_counter() - t0:.2f} с (всё из кэша)")
+            return _completed(docs)
+
+        # профили по документам в конвейере не снимаются: страницы документов перемешаны
+        metrics_settings = (metrics.ENABLED, None)
+        triage_settings = triage.settings()
+        ocr_procs = [ctx.Process(target=_ocr_worker,
+                                 args=(page_q, result_q, rec_batch_size, rec_max_wait, metrics_settings,
+                                       triage_settings, poppler_path),
+                                 name=f"ocr-{i}")
+                     for i in range(workers)]
+        raster_procs = [ctx.Process(target=_raster_worker,
+                                    args=(task_q, page_q, result_q, prod.DPI, poppler_path, metrics_settings,
+                                          triage_settings),
+                                    name=f"raster-{i}")
+                        for i in range(raster_workers)]
+        procs = ocr_procs + raster_procs
+        for p in procs:
+            p.start()
+
+        for task in tasks:
+            task_q.put(task)
+        for _ in raster_procs:
+            task_q.put(None)
+
+        _join_workers(raster_procs, ocr_procs, page_q)
+
+        result_q.put(("eof",))
+        writer.join()
+    except BaseException:
+        # прерывание (Ctrl+C, SIGTERM): недописанные result.* бросаем, как prod.process_pdf;
+        # распознанные страницы уже в журнале и кэше
+        stop.set()
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        writer.join()
+        raise
+
+    elapsed = time.perf_counter() - t0
+    pages_per_sec = len(tasks) / elapsed if elapsed > 0 else 0.0
+    print(f"\n[PIPELINE] готово за {elapsed:.2f} с ({pages_per_sec:.2f} стр/с)")
+    prod.ENGINE_STATS.update(stats)
+    prod.print_engine_stats()
+    print_rec_stats(rec_stats)
+    if triage.ENABLED:
+        tstats.print_summary("все документы")
+    return _completed(docs)
+
+def _join_workers(raster_procs, ocr_procs, page_q, poll=WORKER_POLL):
+    """
+    Дожидается растеризаторов, затем OCR-процессов, следя, что OCR жив. Если
+    OCR-процессов не осталось (OOM, падение движка), растеризаторы навсегда
+    встали бы на put() в полную page_q — их останавливаем, а page_q
+    вычищаем. Страницы, не дошедшие до записи, делают свои документы
+    неполными: _writer_thread их не сохраняет, и они не попадают в манифест.
+    """
+    while any(p.is_alive() for p in raster_procs):
+        if not any(p.is_alive() for p in ocr_procs):
+            print("[ERROR] Все OCR-процессы завершились — останавливаем растеризацию")
+            for p in raster_procs:
+                p.terminate()
+            break
+        next(p for p in raster_procs if p.is_alive()).join(timeout=poll)
+    for p in raster_procs:
+        p.join()
+
+    # по None на OCR-процесс — пока есть живые, кому его забрать
+    sent = 0
+    while sent < len(ocr_procs) and any(p.is_alive() for p in ocr_procs):
+        try:
+            page_q.put(None, timeout=poll)
+            sent += 1
+        except queue.Full:
+            pass
+    for p in ocr_procs:
+        p.join()
+    _drain(page_q)
+    for p in raster_procs + ocr_procs:
+        if p.exitcode != 0:
+            print(f"[ERROR] Процесс {p.name} завершился с кодом {p.exitcode}")
+
+def _drain(q):
+    """Выбрасывает то, что осталось в очереди без получателей."""
+    while True:
+        try:
+            q.get(timeout=0.1)
+        except queue.Empty:
+            return
+        except Exception:
+            return  # сообщение, оборванное остановленным процессом
+
+def _completed(docs):
+    return [st.pdf_path for st in docs.values() if st.complete and not st.failed]
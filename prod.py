@@ -1,46 +1,457 @@
 # prod.py — универсальный финальный скрипт
 import os
-from pdf2image import convert_from_path
-from paddleocr import PaddleOCR
-from docx import Document
+import sys
+import json
+import time
+import queue
+import threading
+import weakref
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+
+import layout
+import metrics
+import triage
+from ocr_result import LOW_CONF, PageResult, QualityStats, ResultAdapter, as_page
 
 # ---------- Настройки ----------
 SCANS_DIR = os.path.join("data", "scans")   # входные PDF
 BASE_OUTPUT_DIR = os.path.join("data", "output")
 POPPLER_PATH = r"C:\poppler\Library\bin"    # если poppler установлен, иначе None
 DPI = 300
+PAGE_WINDOW = 1        # сколько страниц растеризуется за один вызов poppler
+SAVE_PAGE_IMAGES = False   # сохранять page_N.* на диск (только для отладки)
+PAGE_IMAGE_FORMAT = "PNG"  # "PNG" или "JPEG" (JPEG пишется заметно быстрее)
+PAGE_IMAGE_DPI = None      # None = как DPI; меньшее значение уменьшает отладочные картинки
 CONF_THRESHOLD = None  # None = не фильтровать по confidence, или float e.g. 0.5
+OCR_LANG = "ru"
+OCR_POOL_SIZE = 1      # сколько тёплых движков держит OcrEnginePool
+REC_BATCH_SIZE = 0     # строк в пакете распознавания (0 = страница целиком через predict/ocr)
+REC_MAX_WAIT = 0.5     # сек: максимальное ожидание неполного пакета распознавания
+OCR_CACHE_PATH = os.path.join(BASE_OUTPUT_DIR, "ocr_cache.sqlite")  # None = без кэша
+OCR_CACHE_MAX_MB = 1024  # предельный размер кэша, старые страницы вытесняются (LRU)
+OCR_MANIFEST_PATH = os.path.join(BASE_OUTPUT_DIR, "ocr_manifest.json")  # что уже распознано
+OCR_JOURNAL_PATH = os.path.join(BASE_OUTPUT_DIR, "ocr_journal.jsonl")  # журнал страниц; None = без журнала
+WRITE_JSONL = True     # писать result.jsonl — структурированный результат для parser.py
+WRITE_DOCX = True      # писать result.docx (docx_stream.py); False — только txt/jsonl
+WRITE_BUFFER = 1 << 20  # байт буфера result.txt/result.jsonl: на диск уходят крупные куски
+ASYNC_IO_WORKERS = 4   # одновременных операций фоновой записи (aio.py); 0 = синхронно
+USE_TEXT_LAYER = True  # страницы цифровых PDF брать из текстового слоя, без OCR (textlayer.py)
+# режим --fields-only: распознаются только страницы, нужные parser.py для полей
+FIELDS_REQUIRED = ("contract_number", "date_start", "counterparty", "amount", "currency")
+FIELDS_CROP = False       # сначала распознать только шапку первой и низ последней страницы
+FIELDS_HEAD_SHARE = 0.45  # доля высоты первой страницы: номер, дата, стороны
+FIELDS_TAIL_SHARE = 0.5   # доля высоты последней страницы: реквизиты и подписи
+
+# ---------- Ленивые импорты ----------
+# paddleocr тянет весь paddle (секунды на старте), pdf2image и python-docx —
+# PIL и lxml. Они импортируются при первом обращении, поэтому запуск без
+# работы (нет новых PDF, --help) и процессы, которым движок не нужен, за
+# них не платят.
+def convert_from_path(*args, **kwargs):
+    from pdf2image import convert_from_path as convert
+    return convert(*args, **kwargs)
+
+def pdfinfo_from_path(*args, **kwargs):
+    from pdf2image import pdfinfo_from_path as pdfinfo
+    return pdfinfo(*args, **kwargs)
+
+# ---------- OCR-движок ----------
+# Модели детекции/распознавания/ориентации грузятся долго, поэтому движок
+# создаётся один раз на процесс и переиспользуется для всех документов.
+ENGINE_STATS = {"loads": 0, "load_sec": 0.0, "calls": 0, "infer_sec": 0.0}
+_STATS_LOCK = threading.Lock()
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+def _add_stat(key, value):
+    with _STATS_LOCK:
+        ENGINE_STATS[key] += value
+
+def create_ocr_engine(lang=OCR_LANG):
+    """
+    Создаёт новый экземпляр PaddleOCR и учитывает время загрузки моделей.
+    """
+    t0 = time.perf_counter()
+    from paddleocr import PaddleOCR  # импорт paddle входит в время загрузки движка
+    # используем современный параметр, если доступен
+    try:
+        ocr = PaddleOCR(lang=lang, use_textline_orientation=True)
+    except TypeError:
+        # fallback на старый параметр
+        ocr = PaddleOCR(lang=lang, use_angle_cls=False)
+    elapsed = time.perf_counter() - t0
+    _add_stat("loads", 1)
+    _add_stat("load_sec", elapsed)
+    print(f"[ENGINE] PaddleOCR (lang={lang}) загружен за {elapsed:.2f} с")
+    return ocr
+
+def get_ocr_engine(lang=OCR_LANG):
+    """
+    Возвращает движок текущего процесса; при первом обращении загружает его.
+    """
+    with _ENGINES_LOCK:
+        ocr = _ENGINES.get(lang)
+        if ocr is None:
+            ocr = create_ocr_engine(lang)
+            _ENGINES[lang] = ocr
+        return ocr
+
+class OcrEnginePool:
+    """
+    Держит `size` тёплых движков для одновременной работы из нескольких потоков.
+    Использование:
+        pool = OcrEnginePool(size=4)
+        with pool.acquire() as ocr:
+            raw = run_ocr(ocr, image)
+    """
+    def __init__(self, size=OCR_POOL_SIZE, lang=OCR_LANG):
+        self.size = size
+        self._free = queue.Queue()
+        for _ in range(size):
+            self._free.put(create_ocr_engine(lang))
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        ocr = self._free.get(timeout=timeout)
+        try:
+            yield ocr
+        finally:
+            self._free.put(ocr)
+
+def run_ocr(ocr, image):
+    """
+    Вызывает predict (или ocr для старых версий PaddleOCR), учитывая время инференса.
+    """
+    t0 = time.perf_counter()
+    try:
+        if hasattr(ocr, "predict"):
+            return ocr.predict(image)
+        return ocr.ocr(image)
+    finally:
+        elapsed = time.perf_counter() - t0
+        _add_stat("calls", 1)
+        _add_stat("infer_sec", elapsed)
+        # полный вызов: детекция + распознавание одной страницей
+        # (раздельно их видно только при --rec-batch, см. batching.py)
+        metrics.observe("ocr", elapsed)
+
+def print_engine_stats():
+    with _STATS_LOCK:
+        st = dict(ENGINE_STATS)
+    avg = st["infer_sec"] / st["calls"] if st["calls"] else 0.0
+    print(f"[TIME] загрузка моделей: {st['load_sec']:.2f} с ({st['loads']} шт.), "
+          f"OCR: {st['infer_sec']:.2f} с ({st['calls']} вызовов, {avg:.2f} с/стр.)")
+
+_BATCHERS = {}
+
+def get_rec_batcher(ocr):
+    """Общий на процесс RecBatcher для движка (при REC_BATCH_SIZE > 0), иначе None."""
+    key = id(ocr)
+    if key not in _BATCHERS:
+        _BATCHERS[key] = make_rec_batcher(ocr, REC_BATCH_SIZE, REC_MAX_WAIT)
+    return _BATCHERS[key]
+
+# ---------- Кэш результатов OCR ----------
+_CACHE = None
+
+@lru_cache(maxsize=None)
+def engine_signature():
+    """
+    Версия движка — часть ключа кэша: после обновления моделей страницы
+    распознаются заново. Считается один раз на процесс, а не на каждую страницу.
+    """
+    try:
+        from importlib.metadata import version
+        return f"paddleocr-{version('paddleocr')}"
+    except Exception:
+        import paddleocr
+        return f"paddleocr-{getattr(paddleocr, '__version__', 'unknown')}"
+
+def cache_key(pdf_hash, page_idx, dpi_signature=None):
+    """
+    Ключ страницы в кэше OCR. dpi_signature — как растеризовалась страница:
+    по умолчанию triage.signature(DPI) (лестница DPI при triage); страницы,
+    распознанные сразу в DPI мимо triage, кладутся под dpi_signature=DPI.
+    """
+    from ocr_cache import page_key
+    if dpi_signature is None:
+        dpi_signature = triage.signature(DPI)
+    return page_key(pdf_hash, page_idx, dpi_signature, engine_signature(), OCR_LANG)
+
+def get_ocr_cache():
+    """Кэш OCR процесса (открывается при первом обращении) или None, если OCR_CACHE_PATH = None."""
+    global _CACHE
+    if _CACHE is None and OCR_CACHE_PATH:
+        from ocr_cache import OcrCache
+        _CACHE = OcrCache(OCR_CACHE_PATH, max_bytes=OCR_CACHE_MAX_MB << 20)
+    return _CACHE
+
+def lookup_cached_pages(cache, pdf_path, page_count, page_numbers=None):
+    """
+    Возвращает (pdf_hash, {номер_страницы: строки}) для страниц, найденных в кэше.
+    page_numbers — искать только эти страницы (по умолчанию все).
+    Без кэша — (None, {}).
+    """
+    if cache is None:
+        return None, {}
+    from ocr_cache import file_sha256
+    pdf_hash = file_sha256(pdf_path)
+    if page_numbers is None:
+        page_numbers = range(1, page_count + 1)
+    cached = {}
+    for page_idx in page_numbers:
+        lines = cache.get(cache_key(pdf_hash, page_idx))
+        if lines is not None:
+            cached[page_idx] = lines
+    metrics.inc("cache_hits", len(cached))
+    metrics.inc("cache_misses", len(page_numbers) - len(cached))
+    return pdf_hash, cached
+
+def lookup_text_layer(pdf_path, page_count):
+    """
+    {номер_страницы: строки} для страниц с пригодным текстовым слоем (textlayer.py);
+    такие страницы не растеризуются и не распознаются. Пусто, если USE_TEXT_LAYER выключен.
+    """
+    if not USE_TEXT_LAYER or not page_count:
+        return {}
+    import textlayer
+    if not textlayer.available():
+        return {}
+    try:
+        with metrics.timed("text_layer"):
+            found = textlayer.page_lines(pdf_path, range(1, page_count + 1), DPI)
+    except Exception as e:
+        print(f"  [WARN] Не удалось прочитать текстовый слой {pdf_path}: {e}")
+        return {}
+    metrics.inc("text_layer_pages", len(found))
+    return found
+
+def lookup_known_pages(cache, pdf_path, page_count, label):
+    """
+    Страницы, которые не нужно распознавать: сначала текстовый слой, затем кэш OCR.
+    Возвращает (pdf_hash, {номер_страницы: строки}).
+    """
+    known = lookup_text_layer(pdf_path, page_count)
+    if known:
+        print(f"[TEXT] {label}: текстовый слой у {len(known)} из {page_count} страниц — без OCR")
+    rest = [i for i in range(1, page_count + 1) if i not in known]
+    pdf_hash, cached = lookup_cached_pages(cache, pdf_path, page_count, rest)
+    if cached:
+        print(f"[CACHE] {label}: из кэша {len(cached)} из {page_count} страниц")
+    known.update(cached)
+    return pdf_hash, known
+
+# ---------- Журнал заданий ----------
+def resume_from_journal(journal, pdf_path, pdf_hash, page_count, known, label):
+    """
+    Добавляет в known страницы, распознанные прерванным прогоном, и отмечает
+    начало документа в журнале. Возвращает hash PDF (считает, если его не было).
+    """
+    if pdf_hash is None:
+        from ocr_cache import file_sha256
+        pdf_hash = file_sha256(pdf_path)
+    resumed = {i: lines for i, lines in journal.resume(label, pdf_hash).items()
+               if i not in known and 1 <= i <= page_count}
+    if resumed:
+        print(f"[JOURNAL] {label}: продолжаем, страниц из журнала {len(resumed)} из {page_count}")
+        known.update(resumed)
+    journal.start(label, pdf_hash, page_count)
+    return pdf_hash
+
+# ---------- Инкрементальный режим ----------
+OCR_OUTPUT_FILES = ("result.txt", "result.docx", "result.jsonl")
+
+def ocr_output_files():
+    """Файлы результата при текущих настройках (result.docx — только при WRITE_DOCX и т.д.)."""
+    return [name for name in OCR_OUTPUT_FILES
+            if (name != "result.jsonl" or WRITE_JSONL) and (name != "result.docx" or WRITE_DOCX)]
+
+def ocr_outputs_current(manifest, pdf_path, mode="full"):
+    """
+    True, если PDF не менялся с прошлого прогона и его результаты на месте.
+    Результат режима "fields" (распознаны не все страницы) годится только для
+    того же режима; полный — для любого. Записанный при других настройках
+    склейки строк (layout.signature()) не годится.
+    """
+    from manifest import file_unchanged
+    basename = os.path.splitext(os.path.basename(pdf_path))[0]
+    entry = manifest.get(basename)
+    if not entry or not file_unchanged(pdf_path, entry.get("input")):
+        return False
+    if entry.get("mode", "full") != "full" and entry.get("mode") != mode:
+        return False
+    # result.txt/docx собраны склейкой строк (layout.py): --raw-lines или другие пороги — пересчёт
+    if entry.get("layout") != layout.signature():
+        return False
+    out_dir = os.path.join(BASE_OUTPUT_DIR, basename)
+    outputs = entry.get("outputs") or {}
+    return all(file_unchanged(os.path.join(out_dir, name), outputs.get(name)) for name in ocr_output_files())
+
+def drop_failed_writes(pdf_paths, io_errors):
+    """Убирает PDF, у которых не записался какой-то из выходных файлов (ошибки aio.AsyncIO)."""
+    bad_dirs = {os.path.normpath(os.path.dirname(str(key))) for key, _ in io_errors}
+    kept = []
+    for pdf_path in pdf_paths:
+        basename = os.path.splitext(os.path.basename(pdf_path))[0]
+        if os.path.normpath(os.path.join(BASE_OUTPUT_DIR, basename)) in bad_dirs:
+            print(f"[ERROR] {basename}: результаты записаны не полностью")
+        else:
+            kept.append(pdf_path)
+    return kept
+
+def record_ocr_outputs(manifest, pdf_path, mode="full"):
+    from manifest import file_fingerprint
+    basename = os.path.splitext(os.path.basename(pdf_path))[0]
+    out_dir = os.path.join(BASE_OUTPUT_DIR, basename)
+    outputs = {}
+    for name in ocr_output_files():
+        path = os.path.join(out_dir, name)
+        if os.path.exists(path):
+            outputs[name] = file_fingerprint(path, with_hash=False)
+    manifest.set(basename, {
+        "input_path": pdf_path,
+        "input": file_fingerprint(pdf_path),
+        "outputs": outputs,
+        "mode": mode,
+        "layout": layout.signature(),
+    })
+
+# ---------- Растеризация ----------
+def _poppler_kwargs(poppler_path):
+    if poppler_path and os.path.exists(poppler_path):
+        return {"poppler_path": poppler_path}
+    return {}
+
+def count_pdf_pages(pdf_path, poppler_path=None):
+    """Число страниц PDF по pdfinfo, без растеризации."""
+    info = pdfinfo_from_path(pdf_path, **_poppler_kwargs(poppler_path))
+    return int(info["Pages"])
+
+def _page_windows(page_numbers, window):
+    """Разбивает возрастающие номера страниц на отрезки подряд идущих, не длиннее window."""
+    first = last = None
+    for n in page_numbers:
+        if first is not None and n == last + 1 and n - first < window:
+            last = n
+            continue
+        if first is not None:
+            yield first, last
+        first = last = n
+    if first is not None:
+        yield first, last
+
+def iter_pdf_pages(pdf_path, dpi=DPI, poppler_path=None, window=PAGE_WINDOW, page_count=None,
+                   page_numbers=None):
+    """
+    Генератор страниц PDF: растеризует документ окнами по `window` страниц
+    (first_page/last_page), поэтому в памяти одновременно находится не больше
+    одного окна, независимо от длины документа.
+    page_numbers — растеризовать только эти страницы (например, не найденные в кэше).
+    Отдаёт пары (номер_страницы, PIL.Image), нумерация с 1.
+    """
+    kwargs = _poppler_kwargs(poppler_path)
+    if page_numbers is None:
+        if page_count is None:
+            page_count = count_pdf_pages(pdf_path, poppler_path)
+        page_numbers = range(1, page_count + 1)
+    window = max(1, int(window))
+    for first, last in _page_windows(sorted(page_numbers), window):
+        pages = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last, **kwargs)
+        page_idx = first
+        # отдаём страницы по одной и сразу отпускаем ссылки на них
+        while pages:
+            yield page_idx, pages.pop(0)
+            page_idx += 1
+
+def page_to_array(page):
+    """
+    PIL.Image -> numpy-массив HxWx3 uint8 в порядке BGR (как cv2.imread),
+    который PaddleOCR принимает напрямую, без записи на диск.
+    """
+    arr = np.asarray(page.convert("RGB"))
+    return np.ascontiguousarray(arr[:, :, ::-1])
+
+def save_page_image(page, out_dir, page_idx, fmt=PAGE_IMAGE_FORMAT, dpi=PAGE_IMAGE_DPI):
+    """Сохраняет отладочную копию страницы; возвращает путь к файлу."""
+    fmt = fmt.upper()
+    ext = "jpg" if fmt in ("JPG", "JPEG") else fmt.lower()
+    img = page
+    if dpi and dpi < DPI:
+        scale = dpi / DPI
+        img = page.resize((max(1, int(page.width * scale)), max(1, int(page.height * scale))))
+    img_path = os.path.join(out_dir, f"page_{page_idx}.{ext}")
+    if ext == "png":
+        img.save(img_path, "PNG", compress_level=1)
+    elif ext == "jpg":
+        img.convert("RGB").save(img_path, "JPEG", quality=90)
+    else:
+        img.save(img_path, fmt)
+    return img_path
+
+def _timed_save_page_image(page, out_dir, page_idx):
+    with metrics.timed("save_image"):
+        return save_page_image(page, out_dir, page_idx)
 
 # ---------- Утилиты ----------
-def extract_lines(result):
+def _box_list(box):
+    """Рамку строки (ndarray / список точек) приводим к JSON-совместимому списку."""
+    if box is None:
+        return None
+    try:
+        arr = np.asarray(box, dtype=float)
+    except Exception:
+        return None
+    if arr.shape == (4,):
+        # rec_boxes: [x0, y0, x1, y1] -> четыре угла
+        x0, y0, x1, y1 = arr.tolist()
+        return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+    if arr.ndim != 2 or arr.shape[1] != 2:
+        return None
+    return arr.tolist()
+
+def extract_lines(result, with_boxes=False):
     """
     Универсально извлекает (text, score) из результата PaddleOCR,
     поддерживает разные форматы, которые мы наблюдали.
-    Возвращает список кортежей (text:str, score:float|None)
+    Возвращает список кортежей (text:str, score:float|None),
+    а при with_boxes=True — (text, score, box:list|None).
     """
     lines = []
     if not result:
         return lines
 
-    # 1) Если словарь (редкий случай)
-    if isinstance(result, dict):
-        rec_texts = result.get("rec_texts", [])
-        rec_scores = result.get("rec_scores", [])
+    def add(text, score, box=None):
+        lines.append((text, score, box) if with_boxes else (text, score))
+
+    def add_rec_dict(d):
+        rec_texts = d.get("rec_texts", [])
+        rec_scores = d.get("rec_scores", [])
+        rec_polys = d.get("rec_polys")
+        if rec_polys is None:
+            rec_polys = d.get("rec_boxes")
+        if rec_polys is None:
+            rec_polys = []
         for i, t in enumerate(rec_texts):
             s = rec_scores[i] if i < len(rec_scores) else None
-            lines.append((str(t), s))
+            box = _box_list(rec_polys[i]) if with_boxes and i < len(rec_polys) else None
+            add(str(t), s, box)
+
+    # 1) Если словарь (редкий случай)
+    if isinstance(result, dict):
+        add_rec_dict(result)
         return lines
 
     # 2) Если список
     if isinstance(result, (list, tuple)):
         for elem in result:
+            # 2.x: пустая страница приходит как [None]
+            if elem is None:
+                continue
             # elem может быть dict (внутри списка) с rec_texts
             if isinstance(elem, dict):
-                rec_texts = elem.get("rec_texts", [])
-                rec_scores = elem.get("rec_scores", [])
-                for i, t in enumerate(rec_texts):
-                    s = rec_scores[i] if i < len(rec_scores) else None
-                    lines.append((str(t), s))
+                add_rec_dict(elem)
                 continue
 
             # elem может быть "page" — список строк
@@ -50,137 +461,651 @@ def extract_lines(result):
                     try:
                         if isinstance(line, (list, tuple)) and len(line) == 2:
                             second = line[1]
+                            box = _box_list(line[0]) if with_boxes else None
                             # second может быть tuple (text, score) или прямо строка
                             if isinstance(second, (list, tuple)):
                                 text = second[0]
                                 score = second[1] if len(second) > 1 else None
-                                lines.append((str(text), score))
+                                add(str(text), score, box)
                             elif isinstance(second, dict):
                                 # fallback, иногда могут быть dict поля
                                 text = second.get("rec_text") or second.get("text") or str(second)
                                 score = second.get("rec_score") or second.get("score")
-                                lines.append((str(text), score))
+                                add(str(text), score, box)
                             else:
                                 # простая строка
-                                lines.append((str(second), None))
+                                add(str(second), None, box)
                         elif isinstance(line, str):
-                            lines.append((line, None))
+                            add(line, None)
                         else:
                             # придуманный формат — stringfy
-                            lines.append((str(line), None))
+                            add(str(line), None)
                     except Exception:
                         # безопасный fallback: строковое представление
                         try:
-                            lines.append((str(line), None))
+                            add(str(line), None)
                         except:
                             continue
                 continue
 
             # если элемент простой текст
             if isinstance(elem, str):
-                lines.append((elem, None))
+                add(elem, None)
             else:
                 # fallback
-                lines.append((str(elem), None))
+                add(str(elem), None)
 
     return lines
 
+def page_pairs(raw):
+    """Пары (text, score) страницы без пустых строк."""
+    page = page_lines(raw)
+    return list(zip(page.texts, page.score_list()))
+
+# по самому движку, а не по id(): id собранного движка может достаться новому
+_ADAPTERS = weakref.WeakKeyDictionary()
+_DEFAULT_ADAPTER = None  # для ответов без известного движка (ocr=None)
+
+def result_adapter(ocr=None):
+    """Разбор ответов движка ocr (ocr_result.ResultAdapter) — формат определяется один раз на движок."""
+    global _DEFAULT_ADAPTER
+    if ocr is None:
+        if _DEFAULT_ADAPTER is None:
+            _DEFAULT_ADAPTER = ResultAdapter(lambda raw: extract_lines(raw, with_boxes=True))
+        return _DEFAULT_ADAPTER
+    adapter = _ADAPTERS.get(ocr)
+    if adapter is None:
+        adapter = _ADAPTERS[ocr] = ResultAdapter(lambda raw: extract_lines(raw, with_boxes=True))
+    return adapter
+
+def page_lines(raw, ocr=None):
+    """
+    Строки страницы без пустых — ocr_result.PageResult (колонки texts,
+    scores, boxes): из него пишутся result.*, кэш и журнал.
+    ocr — движок, вернувший raw: формат его ответов запоминается.
+    """
+    with metrics.timed("extract_lines"):
+        return result_adapter(ocr)(raw)
+
+def rasterize_page(pdf_path, page_idx, dpi=DPI, poppler_path=None):
+    """Растеризует одну страницу PDF (нумерация с 1) в PIL.Image."""
+    pages = convert_from_path(pdf_path, dpi=dpi, first_page=page_idx, last_page=page_idx,
+                              **_poppler_kwargs(poppler_path))
+    if not pages:
+        raise ValueError(f"страница {page_idx} не найдена")
+    return pages[0]
+
+# ---------- Сортировка страниц (triage.py) ----------
+def triage_page(pdf_path, page_idx, page, dpi, poppler_path, stats, raster_sec, label):
+    """
+    Решение по странице, растеризованной в dpi. Если выбран больший DPI —
+    растеризует её заново. Возвращает (decision, страница или None для пустой).
+    """
+    t0 = time.perf_counter()
+    decision = triage.assess(page, dpi, DPI)
+    elapsed = time.perf_counter() - t0
+    metrics.observe("triage", elapsed)
+    stats.add("triage_sec", elapsed)
+    stats.page(decision, raster_sec, dpi)
+    if decision.blank:
+        metrics.inc("blank_pages")
+        print(f"  [TRIAGE] {label}, страница {page_idx}: пустая (чернил {decision.ink:.2%}) — без OCR")
+        return decision, None
+    metrics.inc(f"pages_dpi_{decision.dpi}")
+    height = f"строка ~{decision.text_px:.0f} px" if decision.text_px else "строки не найдены"
+    print(f"  [TRIAGE] {label}, страница {page_idx}: {height} при {dpi} DPI → {decision.dpi} DPI")
+    if decision.dpi != dpi:
+        t0 = time.perf_counter()
+        page = rasterize_page(pdf_path, page_idx, dpi=decision.dpi, poppler_path=poppler_path)
+        elapsed = time.perf_counter() - t0
+        metrics.observe("raster", elapsed)
+        stats.add("extra_sec", elapsed)
+    return decision, page
+
+def retry_full_dpi(ocr, pdf_path, page_idx, lines, dpi, poppler_path, stats, label):
+    """Если confidence страницы в пониженном DPI низкий — повтор в полном DPI; возвращает лучшие строки."""
+    if not triage.needs_retry(lines, dpi, DPI):
+        return lines
+    conf = triage.mean_conf(lines)
+    t0 = time.perf_counter()
+    try:
+        page = rasterize_page(pdf_path, page_idx, dpi=DPI, poppler_path=poppler_path)
+        retry_lines = page_lines(run_ocr(ocr, page_to_array(page)), ocr)
+    except Exception as e:
+        print(f"  [WARN] {label}, страница {page_idx}: повтор в {DPI} DPI не удался: {e}")
+        return lines
+    finally:
+        stats.add("retry_sec", time.perf_counter() - t0)
+    best = triage.better(lines, retry_lines)
+    stats.add("retries")
+    metrics.inc("triage_retries")
+    if best is retry_lines:
+        stats.add("retry_kept")
+    new_conf = triage.mean_conf(retry_lines)
+    print(f"  [TRIAGE] {label}, страница {page_idx}: confidence "
+          f"{'—' if conf is None else f'{conf:.2f}'} при {dpi} DPI → повтор в {DPI} DPI: "
+          f"{'—' if new_conf is None else f'{new_conf:.2f}'}"
+          f" ({'берём' if best is retry_lines else 'оставляем прежний'})")
+    return best
+
+# ---------- Запись результатов ----------
+def jsonl_page_record(page_idx, lines):
+    """
+    Запись страницы для result.jsonl — колонки строк в порядке чтения:
+    {"page": N, "texts": [...], "scores": [...], "bboxes": [[[x, y] * 4] | null, ...],
+     "conf": {"lines", "scored", "mean", "min", "p10", "p50", "p90", "low_share"}}
+    Номер строки на странице — индекс в этих списках; conf — сводка
+    confidence страницы (ocr_result.conf_stats, порог ocr_result.LOW_CONF).
+    lines — PageResult или строки (text, score[, box]).
+    """
+    return as_page(lines or []).record(page_idx, LOW_CONF)
+
+class ReportWriter:
+    """
+    Постранично пишет result.txt, (при WRITE_DOCX) result.docx и (при
+    WRITE_JSONL) result.jsonl документа. Страницы нужно подавать по порядку;
+    close() дописывает docx и сохраняет result.quality.json — сводку
+    confidence документа (ocr_result.QualityStats).
+    docx пишется потоком (docx_stream.DocxStream): абзацы страницы сразу
+    уходят в сжатый word/document.xml, документ целиком в памяти не строится.
+    Файлы пишутся в *.part и переименовываются в result.* только в close()
+    (после fsync), поэтому при падении остаются прежние целые результаты,
+    а не наполовину записанные. result.docx/result.jsonl прошлого прогона,
+    которые сейчас не пишутся (--no-docx, WRITE_JSONL=False), close() удаляет:
+    они уже не соответствуют новому result.txt.
+    io — aio.AsyncIO: запись файлов уходит в фоновый ввод-вывод (по порядку
+    для каждого файла), вызывающий не ждёт диска; дождаться записи — io.drain().
+    """
+    def __init__(self, out_dir, basename, io=None):
+        os.makedirs(out_dir, exist_ok=True)
+        self.basename = basename
+        self.io = io
+        self.txt_path = os.path.join(out_dir, "result.txt")
+        self.docx_path = os.path.join(out_dir, "result.docx")
+        self.jsonl_path = os.path.join(out_dir, "result.jsonl")
+        self.quality_path = os.path.join(out_dir, "result.quality.json")
+        self.quality = QualityStats(LOW_CONF)
+        self.txt_file = open(self.txt_path + ".part", "w", encoding="utf-8", buffering=WRITE_BUFFER)
+        self.jsonl_file = (open(self.jsonl_path + ".part", "w", encoding="utf-8", buffering=WRITE_BUFFER)
+                           if WRITE_JSONL else None)
+        self.docx_file = self.docx = None
+        if WRITE_DOCX:
+            from docx_stream import DocxStream
+            self.docx_file = open(self.docx_path + ".part", "wb")
+            self.docx = DocxStream(self.docx_file)
+        self.closed = False
+
+    @property
+    def paths(self):
+        """Файлы отчёта для сообщений: result.txt и result.docx, если он пишется."""
+        return [self.txt_path] + ([self.docx_path] if self.docx is not None else [])
+
+    def _emit(self, path, fn, *args):
+        if self.io is None:
+            fn(*args)
+        else:
+            self.io.submit(path, fn, *args)
+
+    def write_page(self, page_idx, lines):
+        """lines — PageResult, пары (text, score) или тройки (text, score, box)."""
+        page = as_page(lines or [])
+        metrics.count_page(page)
+        with metrics.timed("write_page"):
+            self.quality.add(page_idx, page)
+            if self.jsonl_file is not None:
+                record = page.record(page_idx, LOW_CONF)
+                self._emit(self.jsonl_path, self.jsonl_file.write,
+                           json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            # текст и абзацы docx страницы собираются целиком и пишутся одной операцией
+            text, xml = self._page_text(page_idx, page)
+            self._emit(self.txt_path, self.txt_file.write, text)
+            if xml is not None:
+                self._emit(self.docx_path, self.docx.write, xml)
+
+    def _page_text(self, page_idx, page):
+        """Текст страницы для result.txt и её абзацы WordprocessingML (None без docx)."""
+        if page:
+            # строки ниже CONF_THRESHOLD помечаются low_conf, но не выбрасываются
+            threshold = None if CONF_THRESHOLD is None else float(CONF_THRESHOLD)
+            # фрагменты — в строки порядка чтения (layout.py); result.jsonl остаётся по детекции
+            with metrics.timed("layout"):
+                shown = layout.display_page(page)
+            lines = shown.display_lines(threshold)
+            text = f"--- Страница {page_idx} ---\n" + "".join(line + "\n" for line in lines) + "\n"
+        else:
+            lines = ["[Пусто или нераспознано]"]
+            text = f"--- Страница {page_idx} ---\n[Пусто или нераспознано]\n\n"
+        if self.docx is None:
+            return text, None
+        from docx_stream import heading_xml, paragraph_xml
+        xml = heading_xml(f"{self.basename} — Страница {page_idx}", level=2) + "".join(map(paragraph_xml, lines))
+        return text, xml
+
+    def _save_docx(self):
+        with metrics.timed("write_docx"):
+            self.docx.close()
+            self._commit(self.docx_file, self.docx_path)
+
+    def _discard_docx(self):
+        self.docx.abort()
+        self._discard(self.docx_file)
+
+    def _save_quality(self, summary):
+        with open(self.quality_path + ".part", "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.quality_path + ".part", self.quality_path)
+
+    @staticmethod
+    def _commit(f, path):
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.replace(f.name, path)
+
+    @staticmethod
+    def _remove_stale(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _discard(f):
+        f.close()
+        try:
+            os.remove(f.name)
+        except OSError:
+            pass
+
+    def abort(self):
+        """Бросить недописанные файлы: result.* прошлого прогона остаются как были."""
+        if self.closed:
+            return
+        self.closed = True
+        self._emit(self.txt_path, self._discard, self.txt_file)
+        if self.jsonl_file is not None:
+            self._emit(self.jsonl_path, self._discard, self.jsonl_file)
+        if self.docx is not None:
+            self._emit(self.docx_path, self._discard_docx)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        with metrics.timed("write_close"):
+            self._emit(self.txt_path, self._commit, self.txt_file, self.txt_path)
+            if self.jsonl_file is not None:
+                self._emit(self.jsonl_path, self._commit, self.jsonl_file, self.jsonl_path)
+            self._emit(self.quality_path, self._save_quality, {"doc": self.basename, **self.quality.summary()})
+            if self.docx is not None:
+                self._emit(self.docx_path, self._save_docx)
+            else:
+                # --no-docx: docx прошлого прогона уже не соответствует result.txt
+                self._emit(self.docx_path, self._remove_stale, self.docx_path)
+            if self.jsonl_file is None:
+                self._emit(self.jsonl_path, self._remove_stale, self.jsonl_path)
+
 # ---------- Основной процесс ----------
-def process_pdf(pdf_path, poppler_path=None):
+def make_rec_batcher(ocr, batch_size=REC_BATCH_SIZE, max_wait=REC_MAX_WAIT):
+    """RecBatcher для движка, если пакетирование включено и поддерживается, иначе None."""
+    if not batch_size:
+        return None
+    from batching import RecBatcher, supports_batching
+    if not supports_batching(ocr):
+        print("[WARN] Движок не поддерживает раздельные детекцию и распознавание — пакетирование выключено")
+        return None
+    return RecBatcher(ocr, batch_size=batch_size, max_wait=max_wait)
+
+def process_pdf(pdf_path, poppler_path=None, ocr=None, batcher=None, cache=None, io=None, journal=None):
+    """
+    OCR одного PDF в data/output/<имя>/result.txt и result.docx.
+    Возвращает папку с результатами, если все страницы обработаны без ошибок, иначе None
+    (тогда result.* не подменяются: прежние результаты остаются как были).
+    batcher — RecBatcher для пакетного распознавания (по умолчанию общий на процесс,
+    если REC_BATCH_SIZE > 0); cache — OcrCache (по умолчанию OCR_CACHE_PATH).
+    Страницы с текстовым слоем (USE_TEXT_LAYER) и найденные в кэше не
+    растеризуются и не распознаются.
+    При triage.ENABLED страницы растеризуются в наименьшем DPI, пустые
+    пропускаются, остальные распознаются в DPI, выбранном triage.assess.
+    io — aio.AsyncIO: файлы пишутся в фоне, пока считаются следующие страницы;
+    вызывающий должен сделать io.drain() перед тем, как полагаться на результат.
+    journal — journal.Journal: каждая распознанная страница записывается в
+    журнал, а страницы из журнала после прерванного прогона не распознаются
+    заново; journal.done() вызывает вызывающий, когда результаты на диске.
+    """
     basename = os.path.splitext(os.path.basename(pdf_path))[0]
     out_dir = os.path.join(BASE_OUTPUT_DIR, basename)
     os.makedirs(out_dir, exist_ok=True)
 
     print(f"\n[PROCESS] {pdf_path} → {out_dir}")
 
-    # конвертация pdf -> страницы
+    # число страниц узнаём заранее; сами страницы растеризуются по мере OCR
     try:
-        if poppler_path and os.path.exists(poppler_path):
-            pages = convert_from_path(pdf_path, dpi=DPI, poppler_path=poppler_path)
-        else:
-            pages = convert_from_path(pdf_path, dpi=DPI)
+        page_count = count_pdf_pages(pdf_path, poppler_path)
     except Exception as e:
         print(f"[ERROR] Не удалось конвертировать {pdf_path}: {e}")
         return
 
-    print(f"[OK] Конвертировано {len(pages)} страниц")
+    print(f"[OK] В документе {page_count} страниц")
 
-    image_paths = []
-    for i, page in enumerate(pages, start=1):
-        img_path = os.path.join(out_dir, f"page_{i}.png")
-        page.save(img_path, "PNG")
-        image_paths.append(img_path)
-        print(f"  [SAVED] {img_path}")
+    if cache is None:
+        cache = get_ocr_cache()
+    pdf_hash, cached = lookup_known_pages(cache, pdf_path, page_count, basename)
+    if journal is not None:
+        pdf_hash = resume_from_journal(journal, pdf_path, pdf_hash, page_count, cached, basename)
+    todo = [i for i in range(1, page_count + 1) if i not in cached]
 
-    # Инициализируем OCR один раз
-    # используем современный параметр, если доступен
+    # движок загружается один раз на процесс и только если есть что распознавать
+    if todo:
+        if batcher is not None:
+            ocr = batcher.ocr
+        else:
+            if ocr is None:
+                ocr = get_ocr_engine()
+            batcher = get_rec_batcher(ocr)
+
+    writer = ReportWriter(out_dir, basename, io=io)
+    # страницы из кэша и из OCR приходят вперемешку — пишем строго по порядку
+    pending = dict(cached)
+    next_page = 1
+    complete = True
+    raster_dpi = triage.dpi_ladder(DPI)[0] if triage.ENABLED else DPI
+    tstats = triage.TriageStats(DPI)
+    page_dpi = {}  # страница -> DPI, в котором она ушла в OCR (для повтора при низком confidence)
+    blank_pages = set()
+
+    def flush_ready():
+        nonlocal next_page
+        while next_page in pending:
+            lines = pending.pop(next_page)
+            if lines is not None:
+                writer.write_page(next_page, lines)
+            next_page += 1
+
+    def emit(page_idx, lines, error=None):
+        nonlocal complete
+        if error is not None:
+            complete = False
+            print(f"[ERROR] OCR упал для {basename}, страница {page_idx}: {error}")
+            metrics.inc("page_errors")
+            lines = None
+        else:
+            if page_idx in page_dpi:
+                lines = retry_full_dpi(ocr, pdf_path, page_idx, lines, page_dpi.pop(page_idx),
+                                       poppler_path, tstats, basename)
+            if not lines and page_idx not in blank_pages:
+                print(f"  [WARN] Нет строк для {basename}, страница {page_idx}")
+            if cache is not None:
+                cache.put(cache_key(pdf_hash, page_idx), lines)
+            if journal is not None:
+                journal.page(basename, page_idx, lines)
+        pending[page_idx] = lines
+        flush_ready()
+
+    flush_ready()
+    pages = iter_pdf_pages(pdf_path, dpi=raster_dpi, poppler_path=poppler_path, page_numbers=todo)
     try:
-        ocr = PaddleOCR(lang='ru', use_textline_orientation=True)
-    except TypeError:
-        # fallback на старый параметр
-        ocr = PaddleOCR(lang='ru', use_angle_cls=False)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                page_idx, page = next(pages)
+            except StopIteration:
+                break
+            except Exception as e:
+                print(f"[ERROR] Не удалось конвертировать {pdf_path}: {e}")
+                complete = False
+                break
+            raster_sec = time.perf_counter() - t0
+            metrics.observe("raster", raster_sec)
 
-    # создаём doc и txt
-    doc = Document()
-    txt_path = os.path.join(out_dir, "result.txt")
+            if triage.ENABLED:
+                try:
+                    decision, page = triage_page(pdf_path, page_idx, page, raster_dpi, poppler_path,
+                                                 tstats, raster_sec, basename)
+                except Exception as e:
+                    print(f"[ERROR] Не удалось конвертировать {pdf_path}, страница {page_idx}: {e}")
+                    emit(page_idx, None, e)
+                    continue
+                if decision.blank:
+                    blank_pages.add(page_idx)
+                    emit(page_idx, PageResult.empty())
+                    continue
+                if decision.dpi < DPI:
+                    page_dpi[page_idx] = decision.dpi
 
-    with open(txt_path, "w", encoding="utf-8") as txt_file:
-        for page_idx, img_path in enumerate(image_paths, start=1):
-            print(f"[OCR] Обрабатываю {img_path} (страница {page_idx})")
-            # вызываем predict если доступен
+            if SAVE_PAGE_IMAGES and io is not None:
+                io.submit(os.path.join(out_dir, f"page_{page_idx}"), _timed_save_page_image, page, out_dir, page_idx)
+            elif SAVE_PAGE_IMAGES:
+                img_path = _timed_save_page_image(page, out_dir, page_idx)
+                print(f"  [SAVED] {img_path}")
+            # страница передаётся в OCR массивом, без PNG-круга через диск
+            with metrics.timed("to_array"):
+                image = page_to_array(page)
+            del page
+
+            print(f"[OCR] Обрабатываю {basename} (страница {page_idx})")
+            t0 = time.perf_counter()
             try:
-                if hasattr(ocr, "predict"):
-                    raw = ocr.predict(img_path)
-                else:
-                    raw = ocr.ocr(img_path)
+                if batcher is not None:
+                    # строки страницы уходят в общий пакет; готовые страницы пишем сразу
+                    for ready in batcher.add_page(page_idx, image):
+                        emit(*ready)
+                    continue
+                raw = run_ocr(ocr, image)
             except Exception as e:
-                print(f"[ERROR] OCR упал для {img_path}: {e}")
+                emit(page_idx, None, e)
                 continue
+            finally:
+                del image
+                tstats.add("ocr_sec", time.perf_counter() - t0)
+                tstats.add("ocr_pages")
 
-            # извлекаем пары (text, score)
-            pairs = extract_lines(raw)
-            # фильтруем пустые строки
-            pairs = [(t.strip(), s) for (t, s) in pairs if isinstance(t, str) and t.strip()]
+            emit(page_idx, page_lines(raw, ocr))
 
-            # запись заголовка страницы
-            doc.add_heading(f"{basename} — Страница {page_idx}", level=2)
-            txt_file.write(f"--- Страница {page_idx} ---\n")
+        if batcher is not None:
+            t0 = time.perf_counter()
+            for ready in batcher.flush():
+                emit(*ready)
+            tstats.add("ocr_sec", time.perf_counter() - t0)
+    except BaseException:
+        # прерывание (Ctrl+C, SIGTERM, сбой движка): прежние result.* не трогаем,
+        # распознанные страницы уже в журнале и кэше
+        writer.abort()
+        raise
 
-            if not pairs:
-                doc.add_paragraph("[Пусто или нераспознано]")
-                txt_file.write("[Пусто или нераспознано]\n\n")
-                print(f"  [WARN] Нет строк для {img_path}")
-                continue
+    if triage.ENABLED:
+        tstats.print_summary(basename)
+    if not complete:
+        # есть страницы с ошибками или не пришедшие: неполный отчёт не подменяет прежний
+        writer.abort()
+        print(f"[ERROR] {basename}: не все страницы распознаны — прежние результаты не тронуты")
+        return None
+    writer.close()
+    print(f"[DONE] Сохранены: {' и '.join(writer.paths)}")
+    return out_dir
 
-            for text, score in pairs:
-                # можно включить порог уверенности: if CONF_THRESHOLD and score and score < CONF_THRESHOLD: skip
-                if CONF_THRESHOLD is not None and score is not None:
-                    try:
-                        if float(score) < float(CONF_THRESHOLD):
-                            # помечаем, но не добавляем — тут можно изменить логику
-                            doc.add_paragraph(f"{text}  (low_conf={score:.2f})")
-                            txt_file.write(f"{text}  (low_conf={score:.2f})\n")
-                            continue
-                    except Exception:
-                        pass
+# ---------- Режим «только поля» ----------
+def fields_page_rounds(page_count):
+    """Порядок распознавания: (1, N), (2, N-1), ... — шапка и реквизиты первыми."""
+    lo, hi = 1, page_count
+    while lo <= hi:
+        yield (lo, hi) if lo != hi else (lo,)
+        lo += 1
+        hi -= 1
+
+def missing_fields(pages):
+    """Поля FIELDS_REQUIRED, которые parser.py пока не находит в распознанных страницах."""
+    import parser
+    text, _ = parser.pages_to_text(jsonl_page_record(i, pages[i]) for i in sorted(pages))
+    with metrics.timed("fields_extract"):
+        fields = parser.extract_fields(text)
+    return [name for name in FIELDS_REQUIRED if fields.get(name) in (None, "")]
+
+def crop_region(page, region):
+    """Шапка ("head") или низ ("tail") страницы: (PIL.Image, сдвиг по y для рамок)."""
+    if region == "head":
+        return page.crop((0, 0, page.width, max(1, int(page.height * FIELDS_HEAD_SHARE)))), 0
+    top = min(page.height - 1, int(page.height * (1 - FIELDS_TAIL_SHARE)))
+    return page.crop((0, top, page.width, page.height)), top
+
+def process_pdf_fields(pdf_path, poppler_path=None, ocr=None, cache=None, io=None):
+    """
+    Быстрый режим для Excel: распознаёт страницы парами с краёв документа
+    (fields_page_rounds) и после каждой пары прогоняет экстракторы parser.py;
+    как только найдены все FIELDS_REQUIRED — остальные страницы не трогает.
+    Страницы с текстовым слоем и из кэша учитываются сразу и бесплатно.
+    FIELDS_CROP — сначала распознать только шапку первой и низ последней
+    страницы; если полей не хватило, эти страницы распознаются целиком.
+    В result.* попадают только распознанные страницы.
+    Возвращает папку с результатами, если ошибок не было, иначе None.
+    """
+    t_doc = time.perf_counter()
+    basename = os.path.splitext(os.path.basename(pdf_path))[0]
+    out_dir = os.path.join(BASE_OUTPUT_DIR, basename)
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"\n[FIELDS] {pdf_path} → {out_dir}")
 
-                # запись в doc & txt
-                if score is not None:
-                    doc.add_paragraph(f"{text}  (conf={score:.2f})")
-                    txt_file.write(f"{text}  (conf={score:.2f})\n")
-                else:
-                    doc.add_paragraph(text)
-                    txt_file.write(f"{text}\n")
+    try:
+        page_count = count_pdf_pages(pdf_path, poppler_path)
+    except Exception as e:
+        print(f"[ERROR] Не удалось конвертировать {pdf_path}: {e}")
+        return
 
-            txt_file.write("\n")
+    if cache is None:
+        cache = get_ocr_cache()
+    pdf_hash, pages = lookup_known_pages(cache, pdf_path, page_count, basename)
+    known = len(pages)
+    missing = missing_fields(pages) if pages else list(FIELDS_REQUIRED)
+    complete = True
 
-    # сохраняем docx
-    docx_path = os.path.join(out_dir, "result.docx")
-    doc.save(docx_path)
-    print(f"[DONE] Сохранены: {txt_path} и {docx_path}")
+    def ocr_page(page_idx, region=None):
+        nonlocal ocr
+        if ocr is None:
+            ocr = get_ocr_engine()
+        t0 = time.perf_counter()
+        page = rasterize_page(pdf_path, page_idx, dpi=DPI, poppler_path=poppler_path)
+        metrics.observe("raster", time.perf_counter() - t0)
+        dy = 0
+        if region is not None:
+            page, dy = crop_region(page, region)
+        with metrics.timed("to_array"):
+            image = page_to_array(page)
+        del page
+        print(f"[OCR] Обрабатываю {basename} (страница {page_idx}{', ' + region if region else ''})")
+        lines = page_lines(run_ocr(ocr, image), ocr)
+        if dy:
+            lines = lines.shifted(dy=dy)
+        metrics.inc("fields_pages_ocr")
+        return lines
+
+    cropped = set()
+    if FIELDS_CROP and missing and page_count:
+        crops = {}
+        for page_idx, region in ((1, "head"), (page_count, "tail")):
+            if page_idx in pages or page_idx in crops:
+                continue
+            try:
+                crops[page_idx] = ocr_page(page_idx, region)
+            except Exception as e:
+                print(f"[ERROR] OCR упал для {basename}, страница {page_idx}: {e}")
+        if crops:
+            still = missing_fields({**pages, **crops})
+            if not still:
+                pages.update(crops)
+                cropped = set(crops)
+                missing = still
+            else:
+                print(f"  [FIELDS] по шапке/реквизитам не найдены: {', '.join(still)} — страницы целиком")
+
+    for round_pages in fields_page_rounds(page_count):
+        if not missing:
+            break
+        todo = [i for i in round_pages if i not in pages]
+        if not todo:
+            continue
+        for page_idx in todo:
+            try:
+                lines = ocr_page(page_idx)
+            except Exception as e:
+                print(f"[ERROR] OCR упал для {basename}, страница {page_idx}: {e}")
+                metrics.inc("page_errors")
+                complete = False
+                continue
+            if cache is not None:
+                # страница растеризована в DPI мимо triage — ключ без лестницы triage
+                cache.put(cache_key(pdf_hash, page_idx, DPI), lines)
+            pages[page_idx] = lines
+        missing = missing_fields(pages)
+
+    writer = ReportWriter(out_dir, basename, io=io)
+    try:
+        for page_idx in sorted(pages):
+            writer.write_page(page_idx, pages[page_idx])
+    finally:
+        writer.close()
+
+    ocr_pages = len(pages) - known
+    metrics.inc("fields_pages_skipped", page_count - len(pages))
+    print(f"[FIELDS] {basename}: страниц {page_count}, распознано {ocr_pages}"
+          f"{' (обрезано: ' + ', '.join(map(str, sorted(cropped))) + ')' if cropped else ''}, "
+          f"текст/кэш {known}, пропущено {page_count - len(pages)}; "
+          f"{'все поля найдены' if not missing else 'не найдены: ' + ', '.join(missing)} "
+          f"за {time.perf_counter() - t_doc:.2f} с")
+    return out_dir if complete else None
 
 # ---------- Запуск для всех PDF в папке scans ----------
 if __name__ == "__main__":
+    # соседние модули делают `import prod` — пусть видят этот же модуль, а не вторую копию
+    sys.modules.setdefault("prod", sys.modules[__name__])
+
+    import argparse
+    ap = argparse.ArgumentParser(description="OCR всех PDF из папки scans")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="число OCR-процессов (0 = последовательный режим)")
+    ap.add_argument("--raster-workers", type=int, default=None,
+                    help="число процессов растеризации (по умолчанию = --workers)")
+    ap.add_argument("--queue-size", type=int, default=None,
+                    help="ёмкость очередей между стадиями (по умолчанию 2 * --workers)")
+    ap.add_argument("--rec-batch", type=int, default=REC_BATCH_SIZE,
+                    help="строк в пакете распознавания, общем для страниц и документов (0 = выкл.)")
+    ap.add_argument("--rec-max-wait", type=float, default=REC_MAX_WAIT,
+                    help="макс. ожидание неполного пакета распознавания, сек")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="не использовать кэш OCR (распознать все страницы заново)")
+    ap.add_argument("--force", action="store_true",
+                    help="обработать все PDF, даже не изменившиеся с прошлого запуска")
+    ap.add_argument("--no-journal", action="store_true",
+                    help="не вести журнал страниц (после падения документ начнётся сначала)")
+    ap.add_argument("--io-workers", type=int, default=ASYNC_IO_WORKERS,
+                    help="потоков фоновой записи результатов (0 = писать синхронно)")
+    ap.add_argument("--fields-only", action="store_true",
+                    help="распознавать только страницы, нужные для полей parser.py (с краёв документа)")
+    ap.add_argument("--fields-crop", action="store_true",
+                    help="в режиме --fields-only сначала распознать шапку первой и низ последней страницы")
+    ap.add_argument("--raw-lines", action="store_true",
+                    help="писать в result.txt/docx фрагменты детекции как есть, без склейки строк (layout.py)")
+    ap.add_argument("--no-docx", action="store_true",
+                    help="не писать result.docx (нужны только result.txt/result.jsonl)")
+    ap.add_argument("--no-text-layer", action="store_true",
+                    help="распознавать и страницы с текстовым слоем (цифровые PDF)")
+    ap.add_argument("--triage", action="store_true",
+                    help="пропускать пустые страницы и подбирать DPI по высоте строк (triage.py)")
+    ap.add_argument("--triage-dpis", default=None,
+                    help="допустимые DPI через запятую (по умолчанию %s)" % ",".join(map(str, triage.DPIS)))
+    ap.add_argument("--triage-min-conf", type=float, default=triage.MIN_CONF,
+                    help="средний confidence, ниже которого страница распознаётся заново в полном DPI")
+    ap.add_argument("--metrics", default=None,
+                    help="выгрузить замеры стадий и счётчики: *.prom — Prometheus, иначе JSON lines")
+    ap.add_argument("--profile", default=None,
+                    help="каталог для cProfile-профилей по документам (последовательный режим)")
+    args = ap.parse_args()
+
+    # SIGTERM (вытеснение машины, kill) — как Ctrl+C: недописанные result.* бросаются
+    import signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
     if not os.path.isdir(SCANS_DIR):
         print(f"[FATAL] Папка со сканами не найдена: {SCANS_DIR}")
         raise SystemExit(1)
@@ -195,6 +1120,95 @@ if __name__ == "__main__":
     if POPPLER_PATH and not poppler_path:
         print(f"[WARN] Указанный POPPLER_PATH '{POPPLER_PATH}' не найден — будет использован PATH или системный poppler (если есть).")
 
-    for pdf in pdf_files:
-        pdf_path = os.path.join(SCANS_DIR, pdf)
-        process_pdf(pdf_path, poppler_path=poppler_path)
+    REC_BATCH_SIZE = args.rec_batch
+    REC_MAX_WAIT = args.rec_max_wait
+    if args.no_cache:
+        OCR_CACHE_PATH = None
+    if args.metrics or args.profile:
+        metrics.configure(enabled=True, profile_dir=args.profile)
+    if args.triage:
+        triage.configure(dpis=args.triage_dpis and args.triage_dpis.split(","), min_conf=args.triage_min_conf)
+    if args.no_text_layer:
+        USE_TEXT_LAYER = False
+    if args.no_docx:
+        WRITE_DOCX = False
+    if args.raw_lines:
+        layout.configure(enabled=False)
+    if args.fields_crop:
+        FIELDS_CROP = True
+    mode = "fields" if args.fields_only else "full"
+
+    from manifest import Manifest
+    manifest = Manifest(OCR_MANIFEST_PATH)
+    pdf_paths = [os.path.join(SCANS_DIR, pdf) for pdf in sorted(pdf_files)]
+    if not args.force:
+        todo = [p for p in pdf_paths if not ocr_outputs_current(manifest, p, mode)]
+        if len(todo) < len(pdf_paths):
+            print(f"[SKIP] Без изменений с прошлого запуска: {len(pdf_paths) - len(todo)} PDF")
+        pdf_paths = todo
+    if not pdf_paths:
+        print("[OK] Новых или изменившихся PDF нет")
+        manifest.save()
+        raise SystemExit(0)
+
+    io = None
+    if args.io_workers > 0:
+        from aio import AsyncIO
+        io = AsyncIO(concurrency=args.io_workers)
+
+    journal = None
+    if OCR_JOURNAL_PATH and not args.no_journal:
+        from journal import Journal
+        journal = Journal(OCR_JOURNAL_PATH)
+        docs_left, pages_left = journal.unfinished()
+        if docs_left:
+            print(f"[JOURNAL] незавершённых документов с прошлого прогона: {docs_left} (страниц: {pages_left})")
+
+    if args.fields_only:
+        if args.workers > 0:
+            print("[WARN] --fields-only работает последовательно: следующая страница зависит от найденных полей")
+        done = []
+        for pdf_path in pdf_paths:
+            with metrics.profile_document(os.path.splitext(os.path.basename(pdf_path))[0]):
+                ok = process_pdf_fields(pdf_path, poppler_path=poppler_path, io=io)
+            metrics.inc("documents")
+            if ok:
+                done.append(pdf_path)
+    elif args.workers > 0:
+        from pipeline import run_batch
+        done = run_batch(pdf_paths, workers=args.workers, raster_workers=args.raster_workers,
+                         queue_size=args.queue_size, poppler_path=poppler_path, io=io, journal=journal)
+    else:
+        done = []
+        for pdf_path in pdf_paths:
+            with metrics.profile_document(os.path.splitext(os.path.basename(pdf_path))[0]):
+                ok = process_pdf(pdf_path, poppler_path=poppler_path, io=io, journal=journal)
+            metrics.inc("documents")
+            if ok:
+                done.append(pdf_path)
+
+    # в манифест попадают только документы, все файлы которых уже на диске
+    if io is not None:
+        done = drop_failed_writes(done, io.close())
+    for pdf_path in done:
+        record_ocr_outputs(manifest, pdf_path, mode)
+        if journal is not None:
+            journal.done(os.path.splitext(os.path.basename(pdf_path))[0])
+    if journal is not None:
+        journal.compact()
+        journal.close()
+
+    if args.workers <= 0 or args.fields_only:
+        print_engine_stats()
+        for batcher in _BATCHERS.values():
+            if batcher is not None:
+                from batching import print_rec_stats
+                print_rec_stats(batcher.stats)
+
+    manifest.save()
+    if _CACHE is not None:
+        _CACHE.print_stats()
+    if metrics.ENABLED:
+        metrics.print_summary()
+        if args.metrics:
+            metrics.dump(args.metrics, script="prod")
@@ -0,0 +1,451 @@
+# service.py — локальный HTTP-сервис OCR с тёплыми движками
+"""
+Долгоживущий процесс вместо запуска prod.py на каждый файл: модели грузятся
+один раз, страницы всех запросов идут через общую очередь и распознаются
+пакетами (batching.RecBatcher) с ограничением задержки.
+
+    python service.py [--port 8765] [--workers 1] [--queue-size 16] [--max-wait 0.2]
+
+Эндпоинты (JSON):
+    POST /jobs?name=<имя>        тело — PDF или изображение (PNG/JPEG/TIFF);
+                                 202 {"job_id": ...}; 429, если очередь заданий полна
+    GET  /jobs/<id>              статус и готовые страницы (?since=N — только страницы > N,
+                                 ?wait=сек — подождать новых страниц)
+    GET  /jobs/<id>/stream       постраничные результаты по мере готовности (NDJSON, chunked)
+    GET  /jobs/<id>/fields       поля договора (parser.extract_fields) по готовому заданию
+    GET  /health                 очереди, задания, статистика движка
+
+Страница в ответах — запись формата result.jsonl: {"page", "texts", "scores", "bboxes", "conf"}.
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import prod
+import metrics
+import triage
+
+# ---------- Настройки ----------
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_OCR_WORKERS = 1      # потоков OCR, у каждого свой тёплый движок
+SERVICE_QUEUE_SIZE = 16      # заданий в очереди; больше — 429 Too Many Requests
+SERVICE_PAGE_QUEUE = 8       # растеризованных страниц в очереди к OCR (backpressure)
+SERVICE_REC_BATCH = 32       # строк в пакете распознавания (0 = страница целиком)
+SERVICE_MAX_WAIT = 0.2       # сек: бюджет задержки неполного пакета
+SERVICE_MAX_UPLOAD_MB = 100
+SERVICE_MAX_JOBS = 1000      # сколько завершённых заданий помнить
+
+# ---------- Задания ----------
+class Job:
+    """Одно загруженное PDF/изображение и его постраничные результаты."""
+    def __init__(self, name, path, kind):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.path = path
+        self.kind = kind            # "pdf" или "image"
+        self.status = "queued"      # queued / running / done / failed
+        self.page_count = None
+        self.pages = {}             # номер -> запись страницы
+        self.errors = {}            # номер -> текст ошибки
+        self.error = None
+        self.pdf_hash = None
+        self.created = time.time()
+        self.finished = None
+        self.cond = threading.Condition()
+
+    def start(self, page_count, pdf_hash):
+        with self.cond:
+            self.status = "running"
+            self.page_count = page_count
+            self.pdf_hash = pdf_hash
+            self._check_done()
+
+    def add_page(self, page_idx, lines=None, error=None):
+        with self.cond:
+            if error is not None:
+                self.errors[page_idx] = error
+            else:
+                self.pages[page_idx] = prod.jsonl_page_record(page_idx, lines or [])
+            self._check_done()
+
+    def fail(self, error):
+        with self.cond:
+            self.error = error
+            self._finish("failed")
+
+    def _check_done(self):
+        # после fail() страницы, уже стоявшие в очереди, ещё приходят — статус не меняем
+        if self.status not in ("queued", "running"):
+            self.cond.notify_all()
+            return
+        if self.page_count is not None and len(self.pages) + len(self.errors) >= self.page_count:
+            self._finish("failed" if self.errors else "done")
+        self.cond.notify_all()
+
+    def _finish(self, status):
+        self.status = status
+        self.finished = time.time()
+        self.cond.notify_all()
+
+    def wait(self, since, timeout):
+        """Ждёт страницу с номером > since или завершения, не дольше timeout."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.status in ("queued", "running") and not any(i > since for i in self.pages):
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self.cond.wait(left)
+
+    def info(self, since=0):
+        with self.cond:
+            return {
+                "job_id": self.id,
+                "name": self.name,
+                "status": self.status,
+                "page_count": self.page_count,
+                "pages_done": len(self.pages),
+                "error": self.error,
+                "page_errors": {str(k): v for k, v in sorted(self.errors.items())},
+                "pages": [self.pages[i] for i in sorted(self.pages) if i > since],
+            }
+
+# ---------- Сервис ----------
+class OcrService:
+    """
+    Очереди и воркеры: submit() кладёт задание в ограниченную очередь,
+    поток растеризации режет его на страницы, OCR-потоки с тёплыми
+    движками распознают страницы всех заданий вперемешку.
+    """
+    def __init__(self, workers=SERVICE_OCR_WORKERS, queue_size=SERVICE_QUEUE_SIZE,
+                 rec_batch=SERVICE_REC_BATCH, max_wait=SERVICE_MAX_WAIT, poppler_path=None):
+        self.workers = max(1, int(workers))
+        self.rec_batch = rec_batch
+        self.max_wait = max_wait
+        self.poppler_path = poppler_path
+        self.job_q = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.page_q = queue.Queue(maxsize=SERVICE_PAGE_QUEUE)
+        self.jobs = {}
+        self._jobs_lock = threading.Lock()
+        self.cache = prod.get_ocr_cache()
+        self.tmp_dir = tempfile.mkdtemp(prefix="bcc-ocr-")
+        self.threads = []
+
+    def start(self):
+        # движки грузим до приёма запросов, чтобы первый запрос не ждал моделей
+        engines = [prod.create_ocr_engine() for _ in range(self.workers)]
+        self.threads.append(threading.Thread(target=self._raster_loop, name="raster", daemon=True))
+        for i, ocr in enumerate(engines):
+            self.threads.append(threading.Thread(target=self._ocr_loop, args=(ocr,), name=f"ocr-{i}", daemon=True))
+        for t in self.threads:
+            t.start()
+
+    def stop(self):
+        self.job_q.put(None)
+        for t in self.threads:
+            t.join(timeout=5)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    # ---- задания ----
+    def submit(self, name, data):
+        """Сохраняет загрузку и ставит в очередь; None, если очередь полна."""
+        if self.job_q.full():
+            # не пишем на диск то, что всё равно не примем
+            metrics.inc("service_rejected")
+            return None
+        kind = "pdf" if data[:5] == b"%PDF-" else "image"
+        job = Job(name, None, kind)
+        job.path = os.path.join(self.tmp_dir, f"{job.id}.{'pdf' if kind == 'pdf' else 'img'}")
+        with open(job.path, "wb") as f:
+            f.write(data)
+        try:
+            self.job_q.put_nowait(job)
+        except queue.Full:
+            os.remove(job.path)
+            metrics.inc("service_rejected")
+            return None
+        with self._jobs_lock:
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+        metrics.inc("service_jobs")
+        return job
+
+    def get(self, job_id):
+        with self._jobs_lock:
+            return self.jobs.get(job_id)
+
+    def _forget_old_jobs(self):
+        finished = [j for j in self.jobs.values() if j.finished is not None]
+        for job in sorted(finished, key=lambda j: j.finished)[:max(0, len(finished) - SERVICE_MAX_JOBS)]:
+            del self.jobs[job.id]
+
+    # ---- растеризация ----
+    def _raster_loop(self):
+        from ocr_cache import file_sha256
+        while True:
+            job = self.job_q.get()
+            if job is None:
+                for _ in range(self.workers):
+                    self.page_q.put(None)
+                break
+            try:
+                if job.kind == "image":
+                    from PIL import Image
+                    with Image.open(job.path) as img:
+                        image = prod.page_to_array(img)
+                    pdf_hash = file_sha256(job.path)
+                    cached = {}
+                    if self.cache is not None:
+                        lines = self.cache.get(prod.cache_key(pdf_hash, 1))
+                        cached = {1: lines} if lines is not None else {}
+                    job.start(1, pdf_hash)
+                    for idx, lines in cached.items():
+                        job.add_page(idx, lines)
+                    if not cached:
+                        self.page_q.put((job, 1, image))
+                    continue
+                page_count = prod.count_pdf_pages(job.path, self.poppler_path)
+                pdf_hash, cached = prod.lookup_known_pages(self.cache, job.path, page_count, job.name)
+                job.start(page_count, pdf_hash)
+                for idx, lines in cached.items():
+                    job.add_page(idx, lines)
+                todo = [i for i in range(1, page_count + 1) if i not in cached]
+                raster_dpi = triage.dpi_ladder(prod.DPI)[0] if triage.ENABLED else prod.DPI
+                tstats = triage.TriageStats(prod.DPI)
+                pages = prod.iter_pdf_pages(job.path, dpi=raster_dpi, poppler_path=self.poppler_path,
+                                            page_numbers=todo)
+                while True:
+                    # время растеризации страницы — для сэкономленного triage времени (TriageStats)
+                    t0 = time.perf_counter()
+                    try:
+                        idx, page = next(pages)
+                    except StopIteration:
+                        break
+                    raster_sec = time.perf_counter() - t0
+                    metrics.observe("raster", raster_sec)
+                    if triage.ENABLED:
+                        # без повтора при низком confidence: исходник удаляется сразу после растеризации
+                        decision, page = prod.triage_page(job.path, idx, page, raster_dpi, self.poppler_path,
+                                                          tstats, raster_sec, job.name)
+                        if decision.blank:
+                            if self.cache is not None:
+                                self.cache.put(prod.cache_key(pdf_hash, idx), [])
+                            job.add_page(idx, [])
+                            continue
+                    image = prod.page_to_array(page)
+                    del page
+                    self.page_q.put((job, idx, image))
+            except Exception as e:
+                print(f"[SERVICE] {job.name}: не удалось подготовить страницы: {e}")
+                job.fail(f"не удалось конвертировать: {e}")
+            finally:
+                # исходник больше не нужен: страницы уже в очереди к OCR
+                try:
+                    os.remove(job.path)
+                except OSError:
+                    pass
+
+    # ---- OCR с динамическими пакетами ----
+    def _ocr_loop(self, ocr):
+        batcher = prod.make_rec_batcher(ocr, self.rec_batch, self.max_wait)
+
+        def deliver(ready):
+            for (job, idx), lines, error in ready:
+                if error is None and self.cache is not None and job.pdf_hash:
+                    self.cache.put(prod.cache_key(job.pdf_hash, idx), lines)
+                job.add_page(idx, lines, error)
+
+        while True:
+            try:
+                # пока копится неполный пакет, ждём новые страницы не дольше бюджета задержки
+                item = self.page_q.get(timeout=batcher.time_left() if batcher is not None else None)
+            except queue.Empty:
+                deliver(batcher.poll())
+                continue
+            if item is None:
+                break
+            job, idx, image = item
+            try:
+                if batcher is not None:
+                    deliver(batcher.add_page((job, idx), image))
+                else:
+                    deliver([((job, idx), prod.page_lines(prod.run_ocr(ocr, image), ocr), None)])
+            except Exception as e:
+                deliver([((job, idx), None, f"OCR упал: {e}")])
+            del image
+        if batcher is not None:
+            deliver(batcher.flush())
+
+    def health(self):
+        with self._jobs_lock:
+            by_status = {}
+            for job in self.jobs.values():
+                by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            "status": "ok",
+            "queued_jobs": self.job_q.qsize(),
+            "queue_capacity": self.job_q.maxsize,
+            "queued_pages": self.page_q.qsize(),
+            "jobs": by_status,
+            "engine": dict(prod.ENGINE_STATS),
+        }
+
+def job_fields(job):
+    """Поля договора по готовому заданию — те же, что пишет parser.py."""
+    import parser
+    info = job.info()
+    text, scores = parser.pages_to_text(info["pages"])
+    fields = parser.extract_fields(text)
+    fields["avg_confidence"] = (sum(scores) / len(scores)) if scores else None
+    return fields
+
+# ---------- HTTP ----------
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None  # OcrService, задаётся в serve()
+
+    def log_message(self, fmt, *args):
+        print(f"[HTTP] {self.address_string()} {fmt % args}")
+
+    def _send_json(self, code, obj, headers=None):
+        body = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        return parts, parse_qs(url.query)
+
+    def do_POST(self):
+        parts, qs = self._route()
+        if parts != ["jobs"]:
+            return self._send_json(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return self._send_json(400, {"error": "некорректный Content-Length"})
+        if length <= 0:
+            return self._send_json(400, {"error": "пустое тело запроса"})
+        if length > SERVICE_MAX_UPLOAD_MB << 20:
+            return self._send_json(413, {"error": f"файл больше {SERVICE_MAX_UPLOAD_MB} МБ"})
+        data = self.rfile.read(length)
+        name = (qs.get("name") or ["upload"])[0]
+        job = self.service.submit(name, data)
+        if job is None:
+            return self._send_json(429, {"error": "очередь заданий полна, повторите позже"},
+                                   headers={"Retry-After": "1"})
+        self._send_json(202, {"job_id": job.id, "status": job.status})
+
+    def do_GET(self):
+        parts, qs = self._route()
+        if parts == ["health"]:
+            return self._send_json(200, self.service.health())
+        if len(parts) < 2 or parts[0] != "jobs":
+            return self._send_json(404, {"error": "not found"})
+        job = self.service.get(parts[1])
+        if job is None:
+            return self._send_json(404, {"error": "задание не найдено"})
+        if len(parts) == 2:
+            try:
+                since = int((qs.get("since") or ["0"])[0])
+                wait = float((qs.get("wait") or ["0"])[0])
+            except ValueError:
+                return self._send_json(400, {"error": "since — целое число, wait — число секунд"})
+            if wait > 0:
+                job.wait(since, min(wait, 60.0))
+            return self._send_json(200, job.info(since))
+        if parts[2] == "stream":
+            return self._stream(job)
+        if parts[2] == "fields":
+            if job.status in ("queued", "running"):
+                return self._send_json(409, {"error": "задание ещё выполняется", "status": job.status})
+            return self._send_json(200, {"job_id": job.id, "status": job.status, "fields": job_fields(job)})
+        return self._send_json(404, {"error": "not found"})
+
+    def _stream(self, job):
+        """Страницы по порядку номеров, по мере готовности; последняя строка — итог задания."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(obj):
+            data = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        next_page = 1
+        while True:
+            with job.cond:
+                while True:
+                    ready = job.pages.get(next_page)
+                    error = job.errors.get(next_page)
+                    finished = job.status not in ("queued", "running")
+                    if ready is not None or error is not None or finished:
+                        break
+                    job.cond.wait(1.0)
+            if ready is not None:
+                chunk(ready)
+            elif error is not None:
+                chunk({"page": next_page, "error": error})
+            else:
+                break
+            next_page += 1
+        with job.cond:
+            chunk({"job_id": job.id, "status": job.status, "page_count": job.page_count, "error": job.error})
+        self.wfile.write(b"0\r\n\r\n")
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT, **service_kwargs):
+    service = OcrService(**service_kwargs)
+    service.start()
+    ServiceHandler.service = service
+    httpd = ThreadingHTTPServer((host, port), ServiceHandler)
+    httpd.daemon_threads = True
+    print(f"[SERVICE] http://{host}:{port} — OCR-потоков: {service.workers}, "
+          f"очередь: {service.job_q.maxsize}, пакет: {service.rec_batch}, бюджет задержки: {service.max_wait} с")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[SERVICE] остановка")
+    finally:
+        httpd.server_close()
+        service.stop()
+        prod.print_engine_stats()
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Локальный HTTP-сервис OCR")
+    ap.add_argument("--host", default=SERVICE_HOST)
+    ap.add_argument("--port", type=int, default=SERVICE_PORT)
+    ap.add_argument("--workers", type=int, default=SERVICE_OCR_WORKERS,
+                    help="потоков OCR (у каждого свой движок)")
+    ap.add_argument("--queue-size", type=int, default=SERVICE_QUEUE_SIZE,
+                    help="заданий в очереди, сверх — 429")
+    ap.add_argument("--rec-batch", type=int, default=SERVICE_REC_BATCH,
+                    help="строк в пакете распознавания (0 = страница целиком)")
+    ap.add_argument("--max-wait", type=float, default=SERVICE_MAX_WAIT,
+                    help="бюджет задержки неполного пакета, сек")
+    ap.add_argument("--triage", action="store_true",
+                    help="пропускать пустые страницы и подбирать DPI по высоте строк (triage.py)")
+    ap.add_argument("--triage-dpis", default=None,
+                    help="допустимые DPI через запятую (по умолчанию %s)" % ",".join(map(str, triage.DPIS)))
+    args = ap.parse_args()
+    if args.triage:
+        triage.configure(dpis=args.triage_dpis and args.triage_dpis.split(","))
+    poppler_path = prod.POPPLER_PATH if prod.POPPLER_PATH and os.path.exists(prod.POPPLER_PATH) else None
+    serve(args.host, args.port, workers=args.workers, queue_size=args.queue_size,
+          rec_batch=args.rec_batch, max_wait=args.max_wait, poppler_path=poppler_path)
@@ -0,0 +1,173 @@
+# sinks.py — потоковая запись итоговой таблицы parser.py
+"""
+Строки таблицы пишутся по мере разбора, а не одним DataFrame в конце:
+
+  * xlsx    — openpyxl в режиме write_only (строки сразу уходят во временный
+              XML, в памяти не копятся); файл собирается во временный путь и
+              подменяет results.xlsx атомарно в close(), так что при падении
+              остаётся прошлая целая таблица. checkpoint() для xlsx ничего не
+              пишет: после падения готовые строки восстанавливаются только из
+              манифеста parser.py, а он держит все записи в памяти;
+  * csv     — строки дописываются в results.csv.part, checkpoint() делает
+              flush+fsync; close() подменяет им results.csv;
+  * parquet — каталог results.parquet.part/ из part-NNNNN.parquet, по файлу
+              на checkpoint; каждый part — законченный файл, который читается
+              pandas.read_parquet(каталог) даже после падения (нужен pyarrow).
+              close() ставит каталог на место results.parquet/.
+
+Прошлая таблица не трогается до close(): после падения или abort() на
+месте остаётся прежний целый results.*, а недописанное — в *.part.
+
+Формат выбирается по имени (open_sink), свой формат добавляется в SINKS.
+"""
+import os
+import csv
+import shutil
+
+class RecordSink:
+    """
+    Базовый приёмник строк: write(rec) для каждой записи (OrderedDict с
+    одинаковыми колонками), checkpoint() — зафиксировать уже записанное,
+    close() — завершить файл.
+    """
+    ext = None
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        self.rows = 0
+
+    def write(self, rec):
+        raise NotImplementedError
+
+    def checkpoint(self):
+        pass
+
+    def close(self):
+        pass
+
+    def abort(self):
+        """Прервать запись после ошибки: по умолчанию — сохранить то, что есть."""
+        self.close()
+
+class XlsxSink(RecordSink):
+    ext = ".xlsx"
+
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        from openpyxl import Workbook
+        self._tmp_path = path + ".tmp"
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet()
+        self._ws.append(self.columns)
+
+    def write(self, rec):
+        self._ws.append([rec.get(c) for c in self.columns])
+        self.rows += 1
+
+    def close(self):
+        if self._wb is None:
+            return
+        self._wb.save(self._tmp_path)
+        self._wb = None
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        # недописанную книгу не сохраняем — прошлый results.xlsx остаётся целым
+        self._wb = None
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+class CsvSink(RecordSink):
+    ext = ".csv"
+
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        self._part_path = path + ".part"
+        # utf-8-sig — чтобы Excel открывал кириллицу без танцев с кодировкой
+        self._file = open(self._part_path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+
+    def write(self, rec):
+        self._writer.writerow(["" if rec.get(c) is None else rec.get(c) for c in self.columns])
+        self.rows += 1
+
+    def checkpoint(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
+            os.replace(self._part_path, self.path)
+
+    def abort(self):
+        # прошлый results.csv остаётся целым
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._part_path)
+
+class ParquetSink(RecordSink):
+    ext = ".parquet"
+
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("для формата parquet нужен pyarrow: pip install pyarrow") from e
+        self._pa, self._pq = pa, pq
+        # части пишутся в отдельный каталог: прошлый results.parquet/ цел до close()
+        self._part_dir = path + ".part"
+        shutil.rmtree(self._part_dir, ignore_errors=True)  # остатки упавшего прогона
+        os.makedirs(self._part_dir)
+        self._closed = False
+        self._buffer = {c: [] for c in self.columns}
+        self._parts = 0
+
+    def write(self, rec):
+        for c in self.columns:
+            self._buffer[c].append(rec.get(c))
+        self.rows += 1
+
+    def checkpoint(self):
+        if not self._buffer[self.columns[0]]:
+            return
+        table = self._pa.table(self._buffer)
+        part_path = os.path.join(self._part_dir, f"part-{self._parts:05d}.parquet")
+        self._pq.write_table(table, part_path + ".tmp")
+        os.replace(part_path + ".tmp", part_path)
+        self._parts += 1
+        self._buffer = {c: [] for c in self.columns}
+
+    def close(self):
+        if self._closed:
+            return
+        self.checkpoint()
+        self._closed = True
+        # каталог нельзя подменить одним os.replace: прежний сначала отодвигается
+        old_dir = self.path + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.replace(self.path, old_dir)
+        os.replace(self._part_dir, self.path)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def abort(self):
+        if not self._closed:
+            self._closed = True
+            shutil.rmtree(self._part_dir, ignore_errors=True)
+
+SINKS = {"xlsx": XlsxSink, "csv": CsvSink, "parquet": ParquetSink}
+
+def sink_path(base_path, fmt):
+    """results.xlsx -> results.csv / results.parquet для выбранного формата."""
+    return os.path.splitext(base_path)[0] + SINKS[fmt].ext
+
+def open_sink(fmt, base_path, columns):
+    if fmt not in SINKS:
+        raise ValueError(f"Неизвестный формат таблицы: {fmt} (есть: {', '.join(SINKS)})")
+    return SINKS[fmt](sink_path(base_path, fmt), columns)
@@ -0,0 +1,62 @@
+# test_journal.py — журнал страниц для продолжения после падения (journal.py)
+import json
+
+from journal import Journal
+from ocr_result import PageResult
+
+def _page(text):
+    return PageResult.from_lines([(text, 0.9, [[0, 0], [10, 0], [10, 5], [0, 5]])])
+
+def _crashed_run(path, pages=(1, 2), pdf_hash="h1"):
+    """Документ начат, страницы записаны, done не было — как после падения."""
+    journal = Journal(str(path), fsync=False)
+    journal.start("doc", pdf_hash, 5)
+    for i in pages:
+        journal.page("doc", i, _page(f"страница {i}"))
+    journal.close()
+
+def test_resume_after_crash(tmp_path):
+    path = tmp_path / "ocr_journal.jsonl"
+    _crashed_run(path)
+    journal = Journal(str(path), fsync=False)
+    assert journal.unfinished() == (1, 2)
+    resumed = journal.resume("doc", "h1")
+    assert sorted(resumed) == [1, 2]
+    assert resumed[2].texts == ["страница 2"]
+    assert resumed[2].score_list() == [0.9]
+
+def test_torn_last_line_is_skipped(tmp_path):
+    path = tmp_path / "ocr_journal.jsonl"
+    _crashed_run(path)
+    # падение посреди записи третьей страницы
+    line = json.dumps({"ev": "page", "doc": "doc", "page": 3, "lines": _page("x").to_json()})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line[:len(line) // 2])
+    journal = Journal(str(path), fsync=False)
+    assert sorted(journal.resume("doc", "h1")) == [1, 2]
+    # после уплотнения при открытии журнал снова читается целиком
+    journal.page("doc", 3, _page("страница 3"))
+    journal.close()
+    assert sorted(Journal(str(path), fsync=False).resume("doc", "h1")) == [1, 2, 3]
+
+def test_changed_pdf_invalidates_pages(tmp_path):
+    path = tmp_path / "ocr_journal.jsonl"
+    _crashed_run(path)
+    journal = Journal(str(path), fsync=False)
+    assert journal.resume("doc", "h2") == {}
+    # новый прогон изменившегося PDF начинает документ заново
+    journal.start("doc", "h2", 5)
+    journal.close()
+    journal = Journal(str(path), fsync=False)
+    assert journal.resume("doc", "h2") == {}
+    assert journal.resume("doc", "h1") == {}
+
+def test_done_documents_are_compacted(tmp_path):
+    path = tmp_path / "ocr_journal.jsonl"
+    _crashed_run(path)
+    journal = Journal(str(path), fsync=False)
+    journal.done("doc")
+    journal.compact()
+    journal.close()
+    assert path.read_text(encoding="utf-8") == ""
+    assert Journal(str(path), fsync=False).unfinished() == (0, 0)
@@ -0,0 +1,122 @@
+# test_layout.py — строки в порядке чтения по рамкам детекции (layout.py)
+import numpy as np
+
+import layout
+import parser
+from ocr_result import PageResult
+
+def _box(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+def _page(*fragments):
+    """fragments — (text, score, (x0, y0, x1, y1))."""
+    return PageResult.from_lines([(text, score, _box(*rect)) for text, score, rect in fragments])
+
+def test_fragments_of_one_row_are_merged_left_to_right():
+    page = _page(
+        ("нижеследующем:", 0.90, (400, 102, 560, 128)),
+        ("именуемые", 0.99, (100, 100, 220, 126)),
+        ("в", 0.80, (230, 101, 245, 127)),
+        ("дальнейшем", 0.95, (255, 100, 390, 126)),
+        ("Стороны договорились", 0.97, (100, 150, 330, 176)),
+    )
+    out = layout.reading_order(page)
+    assert out.texts == ["именуемые в дальнейшем нижеследующем:", "Стороны договорились"]
+    # рамка строки — объединение рамок фрагментов
+    assert out.boxes[0].min(axis=0).tolist() == [100, 100]
+    assert out.boxes[0].max(axis=0).tolist() == [560, 128]
+    # одиночный фрагмент сохраняет свою оценку как есть
+    assert out.scores[1] == 0.97
+
+def test_row_score_is_weighted_by_text_length():
+    out = layout.reading_order(_page(("аааа", 1.0, (0, 0, 40, 20)), ("б", 0.5, (45, 0, 55, 20))))
+    assert np.isclose(out.scores[0], (4 * 1.0 + 1 * 0.5) / 5)
+
+def test_wide_gap_splits_columns():
+    # промежуток больше MERGE_GAP высот строки — другая колонка, отдельная строка
+    page = _page(
+        ("Поставщик:", 0.9, (50, 100, 200, 124)),
+        ("Покупатель:", 0.9, (600, 101, 760, 125)),
+        ("ТОО «Альфа»", 0.9, (50, 140, 210, 164)),
+        ("ООО «Бета»", 0.9, (600, 141, 750, 165)),
+    )
+    assert layout.reading_order(page).texts == ["Поставщик:", "Покупатель:", "ТОО «Альфа»", "ООО «Бета»"]
+
+def test_duplicate_inside_neighbour_is_dropped():
+    page = _page(
+        ("повреждений во время транспортировки.", 0.95, (100, 300, 520, 326)),
+        ("повреждений.", 0.60, (102, 301, 240, 325)),
+    )
+    out = layout.reading_order(page)
+    assert out.texts == ["повреждений во время транспортировки."]
+    assert out.scores.tolist() == [0.95]
+
+def test_overlapping_different_text_is_kept():
+    page = _page(("Сумма", 0.9, (100, 300, 180, 326)), ("Итого", 0.9, (102, 301, 178, 325)))
+    # рамки совпадают, но текст другой — не дубликат, оба фрагмента остаются в строке
+    assert layout.reading_order(page).texts == ["Сумма Итого"]
+
+def test_page_without_boxes_is_unchanged():
+    page = PageResult.from_lines([("б", 0.9), ("а", 0.8)])
+    assert layout.reading_order(page) is page
+
+def test_parser_text_is_merged_but_scores_stay_raw():
+    rec = _page(
+        ("Договор", 0.99, (100, 100, 190, 126)),
+        ("№ 15", 0.60, (200, 100, 250, 126)),
+        ("Договор", 0.50, (101, 101, 189, 125)),
+    ).record(1)
+    text, scores = parser.pages_to_text([rec])
+    assert text.splitlines()[1].startswith("Договор № 15  (conf=")
+    # confidence — по фрагментам детекции, как в result.quality.json
+    assert scores == [0.99, 0.6, 0.5]
+
+# страница договора, как её режет детектор: строки на куски, дубликат внутри соседнего фрагмента
+CONTRACT_PAGE = (
+    ("ДОГОВОР", 0.99, (300, 40, 420, 66)),
+    ("№ 24022311", 0.97, (430, 40, 560, 66)),
+    ("г. Алматы", 0.98, (50, 90, 160, 114)),
+    ("Дата заключения:", 0.96, (520, 90, 700, 114)),
+    ("15.03.2024", 0.95, (710, 91, 820, 115)),
+    ("ТОО «Альфа Трейд»,", 0.93, (50, 140, 250, 164)),
+    ("именуемое в дальнейшем", 0.97, (260, 140, 520, 164)),
+    ("«Поставщик», с одной стороны", 0.94, (530, 141, 830, 165)),
+    ("Поставщик", 0.60, (531, 142, 640, 164)),
+    ("Сумма договора:", 0.97, (50, 190, 220, 214)),
+    ("1 500 000", 0.91, (230, 190, 330, 214)),
+    ("тенге", 0.95, (340, 190, 400, 214)),
+    ("Валюта платежа:", 0.96, (50, 240, 230, 264)),
+    ("тенге (KZT)", 0.94, (50, 270, 180, 294)),
+    ("Срок действия:", 0.95, (50, 320, 210, 344)),
+    ("до 31.12.2024", 0.92, (220, 320, 360, 344)),
+)
+
+def test_extractors_on_merged_and_raw_lines(monkeypatch):
+    rec = _page(*CONTRACT_PAGE).record(1)
+    merged = parser.extract_fields(parser.pages_to_text([rec])[0])
+    assert dict(merged) == {
+        "contract_number": "24022311",
+        "date_start": "2024-03-15",
+        "date_end": "2024-12-31",
+        "counterparty": "ТОО «Альфа Трейд»",
+        "amount": 1500000.0,
+        "currency": "тенге",
+        # валюта платежа — на строке после "Валюта платежа:", склейка её туда не тянет
+        "payment_currency": "тенге",
+    }
+
+    monkeypatch.setattr(layout, "ENABLED", False)
+    raw = parser.extract_fields(parser.pages_to_text([rec])[0])
+    # номер, даты по маркерам и валюта со следующей строки находятся и без склейки
+    for field in ("contract_number", "date_start", "date_end", "payment_currency"):
+        assert raw[field] == merged[field]
+    # а сумма, оторванная от "Сумма договора:", и имя перед "именуемое" — нет
+    assert raw["amount"] != merged["amount"]
+    assert raw["counterparty"] != merged["counterparty"]
+
+def test_signature_follows_settings(monkeypatch):
+    sig = layout.signature()
+    monkeypatch.setattr(layout, "MERGE_GAP", layout.MERGE_GAP + 1)
+    assert layout.signature() != sig
+    monkeypatch.setattr(layout, "ENABLED", False)
+    assert layout.signature() == "raw"
@@ -0,0 +1,95 @@
+# test_pipeline.py — конвейер prod.py --workers (pipeline.py)
+import os
+import time
+import queue
+import threading
+import multiprocessing as mp
+
+import pipeline
+
+# ---- цели процессов: на уровне модуля, чтобы их видел spawn ----
+def _ocr_dies(page_q):
+    os._exit(1)  # как OOM-kill или падение движка
+
+def _ocr_consumes(page_q):
+    while page_q.get() is not None:
+        pass
+
+def _raster_puts(page_q, n):
+    for i in range(n):
+        page_q.put(i)
+
+def _start(target, *args):
+    p = mp.get_context("spawn").Process(target=target, args=args)
+    p.start()
+    return p
+
+def test_dead_ocr_does_not_hang_raster():
+    page_q = mp.get_context("spawn").Queue(maxsize=1)
+    ocr = [_start(_ocr_dies, page_q)]
+    raster = [_start(_raster_puts, page_q, 1000) for _ in range(2)]
+    pipeline._join_workers(raster, ocr, page_q, poll=0.1)
+    assert not any(p.is_alive() for p in raster + ocr)
+    assert ocr[0].exitcode == 1
+
+def test_sentinels_only_for_live_ocr():
+    # один OCR-процесс умер, очередь на одно место: лишний None не должен блокировать
+    page_q = mp.get_context("spawn").Queue(maxsize=1)
+    ocr = [_start(_ocr_dies, page_q), _start(_ocr_consumes, page_q), _start(_ocr_dies, page_q)]
+    raster = [_start(_raster_puts, page_q, 20)]
+    pipeline._join_workers(raster, ocr, page_q, poll=0.1)
+    assert raster[0].exitcode == 0
+    assert ocr[1].exitcode == 0
+
+# ---- поток записи: result.* подменяются только целым документом ----
+def _doc(tmp_path, name, page_count):
+    out_dir = tmp_path / name
+    out_dir.mkdir()
+    (out_dir / "result.txt").write_text("прошлый результат\n", encoding="utf-8")
+    return pipeline._DocState(name, str(tmp_path / f"{name}.pdf"), str(out_dir), page_count)
+
+def _page_msg(name, page_idx, error=None):
+    lines = None if error else [(f"{name} страница {page_idx}", 0.9)]
+    return ("page", name, page_idx, lines, error, False)
+
+def _run_writer(docs, messages, stop=None):
+    q = queue.Queue()
+    for msg in messages:
+        q.put(msg)
+    if stop is None:
+        q.put(("eof",))
+    t = threading.Thread(target=pipeline._writer_thread, args=(q, docs, {}, {}, None),
+                         kwargs={"stop": stop})
+    t.start()
+    if stop is not None:
+        time.sleep(0.2)
+        stop.set()
+    t.join(timeout=10)
+    assert not t.is_alive()
+
+def _files(st):
+    return sorted(os.listdir(st.out_dir))
+
+def _text(st):
+    with open(os.path.join(st.out_dir, "result.txt"), encoding="utf-8") as f:
+        return f.read()
+
+def test_writer_commits_only_whole_error_free_documents(tmp_path):
+    ok, failed, partial = _doc(tmp_path, "ok", 2), _doc(tmp_path, "failed", 3), _doc(tmp_path, "partial", 2)
+    docs = {st.basename: st for st in (ok, failed, partial)}
+    _run_writer(docs, [
+        _page_msg("ok", 2), _page_msg("ok", 1),
+        _page_msg("failed", 1), _page_msg("failed", 2, error="OCR упал"), _page_msg("failed", 3),
+        _page_msg("partial", 1),  # страница 2 так и не пришла (умер воркер)
+    ])
+    assert "ok страница 2" in _text(ok)
+    assert pipeline._completed(docs) == [ok.pdf_path]
+    for st in (failed, partial):
+        assert _text(st) == "прошлый результат\n"
+        assert _files(st) == ["result.txt"]
+
+def test_writer_aborts_open_documents_on_stop(tmp_path):
+    st = _doc(tmp_path, "doc", 3)
+    _run_writer({"doc": st}, [_page_msg("doc", 1)], stop=threading.Event())
+    assert _text(st) == "прошлый результат\n"
+    assert _files(st) == ["result.txt"]
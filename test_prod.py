@@ -0,0 +1,146 @@
+# test_prod.py — атомарная запись result.* и продолжение документа после падения (prod.py)
+import os
+
+import pytest
+from PIL import Image
+
+import prod
+from journal import Journal
+from ocr_result import PageResult
+
+PAGES = 4
+
+@pytest.fixture
+def out_base(tmp_path, monkeypatch):
+    """prod без моделей, poppler и кэша: вывод в tmp_path, страницы — пустые картинки."""
+    base = tmp_path / "output"
+    monkeypatch.setattr(prod, "BASE_OUTPUT_DIR", str(base))
+    monkeypatch.setattr(prod, "OCR_CACHE_PATH", None)
+    monkeypatch.setattr(prod, "_CACHE", None)
+    monkeypatch.setattr(prod, "USE_TEXT_LAYER", False)
+    monkeypatch.setattr(prod, "count_pdf_pages", lambda pdf_path, poppler_path=None: PAGES)
+
+    def iter_pages(pdf_path, dpi=prod.DPI, poppler_path=None, page_numbers=None, **kw):
+        for i in page_numbers:
+            yield i, Image.new("RGB", (8, 8), "white")
+    monkeypatch.setattr(prod, "iter_pdf_pages", iter_pages)
+    return base
+
+class FakeEngine:
+    """
+    Вместо run_ocr: "распознаёт" страницы todo по порядку (ответ — номер
+    страницы), на странице crash_on прогон падает.
+    """
+    def __init__(self, todo, crash_on=None):
+        self.todo = list(todo)
+        self.crash_on = crash_on
+        self.pages = []
+
+    def run(self, ocr, image):
+        page_idx = self.todo.pop(0)
+        if page_idx == self.crash_on:
+            raise KeyboardInterrupt
+        self.pages.append(page_idx)
+        return page_idx
+
+def _run(monkeypatch, pdf, journal, crash_on=None, todo=None):
+    engine = FakeEngine(todo or range(1, PAGES + 1), crash_on)
+    monkeypatch.setattr(prod, "run_ocr", engine.run)
+    monkeypatch.setattr(prod, "page_lines",
+                        lambda raw, ocr=None: PageResult.from_lines([(f"текст страницы {raw}", 0.95)]))
+    out_dir = prod.process_pdf(str(pdf), ocr=object(), journal=journal)
+    return engine, out_dir
+
+def _pdf(tmp_path):
+    pdf = tmp_path / "doc.pdf"
+    pdf.write_bytes(b"%PDF-1.4 test document")
+    return pdf
+
+def test_abort_keeps_previous_results(tmp_path):
+    out_dir = tmp_path / "doc"
+    writer = prod.ReportWriter(str(out_dir), "doc")
+    writer.write_page(1, [("старый текст", 0.9)])
+    writer.close()
+    before = {name: (out_dir / name).read_bytes() for name in os.listdir(out_dir)}
+    assert "result.txt" in before
+
+    writer = prod.ReportWriter(str(out_dir), "doc")
+    writer.write_page(1, [("новый текст", 0.9)])
+    writer.abort()
+    after = {name: (out_dir / name).read_bytes() for name in os.listdir(out_dir)}
+    assert after == before  # ни *.part, ни наполовину записанных result.*
+
+def test_crash_then_resume_from_journal(tmp_path, monkeypatch, out_base):
+    pdf = _pdf(tmp_path)
+    journal_path = str(tmp_path / "ocr_journal.jsonl")
+    out_dir = out_base / "doc"
+    out_dir.mkdir(parents=True)
+    (out_dir / "result.txt").write_text("прошлый результат\n", encoding="utf-8")
+
+    # первый прогон падает на третьей странице
+    journal = Journal(journal_path, fsync=False)
+    with pytest.raises(KeyboardInterrupt):
+        _run(monkeypatch, pdf, journal, crash_on=3)
+    journal.close()
+    assert (out_dir / "result.txt").read_text(encoding="utf-8") == "прошлый результат\n"
+    assert not [n for n in os.listdir(out_dir) if n.endswith(".part")]
+
+    # повторный запуск берёт страницы 1-2 из журнала и распознаёт только остальные
+    journal = Journal(journal_path, fsync=False)
+    assert journal.unfinished() == (1, 2)
+    engine, done_dir = _run(monkeypatch, pdf, journal, todo=[3, 4])
+    journal.close()
+    assert engine.pages == [3, 4]
+    assert done_dir == str(out_dir)
+    text = (out_dir / "result.txt").read_text(encoding="utf-8")
+    for i in range(1, PAGES + 1):
+        assert f"--- Страница {i} ---\nтекст страницы {i}" in text
+
+def test_no_docx_removes_stale_docx(tmp_path, monkeypatch):
+    out_dir = tmp_path / "doc"
+    writer = prod.ReportWriter(str(out_dir), "doc")
+    writer.write_page(1, [("старый текст", 0.9)])
+    writer.close()
+    assert (out_dir / "result.docx").exists()
+
+    monkeypatch.setattr(prod, "WRITE_DOCX", False)
+    writer = prod.ReportWriter(str(out_dir), "doc")
+    writer.write_page(1, [("новый текст", 0.9)])
+    writer.close()
+    assert not (out_dir / "result.docx").exists()
+    assert "result.docx" not in prod.ocr_output_files()
+
+def test_layout_change_makes_outputs_stale(tmp_path, monkeypatch, out_base):
+    import layout
+    from manifest import Manifest
+    pdf = _pdf(tmp_path)
+    _run(monkeypatch, pdf, journal=None)
+    manifest = Manifest(str(tmp_path / "ocr_manifest.json"))
+    prod.record_ocr_outputs(manifest, str(pdf))
+    assert prod.ocr_outputs_current(manifest, str(pdf))
+
+    # --raw-lines: result.txt/docx собраны иначе — нужен новый прогон
+    monkeypatch.setattr(layout, "ENABLED", False)
+    assert not prod.ocr_outputs_current(manifest, str(pdf))
+
+def test_full_dpi_pages_are_cached_apart_from_triage(monkeypatch):
+    import triage
+    monkeypatch.setattr(prod, "engine_signature", lambda: "engine")
+    monkeypatch.setattr(triage, "ENABLED", True)
+    assert prod.cache_key("hash", 1) != prod.cache_key("hash", 1, prod.DPI)
+    monkeypatch.setattr(triage, "ENABLED", False)
+    assert prod.cache_key("hash", 1) == prod.cache_key("hash", 1, prod.DPI)
+
+def test_result_adapter_is_dropped_with_its_engine():
+    import gc
+
+    class Engine:
+        pass
+    engine = Engine()
+    adapter = prod.result_adapter(engine)
+    assert prod.result_adapter(engine) is adapter
+    assert prod.result_adapter(Engine()) is not adapter
+    del engine
+    gc.collect()
+    # движок собран — его адаптер не достанется новому движку с тем же id()
+    assert adapter not in prod._ADAPTERS.values()
@@ -0,0 +1,50 @@
+# test_sinks.py — итоговая таблица подменяется только целиком (sinks.py)
+import os
+
+import pytest
+
+from sinks import open_sink
+
+COLUMNS = ("file_folder", "amount")
+
+def _write(fmt, base, names, finish):
+    sink = open_sink(fmt, str(base), COLUMNS)
+    for name in names:
+        sink.write({"file_folder": name, "amount": 1.0})
+        sink.checkpoint()
+    getattr(sink, finish)()
+    return sink.path
+
+def test_csv_keeps_previous_table_until_close(tmp_path):
+    base = tmp_path / "results.xlsx"
+    path = _write("csv", base, ["a", "b"], "close")
+    before = open(path, encoding="utf-8-sig").read()
+
+    sink = open_sink("csv", str(base), COLUMNS)
+    sink.write({"file_folder": "c", "amount": 2.0})
+    sink.checkpoint()
+    # прогон ещё идёт (или упал): results.csv — прежний
+    assert open(path, encoding="utf-8-sig").read() == before
+    sink.abort()
+    assert open(path, encoding="utf-8-sig").read() == before
+    assert not os.path.exists(path + ".part")
+
+    _write("csv", base, ["c"], "close")
+    assert open(path, encoding="utf-8-sig").read().splitlines() == ["file_folder,amount", "c,1.0"]
+
+def test_parquet_keeps_previous_parts_until_close(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    base = tmp_path / "results.xlsx"
+    path = _write("parquet", base, ["a", "b"], "close")
+
+    sink = open_sink("parquet", str(base), COLUMNS)
+    sink.write({"file_folder": "c", "amount": 2.0})
+    sink.checkpoint()
+    assert pd.read_parquet(path)["file_folder"].tolist() == ["a", "b"]
+    sink.abort()
+    assert pd.read_parquet(path)["file_folder"].tolist() == ["a", "b"]
+
+    _write("parquet", base, ["c"], "close")
+    assert pd.read_parquet(path)["file_folder"].tolist() == ["c"]
+    assert not os.path.exists(path + ".part")
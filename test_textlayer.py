@@ -0,0 +1,53 @@
+# test_textlayer.py — когда страницы берутся из текстового слоя (textlayer.py)
+import io
+
+import pytest
+from PIL import Image
+
+import textlayer
+
+fitz = pytest.importorskip("pymupdf")
+
+STAMP = "Signed with a qualified electronic signature: Ivanov I.I., certificate 01AB23CD45EF6789"
+BODY = "Supply contract No. 15-7/22 between the Supplier and the Buyer, clause {}"
+
+def _scan_png(width=595, height=842):
+    buf = io.BytesIO()
+    Image.new("L", (width, height), 235).save(buf, format="PNG")
+    return buf.getvalue()
+
+def _pdf(path, body_lines=0, full_page_image=False, stamp=False):
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    if full_page_image:
+        page.insert_image(page.rect, stream=_scan_png())
+    for i in range(body_lines):
+        page.insert_text((40, 60 + 18 * i), BODY.format(i + 1), fontsize=11)
+    if stamp:
+        page.insert_text((40, 820), STAMP, fontsize=9)
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+def test_digital_page_uses_text_layer(tmp_path):
+    pdf = _pdf(tmp_path / "digital.pdf", body_lines=40)
+    found = textlayer.page_lines(pdf, [1], 200)
+    assert list(found) == [1]
+    assert len(found[1]) == 40
+    assert found[1].texts[0] == BODY.format(1)
+
+def test_scan_with_signature_stamp_goes_to_ocr(tmp_path):
+    # скан на всю страницу и одна строка штампа подписи поверх: текст слоя "хороший",
+    # но весь договор — в картинке
+    pdf = _pdf(tmp_path / "hybrid.pdf", full_page_image=True, stamp=True)
+    assert textlayer.page_lines(pdf, [1], 200) == {}
+
+def test_lone_stamp_line_goes_to_ocr(tmp_path):
+    pdf = _pdf(tmp_path / "stamp.pdf", stamp=True)
+    assert textlayer.page_lines(pdf, [1], 200) == {}
+
+def test_is_digital_geometry():
+    lines = [(BODY.format(i), 1.0) for i in range(5)]
+    assert textlayer.is_digital(lines)
+    assert not textlayer.is_digital(lines, image_cover=0.95)
+    assert not textlayer.is_digital(lines, text_cover=0.01)
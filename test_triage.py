@@ -0,0 +1,25 @@
+# test_triage.py — сортировка страниц перед OCR (triage.py)
+from PIL import Image, ImageDraw
+
+import triage
+
+def _page(background, ink):
+    page = Image.new("L", (1000, 1400), background)
+    draw = ImageDraw.Draw(page)
+    for y in range(100, 1300, 40):
+        draw.text((100, y), "Договор поставки № 1 от 01.01.2024 " * 2, fill=ink)
+    return page
+
+def test_white_page_is_blank():
+    assert triage.assess(Image.new("L", (1000, 1400), 255), 200, 300).blank
+
+def test_dark_text_on_white_is_not_blank():
+    decision = triage.assess(_page(255, 0), 200, 300)
+    assert not decision.blank
+    assert decision.ink > triage.BLANK_INK
+
+def test_dark_background_is_not_dropped():
+    # светлый текст на тёмной подложке: порог от фона не построить — страница идёт в OCR в полном DPI
+    decision = triage.assess(_page(20, 230), 200, 300)
+    assert not decision.blank
+    assert decision.dpi == 300
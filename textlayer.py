@@ -0,0 +1,137 @@
+# textlayer.py — текстовый слой цифровых PDF вместо OCR
+"""
+Многие договоры приходят не сканами, а цифровыми PDF (в т.ч. подписанными),
+в которых текст уже есть. Для таких страниц растеризация и PaddleOCR не
+нужны: page_lines() достаёт строки текстового слоя в той же структуре, что
+и prod.page_lines — ocr_result.PageResult, рамки — четыре точки в пикселях
+страницы при заданном DPI, score = 1.0 (текст взят из файла как есть).
+
+Страница считается цифровой, если в её слое не меньше MIN_CHARS символов,
+доля "нормальных" символов (буквы, цифры, пунктуация) не ниже
+MIN_GOOD_RATIO и текст выглядит как текст: ни один символ не занимает
+больше MAX_SAME_CHAR всех символов и разных букв не меньше
+MIN_DISTINCT_LETTERS. Так отсеиваются пустые слои сканов и слои со
+сломанной кодировкой шрифта (U+FFFD, private use, все буквы одним глифом).
+
+Кроме текста смотрится геометрия страницы: скан с наложенной строкой
+(штамп электронной подписи поверх картинки договора) проходит проверки
+текста, но весь договор — в картинке. Поэтому слой не используется, если
+картинки занимают не меньше MAX_IMAGE_COVER площади страницы или строки
+слоя — меньше MIN_TEXT_COVER. Остальные страницы идут в OCR как раньше.
+
+Нужен PyMuPDF (ставится вместе с paddleocr); если его нет, available()
+возвращает False и всё распознаётся через OCR.
+"""
+import unicodedata
+from collections import Counter
+
+from ocr_result import PageResult
+
+MIN_CHARS = 50           # меньше символов на странице — считаем сканом
+MIN_GOOD_RATIO = 0.9     # доля нормальных символов в слое
+MAX_SAME_CHAR = 0.3      # доля самого частого символа, выше — сломанная кодировка
+MIN_DISTINCT_LETTERS = 10
+MAX_IMAGE_COVER = 0.5    # доля площади страницы под картинками, с которой страница — скан
+MIN_TEXT_COVER = 0.05    # доля площади страницы под строками слоя, меньше — наложенный штамп
+TEXT_LAYER_SCORE = 1.0   # confidence строк из текстового слоя
+
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        import fitz
+    except ImportError:
+        fitz = None
+
+def available():
+    return fitz is not None
+
+def _good_char(ch):
+    if ch.isspace():
+        return True
+    cat = unicodedata.category(ch)
+    # буквы, цифры, пунктуация и обычные символы (№, §, валюты); не Co/Cn/Cc и не U+FFFD
+    return cat[0] in "LNP" or (cat[0] == "S" and ch != "\ufffd")
+
+def text_quality(text):
+    """(символов без пробелов, доля нормальных, доля самого частого символа, разных букв)."""
+    chars = [ch for ch in text if not ch.isspace()]
+    if not chars:
+        return 0, 0.0, 0.0, 0
+    counts = Counter(chars)
+    good = sum(n for ch, n in counts.items() if _good_char(ch))
+    letters = sum(1 for ch in counts if ch.isalpha())
+    return len(chars), good / len(chars), max(counts.values()) / len(chars), letters
+
+def is_digital(lines, image_cover=0.0, text_cover=1.0):
+    """
+    Пригоден ли слой страницы. image_cover / text_cover — доли площади страницы
+    под картинками и под строками слоя (см. _page_layer).
+    """
+    if image_cover >= MAX_IMAGE_COVER or text_cover < MIN_TEXT_COVER:
+        return False
+    n, good, same, letters = text_quality("".join(t for t, *_ in lines))
+    return (n >= MIN_CHARS and good >= MIN_GOOD_RATIO and same <= MAX_SAME_CHAR
+            and letters >= MIN_DISTINCT_LETTERS)
+
+def _cover(rects, page_rect):
+    """Доля площади страницы под прямоугольниками (перекрытия не вычитаются, не больше 1)."""
+    area = page_rect.width * page_rect.height
+    if area <= 0:
+        return 0.0
+    total = 0.0
+    for x0, y0, x1, y1 in rects:
+        w = min(x1, page_rect.x1) - max(x0, page_rect.x0)
+        h = min(y1, page_rect.y1) - max(y0, page_rect.y0)
+        if w > 0 and h > 0:
+            total += w * h
+    return min(1.0, total / area)
+
+def _page_layer(page, scale):
+    """(строки слоя в порядке чтения, доля страницы под картинками, доля под строками)."""
+    lines, rects = [], []
+    # картинки — по get_image_info, без выгрузки их данных в get_text
+    flags = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+    for block in page.get_text("dict", flags=flags)["blocks"]:
+        if block.get("type", 0) != 0:
+            continue
+        for line in block["lines"]:
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if not text:
+                continue
+            rects.append(line["bbox"])
+            x0, y0, x1, y1 = (round(v * scale, 1) for v in line["bbox"])
+            lines.append((text, TEXT_LAYER_SCORE, [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]))
+    images = [info["bbox"] for info in page.get_image_info()]
+    return sorted_lines(lines), _cover(images, page.rect), _cover(rects, page.rect)
+
+def sorted_lines(lines):
+    """Порядок чтения как у OCR (sorted_boxes PaddleOCR): сверху вниз, в строке — слева направо."""
+    lines = sorted(lines, key=lambda l: (l[2][0][1], l[2][0][0]))
+    for i in range(len(lines) - 1):
+        for j in range(i, -1, -1):
+            a, b = lines[j], lines[j + 1]
+            if abs(b[2][0][1] - a[2][0][1]) < 10 and b[2][0][0] < a[2][0][0]:
+                lines[j], lines[j + 1] = b, a
+            else:
+                break
+    return lines
+
+def page_lines(pdf_path, page_numbers, dpi):
+    """
+    Строки текстового слоя для страниц page_numbers (нумерация с 1).
+    Возвращает {номер: PageResult} только для страниц, которые прошли is_digital
+    (с учётом площади картинок и строк слоя).
+    """
+    if fitz is None or not page_numbers:
+        return {}
+    scale = dpi / 72.0
+    found = {}
+    with fitz.open(pdf_path) as doc:
+        for page_idx in page_numbers:
+            if not 1 <= page_idx <= doc.page_count:
+                continue
+            lines, image_cover, text_cover = _page_layer(doc[page_idx - 1], scale)
+            if lines and is_digital(lines, image_cover, text_cover):
+                found[page_idx] = PageResult.from_lines(lines)
+    return found
@@ -0,0 +1,177 @@
+# triage.py — сортировка страниц перед OCR
+"""
+Дешёвый анализ растра страницы до детекции и распознавания:
+
+  * пустые и почти пустые страницы (доля "чернил" меньше BLANK_INK) в OCR
+    не идут — в результат уходит пустая страница;
+  * по горизонтальной проекции оценивается высота строк текста в пикселях и
+    выбирается наименьший DPI из DPIS, при котором строка не ниже
+    TARGET_TEXT_PX (чистые печатные договоры хватает 200 DPI);
+  * если средний confidence страницы, распознанной ниже полного DPI, меньше
+    MIN_CONF, страница растеризуется заново в полном DPI и распознаётся ещё
+    раз; остаётся результат с большим средним confidence.
+
+По умолчанию выключено (ENABLED = False); включается флагом --triage у
+prod.py (оба режима) и service.py (там без повтора: загруженный файл
+удаляется сразу после растеризации). Процессы-воркеры получают настройки
+через configure(*settings()), как и metrics. Ключ кэша OCR при включённом
+triage другой (signature), так что результаты двух режимов не смешиваются.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+ENABLED = False
+DPIS = (200, 300)        # допустимые DPI; полный DPI (prod.DPI) добавляется всегда
+BLANK_INK = 0.002        # доля тёмных пикселей, ниже которой страница пустая
+TARGET_TEXT_PX = 24      # минимальная высота строки текста в пикселях
+MIN_CONF = 0.85          # средний confidence, ниже которого — повтор в полном DPI
+MARGIN = 0.04            # доля полей, которые не смотрим (тени и края скана)
+MIN_INK_LEVEL = 40       # порог "чернил" ниже — фон слишком тёмный, контраст не оценить
+
+Decision = namedtuple("Decision", "blank ink text_px dpi")
+
+def configure(enabled=True, dpis=None, min_conf=None):
+    global ENABLED, DPIS, MIN_CONF
+    ENABLED = bool(enabled)
+    if dpis:
+        DPIS = tuple(sorted(int(d) for d in dpis))
+    if min_conf is not None:
+        MIN_CONF = float(min_conf)
+
+def settings():
+    """Аргументы для configure() в дочернем процессе."""
+    return ENABLED, DPIS, MIN_CONF
+
+def dpi_ladder(full_dpi):
+    """DPI по возрастанию, не выше полного; полный — последний."""
+    return tuple(sorted({d for d in DPIS if d < full_dpi} | {full_dpi}))
+
+def signature(full_dpi):
+    """Что влияет на результат страницы — для ключа кэша OCR вместо DPI."""
+    if not ENABLED:
+        return full_dpi
+    ladder = "-".join(str(d) for d in dpi_ladder(full_dpi))
+    return f"triage:{ladder}:{BLANK_INK}:{TARGET_TEXT_PX}:{MIN_CONF}"
+
+# ---------- Анализ растра ----------
+def ink_mask(page):
+    """
+    PIL.Image -> булева маска тёмных пикселей без полей или None, если фон
+    слишком тёмный (тёмная подложка, светлый текст) и тёмное от фона не отделить.
+    """
+    gray = np.asarray(page.convert("L"))
+    h, w = gray.shape
+    dy, dx = int(h * MARGIN), int(w * MARGIN)
+    gray = gray[dy:h - dy, dx:w - dx]
+    # порог от фона: серые и желтоватые сканы тоже дают белый фон ~ медиане
+    level = min(160, int(np.median(gray[::4, ::4])) - 60)
+    if level < MIN_INK_LEVEL:
+        return None
+    return gray < level
+
+def text_height(mask):
+    """Медианная высота строк текста (пикселей) по горизонтальной проекции или None."""
+    rows = mask.sum(axis=1) > max(2, mask.shape[1] // 500)
+    if not rows.any():
+        return None
+    # границы отрезков подряд идущих строк с чернилами
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.view(np.int8), [0]))))
+    runs = edges[1::2] - edges[::2]
+    runs = runs[runs >= 3]  # линейки и грязь — не строки
+    if not len(runs):
+        return None
+    return float(np.median(runs))
+
+def assess(page, dpi, full_dpi):
+    """Решение по странице, растеризованной в dpi: пустая ли и в каком DPI распознавать."""
+    mask = ink_mask(page)
+    if mask is None:
+        # контраст не оценить — не рискуем, распознаём в полном DPI
+        return Decision(False, None, None, full_dpi)
+    ink = float(mask.mean()) if mask.size else 0.0
+    if ink < BLANK_INK:
+        return Decision(True, ink, None, dpi)
+    text_px = text_height(mask)
+    if text_px is None:
+        # нет строчной структуры (фото, схема) — не рискуем
+        return Decision(False, ink, None, full_dpi)
+    for d in dpi_ladder(full_dpi):
+        if d >= dpi and text_px * d / dpi >= TARGET_TEXT_PX:
+            return Decision(False, ink, text_px, d)
+    return Decision(False, ink, text_px, full_dpi)
+
+# ---------- Повтор при низком confidence ----------
+def mean_conf(lines):
+    if hasattr(lines, "mean_conf"):  # ocr_result.PageResult
+        return lines.mean_conf()
+    scores = [s for _, s, *_ in lines or [] if s is not None]
+    return sum(scores) / len(scores) if scores else None
+
+def needs_retry(lines, dpi, full_dpi):
+    if dpi >= full_dpi:
+        return False
+    conf = mean_conf(lines)
+    # непустая страница без строк в пониженном DPI — тоже повод посмотреть ещё раз
+    return conf is None or conf < MIN_CONF
+
+def better(lines, retry_lines):
+    """Из двух распознаваний оставляет то, у которого средний confidence выше."""
+    old, new = mean_conf(lines), mean_conf(retry_lines)
+    if new is None:
+        return lines
+    if old is None or new >= old:
+        return retry_lines
+    return lines
+
+# ---------- Учёт ----------
+class TriageStats:
+    """Решения по страницам и оценка сэкономленного времени; складывается из воркеров через merge()."""
+    FIELDS = ("pages", "blank", "retries", "retry_kept", "triage_sec", "raster_sec", "ocr_sec",
+              "ocr_pages", "raster_saved_sec", "extra_sec", "retry_sec")
+
+    def __init__(self, full_dpi):
+        self.full_dpi = full_dpi
+        self.data = dict.fromkeys(self.FIELDS, 0)
+        self.by_dpi = {}
+
+    def add(self, key, value=1):
+        self.data[key] += value
+
+    def page(self, decision, raster_sec, raster_dpi):
+        """Учёт решения; raster_sec — время растеризации в raster_dpi."""
+        self.data["pages"] += 1
+        self.data["raster_sec"] += raster_sec
+        # растеризация растёт примерно как квадрат DPI; повторная растеризация
+        # в большем DPI учитывается отдельно в extra_sec
+        self.data["raster_saved_sec"] += raster_sec * ((self.full_dpi / raster_dpi) ** 2 - 1)
+        if decision.blank:
+            self.data["blank"] += 1
+        else:
+            self.by_dpi[decision.dpi] = self.by_dpi.get(decision.dpi, 0) + 1
+
+    def snapshot(self):
+        return {"data": dict(self.data), "by_dpi": dict(self.by_dpi)}
+
+    def merge(self, snap):
+        for k, v in snap["data"].items():
+            self.data[k] += v
+        for d, n in snap["by_dpi"].items():
+            self.by_dpi[d] = self.by_dpi.get(d, 0) + n
+
+    def saved_sec(self):
+        """Оценка: пустые страницы по среднему OCR страницы + меньший растр − повторы и анализ."""
+        d = self.data
+        # повторы выполняются внутри замера OCR — из среднего их убираем
+        avg_ocr = max(0.0, d["ocr_sec"] - d["retry_sec"]) / d["ocr_pages"] if d["ocr_pages"] else 0.0
+        return (d["blank"] * avg_ocr + d["raster_saved_sec"]
+                - d["extra_sec"] - d["retry_sec"] - d["triage_sec"])
+
+    def print_summary(self, label):
+        d = self.data
+        if not d["pages"]:
+            return
+        dpis = ", ".join(f"{dpi} DPI: {n}" for dpi, n in sorted(self.by_dpi.items()))
+        print(f"[TRIAGE] {label}: страниц {d['pages']}, пустых {d['blank']}"
+              f"{', ' + dpis if dpis else ''}; повторов в {self.full_dpi} DPI: {d['retries']} "
+              f"(оставлено {d['retry_kept']}); сэкономлено ~{self.saved_sec():.2f} с (оценка)")